@@ -0,0 +1 @@
+default_app_config = 'calls.core.apps.CoreConfig'
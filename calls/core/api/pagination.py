@@ -0,0 +1,135 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Pages read with a WHERE on the ordering fields from an opaque cursor instead of an OFFSET, so any page takes
+    the same time to read.
+
+    The cursor holds the values of all the ordering fields of the last (or first) record of a page, and the next
+    page starts after them with a row comparison, e.g. WHERE (timestamp, id) > (%s, %s). The last ordering field
+    must be unique (e.g. id), so records with the same values of the other fields are never skipped nor repeated.
+    """
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        assert len({order.startswith('-') for order in self.ordering}) == 1, (
+            'Keyset pagination compares the ordering fields as a row: they must be in the same direction.'
+        )
+
+        self.cursor = self.decode_cursor(request)
+        reverse, position = (False, None) if self.cursor is None else (self.cursor.reverse, self.cursor.position)
+
+        if reverse:
+            queryset = queryset.order_by(*[order[1:] if order.startswith('-') else f'-{order}'
+                                           for order in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if position is not None:
+            queryset = self.filter_after(queryset, position, descending=reverse != self.ordering[0].startswith('-'))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+
+        if reverse:
+            self.page.reverse()
+
+        # A page is followed by the records after its last one and preceded by the records before its first one
+        self.has_next = has_following if not reverse else position is not None
+        self.has_previous = has_following if reverse else position is not None
+        self.next_position = self.get_position(self.page[-1]) if self.page else position
+        self.previous_position = self.get_position(self.page[0]) if self.page else position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def filter_after(self, queryset, position, descending):
+        """
+        Filters the records after the position, in the order of the query
+        """
+        model = queryset.model
+        quote = connection.ops.quote_name
+        fields = [model._meta.get_field(order.lstrip('-')) for order in self.ordering]
+
+        try:
+            values = [field.get_db_prep_value(field.to_python(value), connection) for field, value in
+                      zip(fields, position)]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+        columns = ', '.join(f'{quote(model._meta.db_table)}.{quote(field.column)}' for field in fields)
+        placeholders = ', '.join(['%s'] * len(values))
+        operator = '<' if descending else '>'
+
+        return queryset.extra(where=[f'({columns}) {operator} ({placeholders})'], params=values)
+
+    def get_position(self, instance):
+        return [str(getattr(instance, order.lstrip('-'))) for order in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = tokens.get('p')
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if position is not None and len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        if cursor.position is not None:
+            tokens['p'] = cursor.position
+
+        encoded = b64encode(parse.urlencode(tokens, doseq=True).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class CallDetailCursorPagination(KeysetPagination):
+    ordering = ('timestamp', 'id')
+
+
+class CallCursorPagination(KeysetPagination):
+    ordering = 'id'
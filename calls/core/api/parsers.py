@@ -0,0 +1,26 @@
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from calls.core.api.renderers import ORJSONRenderer
+
+
+class ORJSONParser(JSONParser):
+    """
+    Parses JSON with orjson, several times faster than json.load. NaN and Infinity are rejected, as by
+    JSONParser in strict mode. Bodies not encoded in UTF-8 are parsed by JSONParser.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
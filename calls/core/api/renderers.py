@@ -0,0 +1,27 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Renders JSON with orjson, several times faster than json.dumps, with the same output of JSONRenderer:
+    dates, times, Decimal and the other types orjson does not render as DRF does are rendered by the DRF encoder.
+    Indented JSON (e.g. in the browsable API) is rendered by JSONRenderer.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None \
+                or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+
+        # Escaped as by JSONRenderer, so the JSON is a strict JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+        return ret
@@ -1,8 +1,15 @@
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from rest_framework.validators import UniqueTogetherValidator
 
+from calls.core.models.bill import BillLine
 from calls.core.models.call import CallDetail, Call
 from calls.core.models.pricing_rule import PricingRule
+from calls.core.util.helpers import format_duration
 
 
 class CallDetailSerializer(serializers.HyperlinkedModelSerializer):
@@ -52,6 +59,146 @@ class CallDetailSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
+# Precompiled checks of CallDetailBulkSerializer.parse(), stricter than the serializer fields: the records
+# they do not accept are validated by the serializer.
+TIMESTAMP_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?(?:(Z)|([+-])(\d{2}):(\d{2}))?'
+)
+# phone_number_validator with the length of the source and destination fields
+PHONE_NUMBER_RE = re.compile(r'[0-9]{10,11}')
+CALL_ID_RE = re.compile(r'[0-9]{1,10}')
+MAX_CALL_ID = 2147483647
+
+
+def parse_timestamp(value):
+    """
+    Returns the aware datetime of an ISO 8601 timestamp, as the serializer does, or None
+    """
+    match = TIMESTAMP_RE.fullmatch(value)
+    if not match:
+        return None
+
+    year, month, day, hour, minute, second, fraction, utc, sign, offset_hours, offset_minutes = match.groups()
+
+    try:
+        parsed = datetime(
+            int(year), int(month), int(day), int(hour), int(minute), int(second),
+            int(fraction.ljust(6, '0')) if fraction else 0,
+        )
+
+        if sign:
+            # Offsets of 24 hours or more are rejected
+            offset = timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+            tzinfo = dt_timezone(-offset if sign == '-' else offset)
+    except ValueError:
+        return None
+
+    if utc:
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    elif sign:
+        parsed = parsed.replace(tzinfo=tzinfo)
+    else:
+        return timezone.make_aware(parsed, timezone.get_current_timezone())
+
+    return parsed.astimezone(timezone.get_current_timezone())
+
+
+def is_phone_number(value):
+    """
+    Checks a source or destination accepted as it is by the serializer (blank or null allowed)
+    """
+    return value is None or value == '' or (isinstance(value, str) and PHONE_NUMBER_RE.fullmatch(value) is not None)
+
+
+class CallDetailBulkSerializer(CallDetailSerializer):
+    """
+    Validates each record of a bulk request. The uniqueness of type and call id is checked
+    by CallDetail.bulk_save() for the whole batch at once.
+    """
+
+    class Meta(CallDetailSerializer.Meta):
+        validators = []
+
+    @classmethod
+    def parse(cls, record):
+        """
+        Validates a record with the rules of the serializer. Returns a CallDetail and None, or None and the
+        errors of the serializer.
+        Well-formed records are checked by precompiled patterns and turned into a CallDetail directly, much
+        faster than by the serializer fields. Any other record is validated by the serializer, so the errors
+        are the same.
+        """
+        call_detail = cls.parse_well_formed(record) if type(record) is dict else None
+        if call_detail:
+            return call_detail, None
+
+        serializer = cls(data=record)
+        if serializer.is_valid():
+            return CallDetail(**serializer.validated_data), None
+
+        return None, serializer.errors
+
+    @staticmethod
+    def parse_well_formed(record):
+        """
+        Returns the CallDetail of a record accepted as it is by the serializer, None for any other record
+        """
+        record_type = record.get('type')
+        source = record.get('source')
+        destination = record.get('destination')
+        call_id = record.get('call_id')
+        timestamp = record.get('timestamp')
+
+        if record_type == CallDetail.START:
+            if 'source' not in record or 'destination' not in record or source == destination:
+                return None
+        elif record_type == CallDetail.END:
+            if source or destination:
+                return None
+        else:
+            return None
+
+        if not is_phone_number(source) or not is_phone_number(destination):
+            return None
+
+        if type(call_id) is str and CALL_ID_RE.fullmatch(call_id):
+            call_id = int(call_id)
+        if type(call_id) is not int or not 0 <= call_id <= MAX_CALL_ID:
+            return None
+
+        timestamp = parse_timestamp(timestamp) if type(timestamp) is str else None
+        if timestamp is None:
+            return None
+
+        return CallDetail(type=record_type, timestamp=timestamp, call_id=call_id, source=source,
+                          destination=destination)
+
+    @classmethod
+    def save_records(cls, records, insert=None):
+        """
+        Validates the records and saves the valid ones with CallDetail.bulk_save().
+        Returns the number of saved records and the errors of the rejected ones by their position.
+        """
+        call_details = []
+        positions = []
+        errors = {}
+
+        for position, record in enumerate(records):
+            call_detail, record_errors = cls.parse(record)
+            if call_detail:
+                call_details.append(call_detail)
+                positions.append(position)
+            else:
+                errors[position] = record_errors
+
+        saved, rejected = CallDetail.bulk_save(call_details, insert)
+
+        for idx, msg in rejected.items():
+            errors[positions[idx]] = {api_settings.NON_FIELD_ERRORS_KEY: [msg]}
+
+        return len(saved), errors
+
+
 class CallSerializer(serializers.HyperlinkedModelSerializer):
     id = serializers.ReadOnlyField()
 
@@ -69,25 +216,40 @@ class CallSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class BillSerializer(serializers.ModelSerializer):
-    destination = serializers.SerializerMethodField()
-    start_date = serializers.SerializerMethodField()
-    start_time = serializers.SerializerMethodField()
+    """
+    Calls of a bill, annotated with start_date, start_time and call_duration by the query.
+    """
+    start_date = serializers.DateField(read_only=True)
+    start_time = serializers.TimeField(read_only=True)
     duration = serializers.SerializerMethodField()
 
-    def get_destination(self, obj):
-        return obj.detail_start.destination
+    def get_duration(self, obj):
+        return format_duration(obj.call_duration)
+
+    class Meta:
+        model = Call
+        fields = [
+            "destination",
+            "start_date",
+            "start_time",
+            "duration",
+            "price"
+        ]
+
+
+class BillLineSerializer(serializers.ModelSerializer):
+    start_date = serializers.SerializerMethodField()
+    start_time = serializers.SerializerMethodField()
+    duration = serializers.ReadOnlyField(source='duration_display')
 
     def get_start_date(self, obj):
-        return obj.detail_start.timestamp.date()
+        return obj.started_at.date()
 
     def get_start_time(self, obj):
-        return obj.detail_start.timestamp.time()
-
-    def get_duration(self, obj):
-        return obj.duration
+        return obj.started_at.time()
 
     class Meta:
-        model = Call
+        model = BillLine
         fields = [
             "destination",
             "start_date",
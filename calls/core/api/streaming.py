@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from calls.core.util.db import chunked
+from calls.core.util.helpers import is_true
+
+
+def stream_requested(request):
+    return is_true(request.query_params.get('stream', ''))
+
+
+def stream_json(renderer, objects, serialize, envelope=None, key=None):
+    """
+    Yields the JSON of a list of objects, or of the envelope dict with the list in its key, serializing and
+    rendering the objects by chunks of API_STREAM_CHUNK_SIZE. Only a chunk is in memory at a time.
+    """
+    if envelope is None:
+        yield b'['
+    else:
+        yield renderer.render(envelope)[:-1] + (b',' if envelope else b'') + renderer.render(key) + b':['
+
+    separator = b''
+    for chunk in chunked(objects, settings.API_STREAM_CHUNK_SIZE):
+        # The items of the rendered list, without its brackets
+        yield separator + renderer.render(serialize(chunk))[1:-1]
+        separator = b','
+
+    yield b']' if envelope is None else b']}'
+
+
+def streaming_response(view, queryset, serialize, envelope=None, key=None):
+    """
+    Returns a response streaming the JSON of the queryset, read by chunks from the database
+    """
+    renderer = next(renderer_class() for renderer_class in view.renderer_classes if renderer_class.format == 'json')
+    objects = queryset.iterator(chunk_size=settings.API_STREAM_CHUNK_SIZE)
+
+    return StreamingHttpResponse(
+        stream_json(renderer, objects, serialize, envelope, key),
+        content_type=renderer.media_type,
+    )
+
+
+class StreamingListMixin:
+    """
+    Lists all the objects with ?stream=true, as a JSON array streamed while read from the database, instead of
+    a page. The objects are in the order of the pagination.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not stream_requested(request):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        ordering = getattr(self.pagination_class, 'ordering', None)
+        if ordering:
+            queryset = queryset.order_by(*((ordering,) if isinstance(ordering, str) else ordering))
+
+        return streaming_response(self, queryset, lambda chunk: self.get_serializer(chunk, many=True).data)
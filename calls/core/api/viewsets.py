@@ -1,14 +1,38 @@
+import hashlib
+import json
 from datetime import datetime
+from itertools import groupby
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import DurationField, ExpressionWrapper, F
+from django.db.models.functions import TruncDate, TruncTime
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
 
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.settings import api_settings
 
 from calls.api_version import API_Version
+from calls.core import response_cache
+from calls.core.export import FORMATS, export_bills, pyarrow_installed
+from calls.core.models.bill import Bill, BillLine
 from calls.core.models.call import CallDetail, Call
+from calls.core.models.call_archive import CallArchive
+from calls.core.models.idempotency_key import IdempotencyKey
 from calls.core.models.pricing_rule import PricingRule
-from calls.core.api.serializers import CallDetailSerializer, BillSerializer, CallSerializer, PricingRuleSerializer
-from calls.core.util.helpers import current_month_year, last_month_year, valid_phone_number
+from calls.core.api.pagination import CallCursorPagination, CallDetailCursorPagination
+from calls.core.api.streaming import StreamingListMixin, stream_requested, streaming_response
+from calls.core.api.serializers import CallDetailSerializer, CallDetailBulkSerializer, BillSerializer, \
+    BillLineSerializer, CallSerializer, PricingRuleSerializer
+from calls.core.util.helpers import billing_period, current_month_year, is_true, last_month_year, \
+    valid_phone_number
+from calls.core.util.db import chunked
 
 
 class ApiVersion(viewsets.ViewSet):
@@ -17,16 +41,188 @@ class ApiVersion(viewsets.ViewSet):
         return Response({'API_Version': API_Version})
 
 
-class CallDetailViewSet(viewsets.ModelViewSet):
+class CallDetailViewSet(StreamingListMixin, viewsets.ModelViewSet):
 
     queryset = CallDetail.objects.all()
     serializer_class = CallDetailSerializer
+    pagination_class = CallDetailCursorPagination
+
+    def create(self, request, *args, **kwargs):
+        return self.idempotent(request, self.create_record)
+
+    def create_record(self, request):
+        """
+        Creates a record. A record sent again (same type, call id and fields, e.g. a client retrying after a
+        timeout) is not saved again: the response of the first request is returned.
+        """
+        # The uniqueness of type and call id is checked below, with the lookup of the record sent before
+        serializer = CallDetailBulkSerializer(data=request.data, context=self.get_serializer_context())
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        existing = CallDetail.objects.filter(
+            type=serializer.validated_data['type'], call_id=serializer.validated_data['call_id']
+        ).first()
+
+        if existing and existing.matches(serializer.validated_data):
+            data = CallDetailSerializer(existing, context=self.get_serializer_context()).data
+            return Response(data, status=self.created_status(), headers={'Idempotent-Replayed': 'true'})
+
+        if existing:
+            msg = "A detail record with this type and call id has already been sent. Delete it before resend it."
+            return Response({api_settings.NON_FIELD_ERRORS_KEY: [msg]}, status=status.HTTP_400_BAD_REQUEST)
+
+        self.perform_create(serializer)
+
+        return Response(serializer.data, status=self.created_status(), headers=self.get_success_headers(serializer.data))
+
+    def created_status(self):
+        # In async pairing mode the record is saved, but paired with its call later by run_pricing_worker
+        return status.HTTP_202_ACCEPTED if settings.CALL_PAIRING_ASYNC else status.HTTP_201_CREATED
+
+    def idempotent(self, request, create):
+        """
+        Returns the response of create(request) or, when a request with the same Idempotency-Key header was
+        already answered, its response.
+        """
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+
+        if not key:
+            return create(request)
+
+        if len(key) > 255:
+            msg = "The Idempotency-Key header must have up to 255 characters"
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+
+        request_hash = IdempotencyKey.hash_request(request.path, request.data)
+        stored = IdempotencyKey.lookup(key)
 
+        if stored and stored.request_hash != request_hash:
+            msg = "This Idempotency-Key was already sent with another request"
+            return Response(msg, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-class CallViewSet(viewsets.ReadOnlyModelViewSet):
+        if stored:
+            return Response(stored.data, status=stored.status_code, headers={'Idempotent-Replayed': 'true'})
+
+        response = create(request)
+
+        if response.status_code < 500:
+            IdempotencyKey.store(key, request_hash, response.status_code, response.data)
+
+        return response
+
+    def perform_create(self, serializer):
+        self.save_record(serializer)
+
+    def perform_update(self, serializer):
+        self.save_record(serializer)
+
+    def save_record(self, serializer):
+        """
+        Saves a record checked by the serializer. A concurrent request may save a record with the same type and
+        call id after the check: the unique constraint rejects it.
+        """
+        try:
+            serializer.save()
+        except IntegrityError:
+            msg = "A detail record with this type and call id has already been sent. Delete it before resend it."
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [msg]})
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates many call detail records at once.
+        Valid records are saved, the rejected ones are reported by their position in the list.
+        NDJSON bodies (application/x-ndjson) are read and saved in chunks, streaming back one result per line.
+        """
+        if request.content_type.startswith('application/x-ndjson'):
+            # Django reads no body without a Content-Length (e.g. Transfer-Encoding: chunked): its records would
+            # be dropped
+            if not request.META.get('CONTENT_LENGTH'):
+                msg = "Send the Content-Length of the NDJSON body. Chunked bodies are not supported"
+                return Response(msg, status=status.HTTP_411_LENGTH_REQUIRED)
+
+            return StreamingHttpResponse(self.stream_bulk(request.stream), content_type='application/x-ndjson')
+
+        return self.idempotent(request, self.create_records)
+
+    def create_records(self, request):
+        if not isinstance(request.data, list):
+            msg = "Send a list of call detail records"
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+
+        saved, errors = CallDetailBulkSerializer.save_records(request.data)
+
+        data = {
+            'created': saved,
+            'errors': [{'index': position, 'errors': errors[position]} for position in sorted(errors)],
+        }
+
+        if not errors:
+            response_status = self.created_status()
+        elif saved:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response(data, status=response_status)
+
+    def stream_bulk(self, stream):
+        """
+        Reads NDJSON call detail records from the request stream, saving them in chunks of
+        CALL_DETAIL_BULK_CHUNK_SIZE records. Yields the result of each line as a NDJSON line.
+        """
+        lines = ((number, line) for number, line in enumerate(stream or [], 1) if line.strip())
+
+        for chunk in chunked(lines, settings.CALL_DETAIL_BULK_CHUNK_SIZE):
+            numbers = []
+            records = []
+            errors = {}
+
+            for number, line in chunk:
+                try:
+                    records.append(json.loads(line))
+                    numbers.append(number)
+                except ValueError:
+                    errors[number] = {api_settings.NON_FIELD_ERRORS_KEY: ["Invalid JSON record."]}
+
+            _saved, rejected = CallDetailBulkSerializer.save_records(records)
+
+            for idx, record_errors in rejected.items():
+                errors[numbers[idx]] = record_errors
+
+            for number, _line in chunk:
+                if number in errors:
+                    result = {'line': number, 'status': 'rejected', 'errors': errors[number]}
+                else:
+                    result = {'line': number, 'status': 'created'}
+
+                yield json.dumps(result) + '\n'
+
+
+class CallViewSet(StreamingListMixin, viewsets.ReadOnlyModelViewSet):
 
     queryset = Call.objects.all()
     serializer_class = CallSerializer
+    pagination_class = CallCursorPagination
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            call_id = int(kwargs['pk'])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+
+        # The links of the response are absolute: it is cached by host
+        key = response_cache.call_key(call_id, request.build_absolute_uri('/'))
+        data = response_cache.lookup(key)
+
+        if data is None:
+            response = super().retrieve(request, *args, **kwargs)
+            response_cache.store(key, response.data)
+            return response
+
+        return Response(data)
 
 
 class BillViewSet(viewsets.ViewSet):
@@ -43,47 +239,320 @@ class BillViewSet(viewsets.ViewSet):
             msg = "Invalid subscriber. Length of 10 to 11 characters, only digits"
             return Response(msg, status=status.HTTP_400_BAD_REQUEST)
 
-        queryset = Call.objects.filter(detail_start__source=subscriber)
+        month_year, msg = self.closed_period(period)
 
-        if period is not None:
-            try:
-                month_year = datetime.strptime(period, '%m/%Y')
-                filter_period = {
-                    'detail_end__timestamp__year': month_year.year,
-                    'detail_end__timestamp__month': month_year.month
-                }
+        if msg:
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
 
-            except ValueError as error:
-                msg = 'Invalid format for the period. Enter the month and year in MM/YYYY format'
-                return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+        if period is None:
+            # Period is not informed. Get the previous month.
+            period = month_year.strftime("%m/%Y")
 
-            if month_year >= current_month_year():
-                msg = "You can only get bills which period are already closed"
-                return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+        summary_only = is_true(request.GET.get('summary_only', ''))
+        stream = stream_requested(request)
 
+        # Bills are cached with the fingerprint of their calls until the calls change. Streamed bills are not.
+        key = None if stream else response_cache.bill_key(subscriber, billing_period(month_year), period, summary_only)
+        cached = response_cache.lookup(key) if key else None
+
+        archived = None
+
+        if cached:
+            data, call_count, updated_at = cached
         else:
-            # Period is not informed. Get the previous month.
-            last_month = last_month_year()
-            period = last_month.strftime("%m/%Y")
-            filter_period = {
-                'detail_end__timestamp__year': last_month.year,
-                'detail_end__timestamp__month': last_month.month
+            # Bills of closed periods only change with their calls: a client with the current version of the bill
+            # gets a 304 Not Modified, checked by the queries of the calls and of the archive of the period
+            call_count, updated_at = Bill.fingerprint(billing_period(month_year), subscriber)
+            archived = self.archived_calls(billing_period(month_year), subscriber, call_count)
+
+            if archived:
+                call_count = len(archived)
+                updated_at = max(call.updated_at for call in archived)
+
+        # No Last-Modified: removing a call from the bill or changing the pricing rules changes the bill, but not
+        # when its calls were last changed
+        etag = self.bill_etag(request, subscriber, period, summary_only, call_count, updated_at)
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified:
+            return self.cache_headers(not_modified, etag)
+
+        if cached:
+            return self.cache_headers(Response(data, status=status.HTTP_200_OK), etag)
+
+        if archived:
+            summary = Bill.summary_of_calls(archived)
+        else:
+            summary = Bill.summaries(billing_period(month_year), [subscriber])[subscriber]
+
+        if summary_only:
+            data = {'subscriber': subscriber, 'period': period, 'summary': summary}
+            response_cache.store(key, (data, call_count, updated_at))
+            return self.cache_headers(Response(data, status=status.HTTP_200_OK), etag)
+
+        if archived:
+            data = {
+                'subscriber': subscriber,
+                'period': period,
+                'summary': summary,
+                'calls': BillSerializer(archived, context={'request': request}, many=True).data,
             }
+            response_cache.store(key, (data, call_count, updated_at))
+            return self.cache_headers(Response(data, status=status.HTTP_200_OK), etag)
+
+        # Bill materialized when the period was closed, if it was built from its calls as they are now
+        lines = BillLine.objects.filter(
+            bill__in=Bill.current(billing_period(month_year), [subscriber])
+        ).order_by('id')
 
-        queryset = queryset.filter(**filter_period)
+        # Streamed bills are read by chunks: the lines are not loaded to check if there are any
+        if lines.exists() if stream else lines:
+            queryset = lines
+            serializer_class = BillLineSerializer
+
+        else:
+            queryset = self.bill_calls(billing_period(month_year)).filter(source=subscriber).order_by('id')
+            serializer_class = BillSerializer
 
-        serializer = BillSerializer(queryset, context={'request': request}, many=True)
+        if stream:
+            response = streaming_response(
+                self,
+                queryset,
+                lambda chunk: serializer_class(chunk, context={'request': request}, many=True).data,
+                envelope={'subscriber': subscriber, 'period': period, 'summary': summary},
+                key='calls',
+            )
+            return self.cache_headers(response, etag)
 
         data = {
             'subscriber': subscriber,
             'period': period,
-            'calls': serializer.data,
+            'summary': summary,
+            'calls': serializer_class(queryset, context={'request': request}, many=True).data,
+        }
+        response_cache.store(key, (data, call_count, updated_at))
+
+        return self.cache_headers(Response(data, status=status.HTTP_200_OK), etag)
+
+    def archived_calls(self, period, subscriber, call_count):
+        """
+        Returns the calls of the bill of a subscriber read from the archive of the period, merged with its
+        call_count calls still in the database, None if none of its calls is archived
+        """
+        call_archive = CallArchive.of_period(period)
+        archived = call_archive.subscriber_calls(subscriber) if call_archive else None
+
+        if archived and call_count:
+            calls = self.bill_calls(period).filter(source=subscriber).order_by('id')
+            archived = list(CallArchive.merge(archived, calls))
+
+        return archived
+
+    @staticmethod
+    def bill_etag(request, subscriber, period, summary_only, call_count, updated_at):
+        """
+        Returns a strong ETag of a bill response, from the fingerprint of the calls of the bill and the options
+        of the response
+        """
+        content = json.dumps([
+            subscriber,
+            period,
+            summary_only,
+            stream_requested(request),
+            request.accepted_renderer.format,
+            call_count,
+            updated_at.isoformat() if updated_at else None,
+        ])
+        return quote_etag(hashlib.sha1(content.encode()).hexdigest())
+
+    @staticmethod
+    def cache_headers(response, etag):
+        """
+        Sets the headers to cache a bill response by the client, revalidating it after BILL_CACHE_MAX_AGE
+        seconds. Shared caches (reverse proxies, CDNs) keep it too, but revalidate it with its ETag on every request,
+        by the credentials of the client: a bill is of a single subscriber.
+        """
+        response['ETag'] = etag
+
+        patch_cache_control(response, public=True, max_age=settings.BILL_CACHE_MAX_AGE, s_maxage=0,
+                            must_revalidate=True)
+        patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+
+        return response
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Returns the bills of many subscribers for a closed period, read by one query for the totals, one for the
+        archive of the period, one for the materialized bills and one for the others, by 500 subscribers
+        """
+        data = request.data if isinstance(request.data, dict) else {}
+        subscribers = data.get('subscribers', None)
+        period = data.get('period', None)
+
+        if not isinstance(subscribers, list) or not subscribers:
+            msg = "Use the subscribers field to inform a list of subscribers' phone numbers"
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(subscribers) > settings.BILL_BATCH_MAX_SUBSCRIBERS:
+            msg = f"Inform up to {settings.BILL_BATCH_MAX_SUBSCRIBERS} subscribers"
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+
+        invalid = [
+            str(subscriber) for subscriber in subscribers
+            if not isinstance(subscriber, str) or not valid_phone_number(subscriber)
+        ]
+
+        if invalid:
+            msg = f"Invalid subscribers: {', '.join(invalid)}. Length of 10 to 11 characters, only digits"
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+
+        month_year, msg = self.closed_period(period)
+
+        if msg:
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+
+        if period is None:
+            period = month_year.strftime("%m/%Y")
+
+        # In the order informed, without repetitions
+        subscribers = list(dict.fromkeys(subscribers))
+        summaries = Bill.summaries(billing_period(month_year), subscribers)
+
+        # Calls of the archive of the period, merged with the calls of the same subscribers still in the database
+        archived = {}
+        call_archive = CallArchive.of_period(billing_period(month_year))
+
+        if call_archive:
+            archived = call_archive.subscribers_calls(subscribers)
+
+            in_database = [subscriber for subscriber in archived if summaries[subscriber]['call_count']]
+            for chunk in chunked(in_database, 500):
+                calls = self.bill_calls(billing_period(month_year)).filter(source__in=chunk)
+                for subscriber, subscriber_calls in groupby(calls.order_by('source', 'id'),
+                                                            key=lambda call: call.source):
+                    archived[subscriber] = list(CallArchive.merge(archived[subscriber], subscriber_calls))
+
+            for subscriber, subscriber_calls in archived.items():
+                summaries[subscriber] = Bill.summary_of_calls(subscriber_calls)
+
+        if is_true(data.get('summary_only', False)):
+            bills = [
+                {'subscriber': subscriber, 'period': period, 'summary': summaries[subscriber]}
+                for subscriber in subscribers
+            ]
+            return Response({'period': period, 'bills': bills}, status=status.HTTP_200_OK)
+
+        calls = {subscriber: [] for subscriber in subscribers}
+
+        # The bills of the subscribers with archived calls were materialized without them
+        lines = [
+            line
+            for chunk in chunked([subscriber for subscriber in subscribers if subscriber not in archived], 500)
+            for line in BillLine.objects.filter(bill__in=Bill.current(billing_period(month_year), chunk))
+            .annotate(subscriber=F('bill__subscriber')).order_by('id')
+        ]
+
+        for line, line_data in zip(lines, BillLineSerializer(lines, many=True).data):
+            calls[line.subscriber].append(line_data)
+
+        for subscriber, archived_calls in archived.items():
+            calls[subscriber] = BillSerializer(archived_calls, context={'request': request}, many=True).data
+
+        materialized = {line.subscriber for line in lines}
+        not_materialized = [
+            subscriber for subscriber in subscribers if subscriber not in materialized and subscriber not in archived
+        ]
+
+        if not_materialized:
+            bill_calls = [
+                call
+                for chunk in chunked(not_materialized, 500)
+                for call in self.bill_calls(billing_period(month_year)).filter(source__in=chunk).order_by('id')
+            ]
+            serializer = BillSerializer(bill_calls, context={'request': request}, many=True)
+
+            for call, call_data in zip(bill_calls, serializer.data):
+                calls[call.source].append(call_data)
+
+        data = {
+            'period': period,
+            'bills': [
+                {
+                    'subscriber': subscriber,
+                    'period': period,
+                    'summary': summaries[subscriber],
+                    'calls': calls[subscriber],
+                }
+                for subscriber in subscribers
+            ],
         }
 
         return Response(data, status=status.HTTP_200_OK)
 
+    @staticmethod
+    def bill_calls(period):
+        """
+        Returns the calls of the bills of a period. The database computes the bill fields in the main query,
+        whatever the number of calls. Bills list their calls by id, as the materialized and archived bills.
+        """
+        return Call.objects.filter(billing_period=period).annotate(
+            start_date=TruncDate('started_at'),
+            start_time=TruncTime('started_at'),
+            call_duration=ExpressionWrapper(F('ended_at') - F('started_at'), output_field=DurationField()),
+        )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Streams a file with the bills of all the subscribers of a closed period (?output=csv, parquet or arrow)
+        """
+        file_format = request.GET.get('output', 'csv')
+
+        if file_format not in FORMATS:
+            msg = f"Invalid output. Choose one of: {', '.join(sorted(FORMATS))}"
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+
+        if file_format != 'csv' and not pyarrow_installed():
+            msg = f"The {file_format} output is not available"
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+
+        month_year, msg = self.closed_period(request.GET.get('period', None))
+
+        if msg:
+            return Response(msg, status=status.HTTP_400_BAD_REQUEST)
+
+        media_type, extension = FORMATS[file_format]
+        response = StreamingHttpResponse(
+            export_bills(billing_period(month_year), file_format, settings.API_STREAM_CHUNK_SIZE),
+            content_type=media_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="bills-{month_year.strftime("%Y-%m")}.{extension}"'
+
+        return response
+
+    @staticmethod
+    def closed_period(period):
+        """
+        Returns the month and year of a closed period in MM/YYYY format, or of the previous month if it is not
+        informed, and the error message of an invalid period
+        """
+        if period is None:
+            return last_month_year(), None
+
+        try:
+            month_year = datetime.strptime(period, '%m/%Y')
+
+        except (TypeError, ValueError):
+            return None, 'Invalid format for the period. Enter the month and year in MM/YYYY format'
+
+        if month_year >= current_month_year():
+            return None, "You can only get bills which period are already closed"
+
+        return month_year, None
+
 
-class PricingRuleViewSet(viewsets.ModelViewSet):
+class PricingRuleViewSet(StreamingListMixin, viewsets.ModelViewSet):
 
     queryset = PricingRule.objects.all()
     serializer_class = PricingRuleSerializer
@@ -2,4 +2,9 @@ from django.apps import AppConfig
 
 
 class CoreConfig(AppConfig):
-    name = 'core'
+    name = 'calls.core'
+    label = 'core'
+
+    def ready(self):
+        # Registers the system checks
+        from calls.core import checks  # noqa: F401
@@ -0,0 +1,142 @@
+"""
+Files of the calls archived by archive_calls: gzip-compressed NDJSON, a line by call with its call detail records,
+kept in a private storage (CALL_ARCHIVE_STORAGE: a directory of the server, or private S3 objects with USE_S3).
+
+The calls of each subscriber are written in a gzip member of their own (a gzip file can have many members), so the
+calls of a subscriber are read by decompressing just its member, found by its offset and length in the index file.
+"""
+import gzip
+import json
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import get_storage_class
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import LazyObject, empty
+
+
+CALL_FIELDS = ('id', 'source', 'destination', 'started_at', 'ended_at', 'billing_period', 'price', 'updated_at')
+CALL_DETAIL_FIELDS = ('id', 'type', 'timestamp', 'call_id', 'source', 'destination')
+
+
+class ArchiveStorage(LazyObject):
+    """
+    Storage of the archive files, from CALL_ARCHIVE_STORAGE
+    """
+
+    def _setup(self):
+        storage_class = get_storage_class(settings.CALL_ARCHIVE_STORAGE['BACKEND'])
+        self._wrapped = storage_class(**settings.CALL_ARCHIVE_STORAGE.get('OPTIONS', {}))
+
+
+storage = ArchiveStorage()
+
+
+@receiver(setting_changed)
+def reset_storage(setting, **_kwargs):
+    if setting == 'CALL_ARCHIVE_STORAGE':
+        storage._wrapped = empty
+
+
+def call_row(call):
+    """
+    Returns the line of a call (with its details loaded) in the archive
+    """
+    row = {field: getattr(call, field) for field in CALL_FIELDS}
+    row['details'] = [
+        {field: getattr(detail, field) for field in CALL_DETAIL_FIELDS}
+        for detail in (call.detail_start, call.detail_end) if detail is not None
+    ]
+    return row
+
+
+def parse_row(line):
+    """
+    Returns the fields of a call from its line in the archive, with their types
+    """
+    row = json.loads(line)
+
+    for field in ('started_at', 'ended_at', 'updated_at'):
+        row[field] = parse_datetime(row[field]) if row[field] else None
+
+    row['price'] = Decimal(row['price']) if row['price'] is not None else None
+
+    return row
+
+
+def write_member(file, rows):
+    """
+    Writes the rows of a subscriber as a gzip member at the end of a file. Returns the index entry of the member:
+    offset, length and number of calls.
+    """
+    offset = file.tell()
+
+    with gzip.GzipFile(fileobj=file, mode='wb', mtime=0) as member:
+        for row in rows:
+            # str() keeps the microseconds of the times
+            member.write(json.dumps(row, default=str).encode() + b'\n')
+
+    return [offset, file.tell() - offset, len(rows)]
+
+
+def read_member(file, entry):
+    """
+    Returns the compressed bytes of a member
+    """
+    offset, length, _count = entry
+    file.seek(offset)
+    return file.read(length)
+
+
+def member_rows(data):
+    return [parse_row(line) for line in gzip.decompress(data).splitlines()]
+
+
+def read_rows(name, entry):
+    """
+    Returns the calls of an index entry of an archive
+    """
+    with storage.open(name, 'rb') as file:
+        return member_rows(read_member(file, entry))
+
+
+def read_many_rows(name, entries):
+    """
+    Returns the calls of many index entries of an archive, by key, opening the file once
+    """
+    with storage.open(name, 'rb') as file:
+        # By offset, reading forward
+        return {
+            key: member_rows(read_member(file, entry))
+            for key, entry in sorted(entries.items(), key=lambda item: item[1][0])
+        }
+
+
+def iter_rows(name, index):
+    """
+    Yields the calls of all the subscribers of an archive, by subscriber, reading one member at a time
+    """
+    with storage.open(name, 'rb') as file:
+        for subscriber in sorted(index):
+            yield from member_rows(read_member(file, index[subscriber]))
+
+
+def save_index(name, index):
+    """
+    Saves an index (subscriber: [offset, length, calls]) compressed. Returns the name given by the storage.
+    """
+    return storage.save(name, ContentFile(gzip.compress(json.dumps(index).encode())))
+
+
+@lru_cache(maxsize=16)
+def load_index(name):
+    """
+    Returns an index. Archives are never changed, only replaced by files with other names, so the indexes read
+    are kept in memory.
+    """
+    with storage.open(name, 'rb') as file:
+        return json.loads(gzip.decompress(file.read()))
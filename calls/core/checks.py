@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+
+# Backends whose entries are only seen by the process that wrote them
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches)
+def response_cache_check(app_configs, **kwargs):
+    """
+    The invalidations of the response cache are written by the process changing the calls: a cache local to a
+    process serves stale responses from the others (web workers, run_pricing_worker, management commands).
+    Only a warning with DEBUG, for development on a single process.
+    """
+    cache = settings.CACHES.get(settings.RESPONSE_CACHE_ALIAS, {})
+
+    if cache.get('BACKEND') not in PROCESS_LOCAL_BACKENDS:
+        return []
+
+    msg = f"The '{settings.RESPONSE_CACHE_ALIAS}' cache ({cache['BACKEND']}) is local to each process, so the " \
+          f"responses cached by a process are not invalidated by the changes of the others."
+    hint = "Set RESPONSE_CACHE_BACKEND to a shared backend, e.g. Redis, Memcached or the database."
+
+    if settings.DEBUG:
+        return [Warning(msg, hint=hint, id='core.W001')]
+
+    return [Error(msg, hint=hint, id='core.E001')]
@@ -0,0 +1,110 @@
+import csv
+import importlib.util
+import io
+
+from calls.core.models.bill import Bill, EXPORT_FIELDS
+
+
+# Media type and file extension of each export format
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+
+class BufferSink(io.RawIOBase):
+    """
+    Write-only file keeping the bytes written until they are read by drain()
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.buffer.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        return data
+
+
+def pyarrow_installed():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_bills(period, file_format='csv', chunk_size=5000):
+    """
+    Yields the bytes of a file with the bills of all the subscribers of a period, written by chunks of
+    chunk_size rows as the calls are read. Parquet and Arrow files need pyarrow.
+    """
+    chunks = Bill.export_rows(period, chunk_size)
+
+    if file_format == 'csv':
+        return csv_chunks(chunks)
+
+    return arrow_chunks(chunks, parquet=file_format == 'parquet')
+
+
+def csv_chunks(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # The header of an empty export
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def arrow_chunks(chunks, parquet):
+    """
+    Yields a Parquet file (a row group by chunk) or an Arrow IPC file (a record batch by chunk)
+    """
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    schema = pyarrow.schema([
+        ('subscriber', pyarrow.string()),
+        ('period', pyarrow.string()),
+        ('row_type', pyarrow.string()),
+        ('destination', pyarrow.string()),
+        ('start_date', pyarrow.date32()),
+        ('start_time', pyarrow.time64('us')),
+        ('duration', pyarrow.string()),
+        ('price', pyarrow.decimal128(12, 2)),
+    ])
+
+    sink = BufferSink()
+    if parquet:
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pyarrow.ipc.new_file(sink, schema)
+
+    for rows in chunks:
+        columns = list(zip(*rows))
+        writer.write_batch(pyarrow.record_batch(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+        ))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
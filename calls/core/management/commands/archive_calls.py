@@ -0,0 +1,41 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calls.core.models.call import Call
+from calls.core.models.call_archive import CallArchive
+from calls.core.util.helpers import billing_period, current_month_year
+
+
+class Command(BaseCommand):
+    help = 'Moves the calls of the closed periods before a month, with their call detail records, to compressed ' \
+           'files in the private archive storage. The bills of the archived periods are read from the files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True,
+                            help='Archive the periods before this month and year, in MM/YYYY format')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Calls read by query. Default: 5000.')
+
+    def handle(self, *args, **options):
+        try:
+            month_year = datetime.strptime(options['before'], '%m/%Y')
+        except ValueError:
+            raise CommandError('Invalid format for the period. Enter the month and year in MM/YYYY format')
+
+        if month_year > current_month_year():
+            raise CommandError('You can only archive periods which are already over')
+
+        periods = list(Call.objects.filter(billing_period__lt=billing_period(month_year))
+            .order_by('billing_period').values_list('billing_period', flat=True).distinct())
+
+        archived = 0
+        started = time.monotonic()
+
+        for period in periods:
+            moved = CallArchive.archive_period(period, options['chunk_size'])
+            archived += moved
+            self.stdout.write(f'{moved} calls of {period % 100:02d}/{period // 100} archived')
+
+        self.stdout.write(self.style.SUCCESS(f'{archived} calls archived in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,63 @@
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from django.core.management.base import BaseCommand
+
+from calls.core.api.serializers import CallDetailSerializer, CallDetailBulkSerializer
+from calls.core.models.call import CallDetail
+
+
+def serializer_parse(serializer_class):
+    def parse(record):
+        serializer = serializer_class(data=record)
+        if serializer.is_valid():
+            return CallDetail(**serializer.validated_data), None
+        return None, serializer.errors
+
+    return parse
+
+
+class Command(BaseCommand):
+    help = 'Measures the records/s validated and converted to CallDetail by the serializers and by the ' \
+           'ingestion fast path (CallDetailBulkSerializer.parse). Nothing is saved.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=10000, help='Records validated by each one. Default: 10000.')
+
+    def handle(self, *args, **options):
+        records = list(self.sample_records(options['records']))
+
+        results = [
+            ('CallDetailSerializer', serializer_parse(CallDetailSerializer)),
+            ('CallDetailBulkSerializer', serializer_parse(CallDetailBulkSerializer)),
+            ('CallDetailBulkSerializer.parse', CallDetailBulkSerializer.parse),
+        ]
+
+        baseline = None
+        for name, parse in results:
+            started = time.perf_counter()
+            for record in records:
+                parse(record)
+            rate = len(records) / max(time.perf_counter() - started, 0.000001)
+
+            baseline = baseline or rate
+            self.stdout.write(f'{name:32} {rate:10.0f} records/s ({rate / baseline:.1f}x)')
+
+    @staticmethod
+    def sample_records(count):
+        """
+        Yields start and end records of calls, as sent by the switches
+        """
+        start = datetime(2018, 2, 1, tzinfo=pytz.UTC)
+
+        for number in range(count):
+            call_id = number // 2 + 1
+            timestamp = start + timedelta(minutes=call_id, seconds=number % 2 * 150)
+
+            if number % 2:
+                yield {'type': CallDetail.END, 'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                       'call_id': call_id}
+            else:
+                yield {'type': CallDetail.START, 'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                       'call_id': call_id, 'source': '99988526423', 'destination': f'99{call_id % 10 ** 9:09d}'}
@@ -0,0 +1,109 @@
+import io
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytz
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from calls.core.api.parsers import ORJSONParser
+from calls.core.api.renderers import ORJSONRenderer
+from calls.core.api.serializers import BillSerializer, CallSerializer
+from calls.core.models.call import Call, CallDetail
+
+
+def timed(function, repeat):
+    """
+    Returns the best time in milliseconds of the function calls
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = 'Measures the time to render large call list and bill payloads and to parse a bulk request body ' \
+           'with the stock JSON renderer and parser and with the orjson ones. Nothing is saved.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=10000, help='Calls of each payload. Default: 10000.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each one, the best is reported. Default: 5.')
+
+    def handle(self, *args, **options):
+        calls = list(self.sample_calls(options['calls']))
+        # URLs of the calls as on a host of the site
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        request = Request(RequestFactory().get('/api/call/', HTTP_HOST=host))
+
+        payloads = [
+            ('/api/call/', {
+                'next': None,
+                'previous': None,
+                'results': CallSerializer(calls, many=True, context={'request': request}).data,
+            }),
+            ('/api/bill/', {
+                'subscriber': '99988526423',
+                'period': '02/2018',
+                'calls': BillSerializer(calls, many=True).data,
+            }),
+        ]
+
+        for name, data in payloads:
+            content = JSONRenderer().render(data)
+            self.report(
+                f'Render {name} ({len(content) // 1024} KB)',
+                timed(lambda: JSONRenderer().render(data), options['repeat']),
+                timed(lambda: ORJSONRenderer().render(data), options['repeat']),
+            )
+
+        records = [
+            {'type': CallDetail.START, 'timestamp': call.started_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+             'call_id': call.id, 'source': call.source, 'destination': call.destination}
+            for call in calls
+        ]
+        body = JSONRenderer().render(records)
+
+        self.report(
+            f'Parse /api/call-detail/bulk/ ({len(body) // 1024} KB)',
+            timed(lambda: JSONParser().parse(io.BytesIO(body)), options['repeat']),
+            timed(lambda: ORJSONParser().parse(io.BytesIO(body)), options['repeat']),
+        )
+
+    def report(self, name, stock, fast):
+        self.stdout.write(f'{name}: json {stock:.1f} ms, orjson {fast:.1f} ms ({stock / max(fast, 0.001):.1f}x)')
+
+    @staticmethod
+    def sample_calls(count):
+        """
+        Yields priced calls, annotated with the bill fields as by the bill query
+        """
+        start = datetime(2018, 2, 1, tzinfo=pytz.UTC)
+
+        for number in range(1, count + 1):
+            started_at = start + timedelta(minutes=number)
+            ended_at = started_at + timedelta(seconds=number % 3600)
+
+            call = Call(
+                id=number,
+                detail_start=CallDetail(id=number * 2 - 1, type=CallDetail.START, timestamp=started_at),
+                detail_end=CallDetail(id=number * 2, type=CallDetail.END, timestamp=ended_at),
+                price=Decimal('0.36') + Decimal('0.09') * (number % 60),
+                source='99988526423',
+                destination=f'99{number % 10 ** 9:09d}',
+                started_at=started_at,
+                ended_at=ended_at,
+            )
+            call.start_date = started_at.date()
+            call.start_time = started_at.time()
+            call.call_duration = ended_at - started_at
+
+            yield call
@@ -0,0 +1,38 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calls.core.models.bill import Bill
+from calls.core.util.helpers import billing_period, current_month_year, last_month_year
+
+
+class Command(BaseCommand):
+    help = 'Closes a period, materializing the bills of every subscriber with calls in it. Bills invalidated ' \
+           'by a late call detail record or a repricing are built again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', help='Month and year of the period, in MM/YYYY format. Default: last month')
+        parser.add_argument('--recompute', action='store_true',
+                            help='Build again all the bills of the period, not only the missing ones')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Calls read by query. Default: 5000.')
+
+    def handle(self, *args, **options):
+        if options['period']:
+            try:
+                month_year = datetime.strptime(options['period'], '%m/%Y')
+            except ValueError:
+                raise CommandError('Invalid format for the period. Enter the month and year in MM/YYYY format')
+        else:
+            month_year = last_month_year()
+
+        if month_year >= current_month_year():
+            raise CommandError('You can only close periods which are already over')
+
+        started = time.monotonic()
+        built = Bill.close_period(billing_period(month_year), options['recompute'], options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{built} bills of {month_year.strftime("%m/%Y")} built in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,51 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calls.core.export import FORMATS, export_bills, pyarrow_installed
+from calls.core.util.helpers import billing_period, current_month_year, last_month_year
+
+
+class Command(BaseCommand):
+    help = 'Exports the bills of all the subscribers of a closed period to a CSV, Parquet or Arrow file, ' \
+           'in one pass over its calls. Parquet and Arrow files need pyarrow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Output file')
+        parser.add_argument('--period', help='Month and year of the period, in MM/YYYY format. Default: last month')
+        parser.add_argument('--format', choices=sorted(FORMATS),
+                            help='File format. By default, by the extension of the file, csv otherwise.')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Calls read and written at once. Default: 5000.')
+
+    def handle(self, *args, **options):
+        if options['period']:
+            try:
+                month_year = datetime.strptime(options['period'], '%m/%Y')
+            except ValueError:
+                raise CommandError('Invalid format for the period. Enter the month and year in MM/YYYY format')
+        else:
+            month_year = last_month_year()
+
+        if month_year >= current_month_year():
+            raise CommandError('You can only export bills which period are already closed')
+
+        path = options['file']
+        file_format = options['format'] or next(
+            (name for name, (_media_type, extension) in FORMATS.items() if path.lower().endswith(f'.{extension}')),
+            'csv'
+        )
+
+        if file_format != 'csv' and not pyarrow_installed():
+            raise CommandError(f'Install pyarrow to export {file_format} files')
+
+        started = time.monotonic()
+
+        with open(path, 'wb') as file:
+            for data in export_bills(billing_period(month_year), file_format, options['chunk_size']):
+                file.write(data)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Bills of {month_year.strftime("%m/%Y")} exported to {path} in {time.monotonic() - started:.1f}s'
+        ))
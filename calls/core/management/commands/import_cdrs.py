@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from calls.core.api.serializers import CallDetailBulkSerializer
+from calls.core.models.call import CallDetail
+from calls.core.util.db import chunked
+
+
+FIELDS = ('type', 'timestamp', 'call_id', 'source', 'destination')
+
+
+def copy_insert(call_details):
+    """
+    Inserts call detail records on PostgreSQL with COPY into a staging table followed by one INSERT ... SELECT,
+    setting their ids.
+    """
+    by_key = {(call_detail.type, call_detail.call_id): call_detail for call_detail in call_details}
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for call_detail in call_details:
+        # Unquoted empty values are loaded as NULL
+        writer.writerow([
+            call_detail.type,
+            call_detail.timestamp.isoformat(),
+            call_detail.call_id,
+            call_detail.source or '',
+            call_detail.destination or '',
+        ])
+    buffer.seek(0)
+
+    columns = ', '.join(FIELDS)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE IF NOT EXISTS core_calldetail_staging '
+            '(type varchar(5), timestamp timestamp with time zone, call_id integer, '
+            'source varchar(11), destination varchar(11)) ON COMMIT DELETE ROWS'
+        )
+        # Emptied on commit only: the rows of the previous chunks when they are imported in the same transaction
+        cursor.execute('TRUNCATE core_calldetail_staging')
+        cursor.copy_expert(f'COPY core_calldetail_staging ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(
+            f'INSERT INTO {CallDetail._meta.db_table} ({columns}) '
+            f'SELECT {columns} FROM core_calldetail_staging '
+            f'RETURNING id, type, call_id'
+        )
+        for pk, type_, call_id in cursor.fetchall():
+            by_key[(type_, call_id)].pk = pk
+
+
+class Command(BaseCommand):
+    help = 'Imports call detail records from CSV or NDJSON files. ' \
+           'CSV files must have a header with the fields type, timestamp, call_id, source and destination.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV or NDJSON file with the call detail records')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='File format. By default, csv for .csv files, ndjson otherwise.')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Records saved by transaction. Default: 5000.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the records already imported by a previous run, as saved in the checkpoint file.')
+        parser.add_argument('--checkpoint',
+                            help='File that saves the number of records already imported. Default: <file>.checkpoint')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+
+        if not os.path.exists(path):
+            raise CommandError(f'File not found: {path}')
+
+        offset = 0
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                offset = int(checkpoint_file.read().strip() or 0)
+            self.stdout.write(f'Resuming after {offset} records')
+
+        insert = copy_insert if connection.vendor == 'postgresql' else None
+
+        imported = rejected = 0
+        started = time.monotonic()
+
+        with open(path, newline='' if file_format == 'csv' else None) as file:
+            records = islice(self.read_records(file, file_format), offset, None)
+
+            for chunk in chunked(records, options['chunk_size']):
+                saved, errors = CallDetailBulkSerializer.save_records([record for _number, record in chunk], insert)
+
+                for position in sorted(errors):
+                    number = chunk[position][0]
+                    self.stderr.write(f'Record {number} rejected: {json.dumps(errors[position])}')
+
+                offset += len(chunk)
+                imported += saved
+                rejected += len(errors)
+
+                with open(checkpoint, 'w') as checkpoint_file:
+                    checkpoint_file.write(str(offset))
+
+                elapsed = max(time.monotonic() - started, 0.001)
+                self.stdout.write(f'{offset} records read, {imported} imported '
+                                  f'({(imported + rejected) / elapsed:.0f} records/s)')
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        elapsed = max(time.monotonic() - started, 0.001)
+        self.stdout.write(self.style.SUCCESS(
+            f'{imported} records imported, {rejected} rejected in {elapsed:.1f}s '
+            f'({(imported + rejected) / elapsed:.0f} records/s)'
+        ))
+
+    @staticmethod
+    def read_records(file, file_format):
+        """
+        Yields the number and the data of each record of the file. Empty values are left out.
+        """
+        rows = csv.DictReader(file) if file_format == 'csv' else Command.read_lines(file)
+
+        for number, row in enumerate(rows, 1):
+            if isinstance(row, dict):
+                row = {field: value for field, value in row.items() if value not in ('', None)}
+
+            yield number, row
+
+    @staticmethod
+    def read_lines(file):
+        """
+        Yields the data of each non empty line of a NDJSON file, or the line itself when it is not valid JSON
+        """
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
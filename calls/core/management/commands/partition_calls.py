@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from calls.core import response_cache
+from calls.core.partitions import add_months, calls_partitioned, create_partition, current_period, \
+    detach_partition, is_partitioned, partitions
+from calls.core.util.helpers import billing_period
+
+
+class Command(BaseCommand):
+    help = 'Creates the partitions of the calls table for the current and next periods and detaches (or drops) ' \
+           'the partitions of old periods. The calls table is partitioned by CALL_PARTITIONING on PostgreSQL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.CALL_PARTITIONS_AHEAD,
+                            help='Periods after the current one to create. '
+                                 f'Default: {settings.CALL_PARTITIONS_AHEAD}.')
+        parser.add_argument('--detach-before', help='Detach the partitions of the periods before this month and '
+                                                    'year, in MM/YYYY format. Their calls are kept in tables of '
+                                                    'their own, no longer read by the API.')
+        parser.add_argument('--drop', action='store_true', help='Drop the detached partitions with their calls')
+
+    def handle(self, *args, **options):
+        if not calls_partitioned():
+            raise CommandError('The calls table is only partitioned on PostgreSQL, with CALL_PARTITIONING')
+
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor):
+                raise CommandError('The calls table is not partitioned yet. Run the migrations with CALL_PARTITIONING')
+
+            detach_before = None
+            if options['detach_before']:
+                try:
+                    detach_before = billing_period(datetime.strptime(options['detach_before'], '%m/%Y'))
+                except ValueError:
+                    raise CommandError('Invalid format for the period. Enter the month and year in MM/YYYY format')
+
+                if detach_before > current_period():
+                    raise CommandError('You can only detach periods which are already over')
+
+            for period in (add_months(current_period(), months) for months in range(options['ahead'] + 1)):
+                with transaction.atomic():
+                    if create_partition(cursor, period):
+                        self.stdout.write(f'Partition of {period % 100:02d}/{period // 100} created')
+
+            if detach_before:
+                for period in partitions(cursor):
+                    if period < detach_before:
+                        with transaction.atomic():
+                            detach_partition(cursor, period, options['drop'])
+                        self.stdout.write(f'Partition of {period % 100:02d}/{period // 100} '
+                                          f'{"dropped" if options["drop"] else "detached"}')
+
+                # The calls of the partitions are removed without signals
+                response_cache.invalidate_all()
+
+            self.stdout.write(self.style.SUCCESS(f'{len(partitions(cursor))} partitions attached'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from calls.core.models.idempotency_key import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Deletes the idempotency keys older than IDEMPOTENCY_KEY_TTL seconds.'
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyKey.purge()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} expired idempotency keys deleted'))
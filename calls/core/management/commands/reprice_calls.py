@@ -0,0 +1,75 @@
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from calls.core.models.bill import Bill
+from calls.core.models.call import Call
+from calls.core.models.pricing_rule import PricingRule
+from calls.core import response_cache
+from calls.core.pricing import epoch_seconds
+from calls.core.util.db import bulk_update
+from calls.core.util.helpers import billing_period
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the price of the calls of a period (calls that ended in the month) with the current ' \
+           'pricing rules.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', required=True, help='Month and year of the calls, in MM/YYYY format')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Calls repriced by transaction. Default: 5000.')
+
+    def handle(self, *args, **options):
+        try:
+            month_year = datetime.strptime(options['period'], '%m/%Y')
+        except ValueError:
+            raise CommandError('Invalid format for the period. Enter the month and year in MM/YYYY format')
+
+        queryset = Call.objects.filter(billing_period=billing_period(month_year)).order_by('id')
+
+        repriced = 0
+        last_id = 0
+        started = time.monotonic()
+
+        while True:
+            # The calls are locked from the read of their times to the write of their prices, so a record changed
+            # by a concurrent request is paired after the call is repriced, not overwritten with a stale price
+            with transaction.atomic():
+                # Keyset pagination, so each chunk is a short query whatever the position
+                rows = Call.lock_rows(
+                    queryset.select_for_update().filter(id__gt=last_id)
+                    .values_list('id', 'started_at', 'ended_at')[:options['chunk_size']]
+                )
+
+                if not rows:
+                    break
+
+                last_id = rows[-1][0]
+
+                calls = [Call(id=call_id, price=Decimal('0.00')) for call_id, _start, _end in rows]
+                complete = [(call, start, end) for call, (_id, start, end) in zip(calls, rows) if start]
+
+                prices = PricingRule.price_many(
+                    [epoch_seconds(start) for _call, start, _end in complete],
+                    [epoch_seconds(end) for _call, _start, end in complete],
+                )
+
+                for (call, _start, _end), price in zip(complete, prices):
+                    call.price = price
+
+                bulk_update(calls, ['price'])
+
+            repriced += len(calls)
+            self.stdout.write(f'{repriced} calls repriced '
+                              f'({repriced / max(time.monotonic() - started, 0.001):.0f} calls/s)')
+
+        # bulk_update() does not send signals: the bills of the period are built again when it is closed
+        Bill.objects.filter(period=billing_period(month_year)).delete()
+        # Nor are the cached responses of the calls invalidated one by one: all the cached responses are
+        response_cache.invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS(f'{repriced} calls of {options["period"]} repriced'))
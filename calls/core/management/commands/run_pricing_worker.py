@@ -0,0 +1,179 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from calls.core.models.call import CallDetail
+from calls.core.models.call_detail_queue import CallDetailQueue
+from calls.core.util.db import chunked
+from calls.core.util.reorder import ReorderBuffer
+
+
+class Command(BaseCommand):
+    help = 'Pairs with their calls and prices the call detail records queued in async pairing mode ' \
+           '(CALL_PAIRING_ASYNC). Many workers can run at once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.CALL_PAIRING_WORKER_BATCH_SIZE,
+                            help=f'Records paired by transaction. Default: {settings.CALL_PAIRING_WORKER_BATCH_SIZE}.')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty. Default: 1.')
+        parser.add_argument('--once', action='store_true', help='Stop when the queue is empty')
+        parser.add_argument('--reorder-window', type=int, default=settings.CALL_PAIRING_REORDER_WINDOW,
+                            help='Seconds of call detail timestamps a record waits in memory for the other record '
+                                 'of its call, so the call is written once. Default: '
+                                 f'{settings.CALL_PAIRING_REORDER_WINDOW} (no wait).')
+        parser.add_argument('--buffer-size', type=int, default=settings.CALL_PAIRING_REORDER_BUFFER_SIZE,
+                            help='Maximum records waiting in memory. Default: '
+                                 f'{settings.CALL_PAIRING_REORDER_BUFFER_SIZE}.')
+        parser.add_argument('--rescan-interval', type=float, default=settings.CALL_PAIRING_RESCAN_INTERVAL,
+                            help='Seconds between the reads of the queue from the start with a reorder window, for '
+                                 'the records committed after others with higher ids. Default: '
+                                 f'{settings.CALL_PAIRING_RESCAN_INTERVAL}.')
+        parser.add_argument('--shard', help='Pair only the records of the calls of a shard, as N/M: call ids with '
+                                            'remainder N divided by M. Required with --reorder-window: run one '
+                                            'worker per shard.')
+
+    def handle(self, *args, **options):
+        self.queue = CallDetailQueue.objects.filter(error='')
+
+        # The records waiting in the buffer are no longer locked: another worker reading the same calls would pair
+        # them again
+        if options['reorder_window'] > 0 and not options['shard']:
+            raise CommandError('A reorder window requires a shard of calls per worker. Use --shard N/M, '
+                               'e.g. --shard 0/1 for a single worker')
+
+        if options['shard']:
+            try:
+                shard, shards = (int(number) for number in options['shard'].split('/'))
+            except ValueError:
+                raise CommandError('Invalid shard. Enter it in N/M format, e.g. 0/4')
+
+            self.queue = self.queue.annotate(shard=F('call_detail__call_id') % shards).filter(shard=shard)
+
+        self.buffer = None
+        if options['reorder_window'] > 0:
+            self.buffer = ReorderBuffer(timedelta(seconds=options['reorder_window']), options['buffer_size'])
+
+        # Records waiting in the buffer are still queued: the queue is read from after the last one read, and
+        # from the start again once the buffer is empty or every rescan interval
+        self.last_id = 0
+        self.rescan_interval = options['rescan_interval']
+        self.rescan_at = time.monotonic() + self.rescan_interval
+
+        # When the last record was read: the waiting records are written alone after the worker is idle for a
+        # window, as their other records would have been read
+        self.read_at = time.monotonic()
+
+        self.paired = 0
+        self.rejected = 0
+
+        try:
+            while True:
+                result = self.pair_batch(options['batch_size'])
+
+                if result is None:
+                    if self.buffer is not None and len(self.buffer) \
+                            and (options['once'] or time.monotonic() - self.read_at >= options['reorder_window']):
+                        result = self.pair_records(self.buffer.flush())
+                    elif options['once']:
+                        break
+                    else:
+                        time.sleep(options['sleep'])
+                        continue
+
+                self.count(result)
+
+        except KeyboardInterrupt:
+            # Stopped: the waiting records are written alone, they would be read again by the next worker anyway
+            if self.buffer is not None and len(self.buffer):
+                self.count(self.pair_records(self.buffer.flush()))
+
+            self.stdout.write(self.style.SUCCESS(f'Stopped: {self.paired} records paired, {self.rejected} rejected'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Queue drained: {self.paired} records paired, {self.rejected} rejected'))
+
+    def count(self, result):
+        batch_paired, batch_rejected = result
+        self.paired += batch_paired
+        self.rejected += batch_rejected
+        self.stdout.write(f'{self.paired} records paired, {self.rejected} rejected')
+
+    def pair_batch(self, batch_size):
+        """
+        Pairs the oldest queued records in one transaction. The queue rows are locked and the ones locked by
+        other workers are skipped, so each worker takes its own batch.
+        Returns the number of records paired and rejected, None if the queue is empty.
+        """
+        if self.buffer is not None and (not len(self.buffer) or time.monotonic() >= self.rescan_at):
+            # The rows with lower ids committed after the last one read are read too. Even under steady traffic,
+            # when the buffer is never empty.
+            self.last_id = 0
+            self.rescan_at = time.monotonic() + self.rescan_interval
+
+        with transaction.atomic():
+            while True:
+                items = list(
+                    self.queue.select_for_update(skip_locked=True, of=('self',)).select_related('call_detail')
+                    .filter(id__gt=self.last_id).order_by('id')[:batch_size]
+                )
+
+                if not items:
+                    return None
+
+                if self.buffer is None:
+                    return self.pair_records([[item.call_detail] for item in items])
+
+                self.last_id = items[-1].id
+
+                # The records read before, waiting in the buffer, are skipped
+                items = [item for item in items if item.call_detail not in self.buffer]
+
+                if items:
+                    self.read_at = time.monotonic()
+                    return self.pair_records([group for item in items for group in self.buffer.add(item.call_detail)])
+
+    def pair_records(self, records):
+        """
+        Pairs the groups of records emitted by the buffer and removes them from the queue.
+        Records of the same group are paired in the same write of their call.
+        """
+        with transaction.atomic():
+            if self.buffer is not None and records:
+                records = self.current_records(records)
+
+            call_details = [call_detail for group in records for call_detail in group]
+
+            if not call_details:
+                return 0, 0
+
+            paired, errors = CallDetail.pair_queued(call_details)
+
+            for position, msg in errors.items():
+                CallDetailQueue.objects.filter(call_detail=call_details[position]).update(error=msg)
+                self.stderr.write(f'Record {call_details[position].id} rejected: {msg}')
+
+            CallDetailQueue.objects.filter(call_detail__in=paired).delete()
+
+        return len(paired), len(errors)
+
+    def current_records(self, records):
+        """
+        Returns the groups of records emitted by the buffer as they are now, locking their queue rows. The records
+        deleted while they waited are left out, and the changed ones are read again.
+        """
+        ids = [call_detail.id for group in records for call_detail in group]
+        current = {}
+
+        for chunk in chunked(ids, 500):
+            current.update(
+                (item.call_detail_id, item.call_detail) for item in
+                self.queue.select_for_update(of=('self',)).select_related('call_detail').filter(call_detail_id__in=chunk)
+            )
+
+        records = [[current[call_detail.id] for call_detail in group if call_detail.id in current] for group in records]
+        return [group for group in records if group]
@@ -0,0 +1,47 @@
+# Generated by Django 2.1.2 on 2026-10-18 17:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_auto_20181024_0201'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Bill',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscriber', models.CharField(max_length=11, verbose_name='subscriber phone number')),
+                ('period', models.PositiveIntegerField(verbose_name='period (YYYYMM)')),
+                ('closed_at', models.DateTimeField(auto_now_add=True, verbose_name='closed at')),
+            ],
+            options={
+                'verbose_name': 'bill',
+                'verbose_name_plural': 'bills',
+            },
+        ),
+        migrations.CreateModel(
+            name='BillLine',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('call_id', models.PositiveIntegerField()),
+                ('destination', models.CharField(blank=True, max_length=11, null=True, verbose_name='destination phone number')),
+                ('started_at', models.DateTimeField(verbose_name='started at')),
+                ('duration', models.DurationField(verbose_name='duration')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True, verbose_name='price')),
+                ('bill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='core.Bill')),
+            ],
+            options={
+                'verbose_name': 'bill line',
+                'verbose_name_plural': 'bill lines',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='bill',
+            unique_together={('subscriber', 'period')},
+        ),
+    ]
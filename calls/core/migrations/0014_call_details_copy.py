@@ -0,0 +1,42 @@
+# Generated by Django 2.1.2 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_bill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='call',
+            name='billing_period',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='billing period (YYYYMM)'),
+        ),
+        migrations.AddField(
+            model_name='call',
+            name='destination',
+            field=models.CharField(blank=True, max_length=11, null=True, verbose_name='destination phone number'),
+        ),
+        migrations.AddField(
+            model_name='call',
+            name='ended_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='ended at'),
+        ),
+        migrations.AddField(
+            model_name='call',
+            name='source',
+            field=models.CharField(blank=True, max_length=11, null=True, verbose_name='source phone number'),
+        ),
+        migrations.AddField(
+            model_name='call',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='started at'),
+        ),
+        migrations.AddIndex(
+            model_name='call',
+            index=models.Index(fields=['source', 'billing_period'], name='core_call_source_e525ab_idx'),
+        ),
+    ]
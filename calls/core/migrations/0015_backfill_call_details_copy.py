@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def backfill_call_details_copy(apps, schema_editor):
+    """
+    Copies the fields of the details of the existing calls with set-based updates
+    """
+    Call = apps.get_model('core', 'Call')
+    CallDetail = apps.get_model('core', 'CallDetail')
+
+    def detail_field(detail, field):
+        return Subquery(CallDetail.objects.filter(id=OuterRef(detail)).values(field)[:1])
+
+    Call.objects.update(
+        source=detail_field('detail_start_id', 'source'),
+        destination=detail_field('detail_start_id', 'destination'),
+        started_at=detail_field('detail_start_id', 'timestamp'),
+        ended_at=detail_field('detail_end_id', 'timestamp'),
+    )
+
+    Call.objects.filter(ended_at__isnull=False).update(
+        billing_period=ExtractYear('ended_at') * 100 + ExtractMonth('ended_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_call_details_copy'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_call_details_copy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.2 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_backfill_call_details_copy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calldetail',
+            index=models.Index(fields=['timestamp', 'id'], name='core_callde_timesta_6811f8_idx'),
+        ),
+    ]
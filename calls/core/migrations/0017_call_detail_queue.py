@@ -0,0 +1,27 @@
+# Generated by Django 2.1.2 on 2026-10-18 17:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_call_detail_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallDetailQueue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queued_at', models.DateTimeField(auto_now_add=True, verbose_name='queued at')),
+                ('error', models.CharField(blank=True, max_length=255, verbose_name='pairing error')),
+                ('call_detail', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='queue_item', to='core.CallDetail')),
+            ],
+            options={
+                'verbose_name': 'queued call detail',
+                'verbose_name_plural': 'queued calls details',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.1.2 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_call_detail_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='key')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='request hash')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='response status code')),
+                ('response', models.TextField(verbose_name='response body')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+            ],
+            options={
+                'verbose_name': 'idempotency key',
+                'verbose_name_plural': 'idempotency keys',
+            },
+        ),
+    ]
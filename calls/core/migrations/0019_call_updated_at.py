@@ -0,0 +1,18 @@
+# Generated by Django 2.1.2 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='call',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='updated at'),
+        ),
+    ]
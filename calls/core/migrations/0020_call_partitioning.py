@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db import migrations
+
+from calls.core.partitions import is_partitioned, partition_calls, unpartition_calls
+
+
+def partition(apps, schema_editor):
+    """
+    Partitions the calls table by billing period when CALL_PARTITIONING is set, on PostgreSQL 11+
+    """
+    connection = schema_editor.connection
+
+    if not settings.CALL_PARTITIONING or connection.vendor != 'postgresql':
+        return
+
+    if connection.pg_version < 110000:
+        raise RuntimeError('Partitioning the calls table requires PostgreSQL 11 or later')
+
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            partition_calls(cursor)
+
+
+def unpartition(apps, schema_editor):
+    connection = schema_editor.connection
+
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            unpartition_calls(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_call_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
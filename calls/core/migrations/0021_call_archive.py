@@ -0,0 +1,29 @@
+# Generated by Django 2.1.2 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_call_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.PositiveIntegerField(unique=True, verbose_name='period (YYYYMM)')),
+                ('data_file', models.CharField(max_length=255, verbose_name='data file')),
+                ('index_file', models.CharField(max_length=255, verbose_name='index file')),
+                ('call_count', models.PositiveIntegerField(verbose_name='calls')),
+                ('subscriber_count', models.PositiveIntegerField(verbose_name='subscribers')),
+                ('archived_at', models.DateTimeField(auto_now=True, verbose_name='archived at')),
+            ],
+            options={
+                'verbose_name': 'call archive',
+                'verbose_name_plural': 'call archives',
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 2.1.2 on 2026-10-18 21:41
+
+from django.db import migrations, models
+
+
+def fingerprint_fields():
+    fields = (
+        ('call_count', models.PositiveIntegerField(blank=True, null=True, verbose_name='calls')),
+        ('calls_updated_at', models.DateTimeField(blank=True, null=True, verbose_name='calls updated at')),
+    )
+
+    for name, field in fields:
+        field.set_attributes_from_name(name)
+
+    return fields
+
+
+def add_fields(apps, schema_editor):
+    """
+    Adds the columns with ALTER TABLE ... ADD COLUMN on SQLite: Django 2.1 copies the table to a new one instead,
+    which on SQLite 3.26+ leaves the foreign key of the bill lines pointing to the dropped table
+    """
+    Bill = apps.get_model('core', 'Bill')
+    quote = schema_editor.quote_name
+
+    for _name, field in fingerprint_fields():
+        field.model = Bill
+
+        if schema_editor.connection.vendor == 'sqlite':
+            definition, params = schema_editor.column_sql(Bill, field)
+            schema_editor.execute(
+                f'ALTER TABLE {quote(Bill._meta.db_table)} ADD COLUMN {quote(field.column)} {definition}', params
+            )
+        else:
+            schema_editor.add_field(Bill, field)
+
+
+def remove_fields(apps, schema_editor):
+    """
+    Drops the columns with ALTER TABLE ... DROP COLUMN on SQLite 3.35+, for the same reason. Older versions do not
+    have it: the columns are left, they are nullable and no longer read.
+    """
+    Bill = apps.get_model('core', 'Bill')
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+
+    for _name, field in fingerprint_fields():
+        field.model = Bill
+
+        if connection.vendor == 'sqlite':
+            if connection.Database.sqlite_version_info >= (3, 35, 0):
+                schema_editor.execute(f'ALTER TABLE {quote(Bill._meta.db_table)} DROP COLUMN {quote(field.column)}')
+        else:
+            schema_editor.remove_field(Bill, field)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_call_archive'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(add_fields, remove_fields)],
+            state_operations=[
+                migrations.AddField(model_name='bill', name=name, field=field)
+                for name, field in fingerprint_fields()
+            ],
+        ),
+    ]
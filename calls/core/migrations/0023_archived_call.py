@@ -0,0 +1,43 @@
+# Generated by Django 2.1.2 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+
+def add_archived_calls(apps, schema_editor):
+    """
+    Keeps the ids of the calls in the existing archives
+    """
+    from calls.core import archive
+
+    CallArchive = apps.get_model('core', 'CallArchive')
+    ArchivedCall = apps.get_model('core', 'ArchivedCall')
+
+    for call_archive in CallArchive.objects.all():
+        index = archive.load_index(call_archive.index_file)
+
+        ArchivedCall.objects.bulk_create(
+            ArchivedCall(call_id=row['id'], period=call_archive.period)
+            for row in archive.iter_rows(call_archive.data_file, index)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_bill_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCall',
+            fields=[
+                ('call_id', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='call id')),
+                ('period', models.PositiveIntegerField(verbose_name='period (YYYYMM)')),
+            ],
+            options={
+                'verbose_name': 'archived call',
+                'verbose_name_plural': 'archived calls',
+            },
+        ),
+        migrations.RunPython(add_archived_calls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,7 @@
+from calls.core.models.pricing_rule import PricingRule
+from calls.core.models.call import CallDetail, Call
+from calls.core.models.call_detail_queue import CallDetailQueue
+from calls.core.models.bill import Bill, BillLine
+from calls.core.models.idempotency_key import IdempotencyKey
+from calls.core.models.archived_call import ArchivedCall
+from calls.core.models.call_archive import CallArchive
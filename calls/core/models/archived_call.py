@@ -0,0 +1,43 @@
+from django.db import models
+
+from calls.core.util.db import chunked
+
+
+class ArchivedCall(models.Model):
+    """
+    Ids of the calls moved to an archive by archive_calls. Their records are deleted with them, so the ids are
+    kept for the records of these calls sent again (retried or late) to be rejected instead of creating the calls
+    again.
+    """
+
+    class Meta:
+        verbose_name = "archived call"
+        verbose_name_plural = "archived calls"
+
+    call_id = models.PositiveIntegerField("call id", primary_key=True)
+    period = models.PositiveIntegerField("period (YYYYMM)")
+
+    def __str__(self):
+        return f'Archived call id:{self.call_id}'
+
+    @staticmethod
+    def archived_ids(call_ids):
+        """
+        Returns which of the given calls were archived
+        """
+        archived = set()
+
+        for ids in chunked(set(call_ids), 500):
+            archived.update(ArchivedCall.objects.filter(call_id__in=ids).values_list('call_id', flat=True))
+
+        return archived
+
+    @staticmethod
+    def add(period, call_ids):
+        """
+        Keeps the ids of calls archived, the ones archived before (archived again after a change) are skipped
+        """
+        call_ids = set(call_ids)
+        call_ids -= ArchivedCall.archived_ids(call_ids)
+
+        ArchivedCall.objects.bulk_create([ArchivedCall(call_id=call_id, period=period) for call_id in sorted(call_ids)])
@@ -0,0 +1,284 @@
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import models, transaction
+from django.db.models import Count, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from calls.core.models.call import Call, calls_changed
+from calls.core.models.call_archive import CallArchive
+from calls.core import response_cache
+from calls.core.util.db import bulk_update, chunked
+from calls.core.util.helpers import billing_period, current_month_year, format_duration
+
+
+# Fields of the rows of Bill.export_rows(): the fields of the bill calls, with the subscriber and the period.
+# Each bill ends with a total row, with the total duration and price of its calls.
+EXPORT_FIELDS = ('subscriber', 'period', 'row_type', 'destination', 'start_date', 'start_time', 'duration', 'price')
+
+
+def calls_changed_receiver(calls, *_args, **_kwargs):
+    Bill.invalidate(calls)
+    response_cache.invalidate_calls(calls)
+
+
+class Bill(models.Model):
+    """
+    Bill of a subscriber for a closed period, materialized by close_period() so it is not calculated
+    on every request.
+    """
+
+    class Meta:
+        verbose_name = "bill"
+        verbose_name_plural = "bills"
+        unique_together = ("subscriber", "period")
+
+    subscriber = models.CharField("subscriber phone number", max_length=11)
+    period = models.PositiveIntegerField("period (YYYYMM)")
+    closed_at = models.DateTimeField("closed at", auto_now_add=True)
+
+    # fingerprint() of the calls the bill was built from: a bill built from calls changed by a concurrent request,
+    # whose invalidation did not see it, does not match the calls
+    call_count = models.PositiveIntegerField("calls", null=True, blank=True)
+    calls_updated_at = models.DateTimeField("calls updated at", null=True, blank=True)
+
+    def __str__(self):
+        return f'Bill of {self.subscriber} - {self.period % 100:02d}/{self.period // 100}'
+
+    @staticmethod
+    def period_calls(period):
+        """
+        Returns the calls of a period (the calls that ended in the month) with a subscriber
+        """
+        return Call.objects.filter(source__isnull=False, billing_period=period)
+
+    @staticmethod
+    def close_period(period, recompute=False, chunk_size=5000):
+        """
+        Materializes the bills of the subscribers with calls in the period, in one pass over its calls.
+        Only the missing bills (never closed or invalidated by a change of their calls) are built,
+        unless recompute. Returns the number of bills built.
+        """
+        calls = Bill.period_calls(period)
+
+        with transaction.atomic():
+            if recompute:
+                Bill.objects.filter(period=period).delete()
+
+            closed = set(Bill.objects.filter(period=period).values_list('subscriber', flat=True))
+            subscribers = set(calls.values_list('source', flat=True).distinct()) - closed
+
+            Bill.objects.bulk_create([Bill(subscriber=subscriber, period=period) for subscriber in subscribers])
+
+            bills = {
+                subscriber: bill_id
+                for subscriber, bill_id in Bill.objects.filter(period=period).values_list('subscriber', 'id')
+                if subscriber in subscribers
+            }
+
+            fingerprints = {}
+
+            last_id = 0
+            while bills:
+                chunk = list(calls.filter(id__gt=last_id).order_by('id')[:chunk_size])
+
+                if not chunk:
+                    break
+
+                last_id = chunk[-1].id
+                chunk = [call for call in chunk if call.source in bills]
+
+                BillLine.objects.bulk_create([BillLine.from_call(bills[call.source], call) for call in chunk])
+
+                for call in chunk:
+                    call_count, updated_at = fingerprints.get(call.source, (0, call.updated_at))
+                    fingerprints[call.source] = call_count + 1, max(updated_at, call.updated_at)
+
+            bulk_update([
+                Bill(id=bills[subscriber], call_count=call_count, calls_updated_at=updated_at)
+                for subscriber, (call_count, updated_at) in fingerprints.items()
+            ], ['call_count', 'calls_updated_at'])
+
+        return len(subscribers)
+
+    @staticmethod
+    def current(period, subscribers):
+        """
+        Returns the materialized bills of the subscribers in a period built from their calls as they are now,
+        checked against the fingerprint() of the calls in the same query
+        """
+        calls = Bill.period_calls(period).filter(source=OuterRef('subscriber')).order_by().values('source')
+
+        return Bill.objects.filter(period=period, subscriber__in=subscribers).annotate(
+            current_call_count=Subquery(calls.annotate(call_count=Count('id')).values('call_count')),
+            current_updated_at=Subquery(calls.annotate(updated_at=Max('updated_at')).values('updated_at')),
+        ).filter(call_count=F('current_call_count'), calls_updated_at=F('current_updated_at'))
+
+    @staticmethod
+    def fingerprint(period, subscriber):
+        """
+        Returns the number of calls of the bill of a subscriber and when they were last changed, read from the
+        index of the calls. Any change of the calls of the bill changes one of them.
+        """
+        fingerprint = Bill.period_calls(period).filter(source=subscriber).aggregate(
+            call_count=Count('id'),
+            updated_at=Max('updated_at'),
+        )
+        return fingerprint['call_count'], fingerprint['updated_at']
+
+    @staticmethod
+    def summaries(period, subscribers):
+        """
+        Returns the totals of the bills of the subscribers in a period, by subscriber: number of calls, duration and
+        price. They are aggregated by the database in one query by 500 subscribers.
+        """
+        totals = Bill.period_calls(period).order_by().values('source').annotate(
+            call_count=Count('id'),
+            duration=Sum(ExpressionWrapper(F('ended_at') - F('started_at'), output_field=models.DurationField())),
+            price=Sum('price'),
+        )
+
+        summaries = {subscriber: Bill.summary(0, timedelta(0), None) for subscriber in subscribers}
+
+        for chunk in chunked(subscribers, 500):
+            for subscriber_totals in totals.filter(source__in=chunk):
+                summaries[subscriber_totals['source']] = Bill.summary(
+                    subscriber_totals['call_count'], subscriber_totals['duration'], subscriber_totals['price']
+                )
+
+        return summaries
+
+    @staticmethod
+    def summary(call_count, duration, price):
+        """
+        Returns the totals of a bill
+        """
+        return {
+            'call_count': call_count,
+            'total_seconds': int(duration.total_seconds()),
+            'total_duration': format_duration(duration),
+            'total_price': str((price or Decimal('0.00')).quantize(Decimal('0.01'))),
+        }
+
+    @staticmethod
+    def summary_of_calls(calls):
+        """
+        Returns the totals of a bill from its calls, as summaries()
+        """
+        calls = list(calls)
+
+        return Bill.summary(
+            len(calls),
+            sum((call.ended_at - call.started_at for call in calls), timedelta(0)),
+            sum((call.price or Decimal('0.00') for call in calls), Decimal('0.00')),
+        )
+
+    @staticmethod
+    def export_rows(period, chunk_size=5000):
+        """
+        Yields the lines of the bills of all the subscribers of a period by lists of up to chunk_size rows, as
+        tuples of EXPORT_FIELDS: the calls of each subscriber followed by its total. The calls are read in one
+        pass, with a server-side cursor on PostgreSQL, merged with the archive file of an archived period.
+        """
+        period_display = f'{period % 100:02d}/{period // 100}'
+        calls = Bill.period_calls(period).order_by('source', 'id').values_list(
+            'id', 'source', 'destination', 'started_at', 'ended_at', 'price'
+        ).iterator(chunk_size=chunk_size)
+
+        call_archive = CallArchive.of_period(period)
+        if call_archive:
+            archived = (
+                (call.id, call.source, call.destination, call.started_at, call.ended_at, call.price)
+                for call in call_archive.calls()
+            )
+            calls = CallArchive.merge(archived, calls, key=lambda call: (call[1], call[0]))
+
+        rows = []
+        subscriber = None
+        total_duration = total_price = None
+
+        for _call_id, source, destination, started_at, ended_at, price in calls:
+            if source != subscriber:
+                if subscriber is not None:
+                    rows.append(Bill.total_row(subscriber, period_display, total_duration, total_price))
+
+                subscriber = source
+                total_duration = timedelta(0)
+                total_price = Decimal('0.00')
+
+            duration = ended_at - started_at
+            total_duration += duration
+            total_price += price or Decimal('0.00')
+
+            started_at = timezone.localtime(started_at)
+            rows.append((source, period_display, 'call', destination, started_at.date(), started_at.time(),
+                         format_duration(duration), price))
+
+            if len(rows) >= chunk_size:
+                yield rows
+                rows = []
+
+        if subscriber is not None:
+            rows.append(Bill.total_row(subscriber, period_display, total_duration, total_price))
+
+        if rows:
+            yield rows
+
+    @staticmethod
+    def total_row(subscriber, period_display, duration, price):
+        return subscriber, period_display, 'total', None, None, None, format_duration(duration), price
+
+    @staticmethod
+    def invalidate(calls):
+        """
+        Deletes the bills of closed periods with the given calls, so they are built again by close_period()
+        """
+        current_period = billing_period(current_month_year())
+        keys = set()
+
+        for call in calls:
+            if call.source and call.billing_period and call.billing_period < current_period:
+                keys.add((call.source, call.billing_period))
+
+        if keys:
+            Bill.objects.filter(reduce(or_, (Q(subscriber=subscriber, period=period) for subscriber, period in keys))).delete()
+
+
+class BillLine(models.Model):
+    """
+    A call of a materialized bill
+    """
+
+    class Meta:
+        verbose_name = "bill line"
+        verbose_name_plural = "bill lines"
+
+    bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name="lines")
+    call_id = models.PositiveIntegerField()
+    destination = models.CharField("destination phone number", max_length=11, null=True, blank=True)
+    started_at = models.DateTimeField("started at")
+    duration = models.DurationField("duration")
+    price = models.DecimalField("price", max_digits=6, decimal_places=2, blank=True, null=True)
+
+    def __str__(self):
+        return f'Call {self.call_id} - {self.bill}'
+
+    @property
+    def duration_display(self):
+        return format_duration(self.duration)
+
+    @staticmethod
+    def from_call(bill_id, call):
+        return BillLine(
+            bill_id=bill_id,
+            call_id=call.id,
+            destination=call.destination,
+            started_at=call.started_at,
+            duration=call.ended_at - call.started_at,
+            price=call.price,
+        )
+
+
+calls_changed.connect(calls_changed_receiver, sender=Call)
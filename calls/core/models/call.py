@@ -1,16 +1,28 @@
+from copy import copy
 from decimal import Decimal
 
-from django.db import models
-from django.db.models.signals import post_save, pre_save, pre_delete
+from django.conf import settings
+from django.db import connection, models, transaction, IntegrityError, OperationalError
+from django.db.models import Q
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
+from django.dispatch import Signal
+from django.utils import timezone
 from django.core.validators import ValidationError, MinLengthValidator
 
 from calls.core.validators import phone_number_validator
-from calls.core.util.helpers import time_between
+from calls.core.util.helpers import billing_period, time_between
+from calls.core.util.db import chunked, bulk_update, supports_upsert, upsert
+from calls.core.models.archived_call import ArchivedCall
+from calls.core.models.call_detail_queue import CallDetailQueue
 from calls.core.models.pricing_rule import PricingRule
+from calls.core.partitions import calls_partitioned, row_moved
 
 
-def call_detail_post_save_receiver(instance, *_args, **_kwargs):
-    Call.update_detail(instance)
+# Sent with calls created, updated or deleted, also by the bulk operations, which do not send post_save.
+# Receivers get the state of the calls when it is sent (e.g. the calls before a change of their details).
+calls_changed = Signal(providing_args=['calls'])
+
+ARCHIVED_CALL_MSG = "The call of this record has already been billed and archived. It cannot be sent again."
 
 
 def call_detail_pre_delete_receiver(instance, *_args, **_kwargs):
@@ -23,6 +35,9 @@ class CallDetail(models.Model):
         verbose_name = "call detail"
         verbose_name_plural = "calls details"
         unique_together = ("type", "call_id")
+        indexes = [
+            models.Index(fields=['timestamp', 'id']),
+        ]
 
     # Record Type
     START = 'start'
@@ -54,39 +69,270 @@ class CallDetail(models.Model):
         return f'Call id:{self.call_id} - Detail id:{self.id} - {self.type} on {self.timestamp} ' \
                f'from {self.source} to {self.destination}.'
 
+    def matches(self, data):
+        """
+        Returns True if the record has the given field values, e.g. the record sent again by a client
+        """
+        return all(
+            (getattr(self, name) or None) == (data.get(name) or None)
+            for name in ('type', 'timestamp', 'call_id', 'source', 'destination')
+        )
+
+    def validate_order(self, started_at, ended_at):
+        """
+        Validates the record timestamp against the start and end times already received for its call
+        """
+        if self.type == CallDetail.START \
+                and ended_at \
+                and ended_at < self.timestamp:
+            msg = "The Start Call Detail record must be before than the End Call Detail record"
+            raise ValidationError(msg)
+
+        if self.type == CallDetail.END \
+                and started_at \
+                and started_at > self.timestamp:
+            msg = "The End Call Detail record must be after than the Start Call Detail record"
+            raise ValidationError(msg)
+
     def save(self, *args, **kwargs):
 
         if self.call_id <= 0:
             msg = "Call ID should be greater than zero"
             raise ValidationError(msg)
 
-        call = Call.objects.filter(id=self.call_id)
+        if settings.CALL_PAIRING_ASYNC:
+            self.save_queued(*args, **kwargs)
+            return
 
-        if call and self.type == CallDetail.START \
-                and call[0].detail_end \
-                and call[0].detail_end.timestamp < self.timestamp:
-            msg = "The Start Call Detail record must be before than the End Call Detail record"
-            raise ValidationError(msg)
+        # The call row has the times of both records, no need to read the other record
+        ended_by = Call.ended_by(self) if self.pk is None else {}
+        call = Call.objects.filter(Call.period_filter(ended_by), id=self.call_id).first()
 
-        if call and self.type == CallDetail.END \
-                and call[0].detail_start \
-                and call[0].detail_start.timestamp > self.timestamp:
-            msg = "The End Call Detail record must be after than the Start Call Detail record"
-            raise ValidationError(msg)
+        if call:
+            self.validate_order(call.started_at, call.ended_at)
+
+            if self.pk:
+                # A saved record is changed: the call as it was before
+                calls_changed.send(sender=Call, calls=[call])
+        elif ArchivedCall.archived_ids([self.call_id]):
+            raise ValidationError(ARCHIVED_CALL_MSG)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            # ON CONFLICT needs a unique index of the id, which a partitioned calls table does not have
+            if supports_upsert() and not calls_partitioned():
+                Call.upsert_detail(self, call)
+            else:
+                Call.update_detail(self, ended_by)
+
+    def save_queued(self, *args, **kwargs):
+        """
+        Saves the record and queues it to be paired with its call by run_pricing_worker (async pairing mode).
+        The order is validated against the records of the call already received, paired or not.
+        """
+        received = CallDetail.received_details([self.call_id]).get(self.call_id, {})
+        start, end = received.get(CallDetail.START), received.get(CallDetail.END)
+
+        if not received and ArchivedCall.archived_ids([self.call_id]):
+            raise ValidationError(ARCHIVED_CALL_MSG)
+
+        self.validate_order(start and start.timestamp, end and end.timestamp)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            CallDetailQueue.objects.get_or_create(call_detail=self)
+
+    @staticmethod
+    def received_details(call_ids):
+        """
+        Returns the start and end records already received for the given calls, paired or not, by call id
+        """
+        received = {}
+
+        for ids in chunked(set(call_ids), 500):
+            for call_detail in CallDetail.objects.filter(call_id__in=ids):
+                received.setdefault(call_detail.call_id, {})[call_detail.type] = call_detail
+
+        return received
+
+    @staticmethod
+    def bulk_save(call_details, insert=None):
+        """
+        Saves many call detail records at once, with the same validations of save(), and creates/updates
+        their calls. Runs a constant number of queries instead of a few queries per record.
+        insert is the function that inserts the accepted records and sets their ids (bulk_insert() by default).
+        Returns the saved records and a dict with the error message of each rejected record,
+        keyed by its position in call_details.
+        """
+        for attempt in range(1, settings.CALL_PAIRING_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    if settings.CALL_PAIRING_ASYNC:
+                        return CallDetail.queue_details(call_details, insert)
+
+                    return CallDetail.pair_details(call_details, insert)
+
+            except IntegrityError:
+                # A concurrent request saved records or created calls with the same ids: read them again
+                if attempt == settings.CALL_PAIRING_ATTEMPTS:
+                    raise
+
+                for call_detail in call_details:
+                    call_detail.pk = None
+
+    @staticmethod
+    def pair_details(call_details, insert=None):
+        """
+        Validates and saves the records of bulk_save() in the current transaction, with their calls locked.
+        """
+        calls = Call.lock_calls({call_detail.call_id for call_detail in call_details if call_detail.call_id > 0})
+
+        saved, errors = CallDetail.validate_details(call_details, {
+            call.id: {CallDetail.START: call.detail_start, CallDetail.END: call.detail_end}
+            for call in calls.values()
+        })
+
+        (insert or CallDetail.bulk_insert)(saved)
+        Call.update_details(saved, calls)
+
+        return saved, errors
+
+    @staticmethod
+    def queue_details(call_details, insert=None):
+        """
+        Validates and saves the records of bulk_save() in the current transaction, queuing them to be paired
+        with their calls by run_pricing_worker (async pairing mode).
+        """
+        saved, errors = CallDetail.validate_details(call_details, CallDetail.received_details(
+            call_detail.call_id for call_detail in call_details if call_detail.call_id > 0
+        ))
+
+        (insert or CallDetail.bulk_insert)(saved)
+        CallDetailQueue.objects.bulk_create([CallDetailQueue(call_detail=call_detail) for call_detail in saved])
+
+        return saved, errors
+
+    @staticmethod
+    def pair_queued(call_details):
+        """
+        Pairs records saved in async pairing mode with their calls, in the current transaction and with the
+        calls locked. They are validated again against the calls, as concurrent requests may have queued the
+        other record of a call. Returns the paired records and the errors of the rejected ones by position.
+        """
+        ended_by = {}
+        for call_detail in call_details:
+            ended_by.update(Call.ended_by(call_detail))
+
+        calls = Call.lock_calls({call_detail.call_id for call_detail in call_details}, ended_by)
+
+        paired, errors = CallDetail.validate_details(call_details, {
+            call.id: {CallDetail.START: call.detail_start, CallDetail.END: call.detail_end}
+            for call in calls.values()
+        })
+
+        # The calls as they were before, as save() sends them for a changed record
+        changed = {call_detail.call_id for call_detail in paired}
+        calls_changed.send(sender=Call, calls=[call for call_id, call in calls.items() if call_id in changed])
+
+        Call.update_details(paired, calls)
+
+        return paired, errors
+
+    @staticmethod
+    def validate_details(call_details, received):
+        """
+        Validates many records with the validations of save(), against the start and end records already
+        received for their calls (a dict of records by type, by call id), the archived calls and the previous
+        records of the batch.
+        Returns the accepted records and a dict with the error message of each rejected record,
+        keyed by its position in call_details.
+        """
+        # Start and end records of each call, the received ones and the ones accepted from this batch
+        received = {call_id: dict(details) for call_id, details in received.items()}
+        # The records of an archived call were deleted with it: only the calls without records can be archived
+        archived = ArchivedCall.archived_ids(
+            call_detail.call_id for call_detail in call_details
+            if call_detail.call_id > 0 and not received.get(call_detail.call_id)
+        )
+
+        accepted = []
+        errors = {}
+
+        for position, call_detail in enumerate(call_details):
+            if call_detail.call_id <= 0:
+                errors[position] = "Call ID should be greater than zero"
+                continue
+
+            if call_detail.call_id in archived:
+                errors[position] = ARCHIVED_CALL_MSG
+                continue
+
+            details = received.setdefault(call_detail.call_id, {})
+            existing = details.get(call_detail.type)
+
+            if existing and (existing.pk is None or existing.pk != call_detail.pk):
+                errors[position] = "A detail record with this type and call id has already been sent. " \
+                                   "Delete it before resend it."
+                continue
+
+            start, end = details.get(CallDetail.START), details.get(CallDetail.END)
+
+            try:
+                call_detail.validate_order(start and start.timestamp, end and end.timestamp)
+            except ValidationError as error:
+                errors[position] = error.message
+                continue
+
+            details[call_detail.type] = call_detail
+            accepted.append(call_detail)
+
+        return accepted, errors
+
+    @staticmethod
+    def bulk_insert(call_details):
+        """
+        Inserts call detail records with bulk_create(), setting their ids
+        """
+        CallDetail.objects.bulk_create(call_details)
+
+        if call_details and call_details[0].pk is None:
+            # The database backend does not return the ids of the inserted rows (e.g. SQLite)
+            CallDetail.fetch_ids(call_details)
+
+    @staticmethod
+    def fetch_ids(call_details):
+        """
+        Sets the ids of call detail records inserted by bulk_create(), looking them up by type and call id
+        """
+        by_key = {(call_detail.type, call_detail.call_id): call_detail for call_detail in call_details}
 
-        super().save(*args, **kwargs)
+        for call_ids in chunked({call_detail.call_id for call_detail in call_details}, 500):
+            rows = CallDetail.objects.filter(call_id__in=call_ids).values_list('id', 'type', 'call_id')
+            for pk, type_, call_id in rows:
+                if (type_, call_id) in by_key:
+                    by_key[(type_, call_id)].pk = pk
 
 
-post_save.connect(call_detail_post_save_receiver, sender=CallDetail)
 pre_delete.connect(call_detail_pre_delete_receiver, sender=CallDetail)
 
 
 def call_pre_save_receiver(instance, *_args, **_kwargs):
+    instance.copy_details()
     instance.calculate_price()
 
 
+def call_changed_receiver(instance, *_args, **_kwargs):
+    calls_changed.send(sender=Call, calls=[instance])
+
+
 class Call(models.Model):
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'billing_period']),
+        ]
+
     detail_start = models.ForeignKey(
         CallDetail,
         on_delete=models.SET_NULL,
@@ -104,6 +350,16 @@ class Call(models.Model):
 
     price = models.DecimalField("standing charge", max_digits=6, decimal_places=2, blank=True, null=True)
 
+    # Copies of the details, so the bills are read from an index without joins
+    source = models.CharField("source phone number", max_length=11, null=True, blank=True)
+    destination = models.CharField("destination phone number", max_length=11, null=True, blank=True)
+    started_at = models.DateTimeField("started at", null=True, blank=True)
+    ended_at = models.DateTimeField("ended at", null=True, blank=True)
+    billing_period = models.PositiveIntegerField("billing period (YYYYMM)", null=True, blank=True)
+
+    # Also set by the bulk updates and upserts of the calls (calls.core.util.db)
+    updated_at = models.DateTimeField("updated at", auto_now=True)
+
     def __str__(self):
         return f'Call {self.id}'
 
@@ -114,6 +370,29 @@ class Call(models.Model):
 
         return time_between(self.detail_start.timestamp, self.detail_end.timestamp)
 
+    def copy_details(self):
+        """
+        Copies the fields of the details used by the bills. The call belongs to the period in which it has ended.
+        """
+        start = self.detail_start
+        end = self.detail_end
+
+        self.source = start.source if start else None
+        self.destination = start.destination if start else None
+        self.started_at = start.timestamp if start else None
+        self.ended_at = end.timestamp if end else None
+        self.billing_period = billing_period(end.timestamp) if end else None
+
+    def calculate_price_of_times(self):
+        """
+        Calculates the price with the copies of the times of the details, without reading them.
+        """
+        if not (self.started_at and self.ended_at):
+            self.price = Decimal('0.00')
+            return
+
+        self.price = PricingRule.price(self.started_at, self.ended_at)
+
     def calculate_price(self):
 
         if not (self.detail_start and self.detail_end):
@@ -123,28 +402,193 @@ class Call(models.Model):
         self.price = PricingRule.price(self.detail_start.timestamp, self.detail_end.timestamp)
 
     @staticmethod
-    def update_detail(call_detail):
+    def ended_by(call_detail):
+        """
+        Returns the period of the call of an end record by call id, if it is known from the record: a call has
+        a single end record, so it has not ended yet (no period) or has ended in the period of the record.
+        Only for records already saved or new, not for changed records, whose call may have another period.
+        """
+        if call_detail.type != CallDetail.END or not calls_partitioned():
+            return {}
+
+        timestamp = CallDetail._meta.get_field('timestamp').to_python(call_detail.timestamp)
+        return {call_detail.call_id: billing_period(timestamp)}
+
+    @staticmethod
+    def period_filter(ended_by):
         """
-        Creates, updates the call record based on the call detail record
+        Filters calls by their partition key, from the periods of ended_by(), so a partitioned calls table reads
+        just the partitions of the calls not ended yet and of these periods
+        """
+        if not ended_by:
+            return Q()
+
+        return Q(billing_period__isnull=True) | Q(billing_period__in=set(ended_by.values()))
+
+    @staticmethod
+    def lock_calls(call_ids, ended_by=None):
+        """
+        Returns the calls with the given ids, with their details, by id. The calls are locked until the end of
+        the transaction, in id order, so concurrent requests pairing records of the same calls wait for each
+        other instead of deadlocking. On PostgreSQL the ids of the calls not created yet are locked too.
+        ended_by has the periods of the calls known from their end records (ended_by()).
+        """
+        ended_by = ended_by or {}
+        calls = {}
+
+        for ids in chunked(sorted(call_ids), 500):
+            if connection.vendor == 'postgresql':
+                # Concurrent requests creating the same calls would fail with a unique violation, to be retried
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT pg_advisory_xact_lock(%s::regclass::oid::integer, id) FROM unnest(%s) AS id',
+                        [Call._meta.db_table, ids]
+                    )
+
+            known = [call_id for call_id in ids if call_id in ended_by]
+            others = [call_id for call_id in ids if call_id not in ended_by]
+
+            for lookup, filters in ((known, Call.period_filter({call_id: ended_by[call_id] for call_id in known})),
+                                    (others, Q())):
+                if lookup:
+                    queryset = Call.objects.select_for_update(of=('self',)).select_related('detail_start', 'detail_end')
+                    calls.update((call.id, call) for call in Call.lock_rows(
+                        queryset.filter(filters, id__in=lookup).order_by('id')
+                    ))
+
+        return calls
+
+    @staticmethod
+    def lock_rows(queryset):
+        """
+        Returns the rows of a SELECT ... FOR UPDATE. On a partitioned calls table, a row waited for may be moved
+        to another partition by the change of its period: the SELECT is run again to lock it where it is.
+        """
+        if not calls_partitioned():
+            return list(queryset)
+
+        for attempt in range(1, settings.CALL_PAIRING_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    return list(queryset.all())
+
+            except OperationalError as error:
+                if not row_moved(error) or attempt == settings.CALL_PAIRING_ATTEMPTS:
+                    raise
+
+    @staticmethod
+    def update_detail(call_detail, ended_by=None):
+        """
+        Creates, updates the call record based on the call detail record.
+        The call is locked, so the records of the same call saved by concurrent requests are paired one at a time.
+        ended_by has the period of the call known from the record, if it is new (ended_by()).
         """
         call_id = call_detail.call_id
 
-        if not Call.objects.filter(id=call_id).exists():
-            # Call already exists
-            Call.objects.create(
-                id=call_id,
-                detail_start=call_detail if call_detail.type == CallDetail.START else None,
-                detail_end=call_detail if call_detail.type == CallDetail.END else None,
-            )
-        else:
-            # Call does not exist yet
-            call = Call.objects.get(id=call_id)
+        with transaction.atomic():
+            call = Call.lock_calls([call_id], ended_by).get(call_id)
+
+            if call is None:
+                try:
+                    with transaction.atomic():
+                        Call.objects.create(
+                            id=call_id,
+                            detail_start=call_detail if call_detail.type == CallDetail.START else None,
+                            detail_end=call_detail if call_detail.type == CallDetail.END else None,
+                        )
+                    return
+
+                except IntegrityError:
+                    # Created by a concurrent request with the other record of the call
+                    call = Call.lock_calls([call_id], ended_by)[call_id]
+
+            # The other record may have been paired by a concurrent request after save() validated the order
+            call_detail.validate_order(call.started_at, call.ended_at)
+
             if call_detail.type == CallDetail.START:
                 call.detail_start = call_detail
             else:
                 call.detail_end = call_detail
             call.save()
 
+    @staticmethod
+    def upsert_detail(call_detail, call=None):
+        """
+        Creates, updates the call record based on the call detail record with a single INSERT ... ON CONFLICT,
+        priced with the record in memory and the times of the other record in the call row.
+        call is the call record as read before saving the call detail record, if it existed.
+        """
+        timestamp = CallDetail._meta.get_field('timestamp').to_python(call_detail.timestamp)
+        updated = copy(call) if call else Call(id=call_detail.call_id)
+
+        if call_detail.type == CallDetail.START:
+            updated.detail_start_id = call_detail.id
+            updated.source = call_detail.source
+            updated.destination = call_detail.destination
+            updated.started_at = timestamp
+            fields = ['detail_start', 'source', 'destination', 'started_at', 'price']
+        else:
+            updated.detail_end_id = call_detail.id
+            updated.ended_at = timestamp
+            updated.billing_period = billing_period(timestamp)
+            fields = ['detail_end', 'ended_at', 'billing_period', 'price']
+
+        updated.calculate_price_of_times()
+
+        row = upsert(updated, fields, returning=['detail_start', 'detail_end'])
+
+        if tuple(row) != (updated.detail_start_id, updated.detail_end_id):
+            # The other record was paired by a concurrent request after the call was read
+            updated = Call.objects.get(id=call_detail.call_id)
+            call_detail.validate_order(updated.started_at, updated.ended_at)
+            updated.calculate_price_of_times()
+            Call.objects.filter(id=updated.id).update(price=updated.price, updated_at=timezone.now())
+
+        # Raw queries do not send post_save
+        calls_changed.send(sender=Call, calls=[updated])
+
+        return updated
+
+    @staticmethod
+    def update_details(call_details, calls=None):
+        """
+        Creates, updates the call records of many call detail records with set-based queries.
+        calls may have the existing calls of these records, with their details, by id.
+        """
+        if calls is None:
+            calls = Call.objects.select_related('detail_start', 'detail_end').in_bulk(
+                {call_detail.call_id for call_detail in call_details}
+            )
+
+        created = {}
+        updated = {}
+
+        for call_detail in call_details:
+            call_id = call_detail.call_id
+
+            if call_id in calls:
+                call = updated[call_id] = calls[call_id]
+            elif call_id in created:
+                call = created[call_id]
+            else:
+                call = created[call_id] = Call(id=call_id)
+
+            if call_detail.type == CallDetail.START:
+                call.detail_start = call_detail
+            else:
+                call.detail_end = call_detail
+
+        # Bulk operations do not send the pre_save signal that calculates the price
+        for call in list(created.values()) + list(updated.values()):
+            call.copy_details()
+            call.calculate_price()
+
+        Call.objects.bulk_create(created.values())
+        bulk_update(updated.values(), ['detail_start', 'detail_end', 'price', 'source', 'destination', 'started_at',
+                                       'ended_at', 'billing_period'])
+
+        calls_changed.send(sender=Call, calls=list(created.values()) + list(updated.values()))
+
     @staticmethod
     def delete_detail(call_detail):
         """
@@ -152,9 +596,12 @@ class Call(models.Model):
         """
         call_id = call_detail.call_id
 
-        if Call.objects.filter(id=call_id).exists():
+        # Locked, as its period is changed by the records of the call paired by concurrent requests
+        call = Call.lock_calls([call_id], Call.ended_by(call_detail)).get(call_id)
+
+        if call:
 
-            call = Call.objects.get(id=call_id)
+            calls_changed.send(sender=Call, calls=[call])
 
             if (call_detail.type == CallDetail.START and call.detail_end is None) \
                     or (call_detail.type == CallDetail.END and call.detail_start is None):
@@ -171,3 +618,5 @@ class Call(models.Model):
 
 
 pre_save.connect(call_pre_save_receiver, sender=Call)
+post_save.connect(call_changed_receiver, sender=Call)
+post_delete.connect(call_changed_receiver, sender=Call)
@@ -0,0 +1,203 @@
+import heapq
+import tempfile
+import uuid
+from itertools import groupby
+
+from django.core.files import File
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from calls.core import archive, response_cache
+from calls.core.models.archived_call import ArchivedCall
+from calls.core.models.call import CallDetail, Call
+from calls.core.models.call_detail_queue import CallDetailQueue
+from calls.core.util.db import chunked, delete_rows
+
+
+class CallArchive(models.Model):
+    """
+    Calls of a closed period moved by archive_calls from the calls tables to a file (calls.core.archive),
+    where the bills of the period read them.
+    """
+
+    class Meta:
+        verbose_name = "call archive"
+        verbose_name_plural = "call archives"
+
+    period = models.PositiveIntegerField("period (YYYYMM)", unique=True)
+    data_file = models.CharField("data file", max_length=255)
+    index_file = models.CharField("index file", max_length=255)
+    call_count = models.PositiveIntegerField("calls")
+    subscriber_count = models.PositiveIntegerField("subscribers")
+    archived_at = models.DateTimeField("archived at", auto_now=True)
+
+    def __str__(self):
+        return f'Calls of {self.period % 100:02d}/{self.period // 100}'
+
+    @staticmethod
+    def of_period(period):
+        return CallArchive.objects.filter(period=period).first()
+
+    @property
+    def index(self):
+        return archive.load_index(self.index_file)
+
+    def subscriber_calls(self, subscriber):
+        """
+        Returns the archived calls of a subscriber, with the fields of the bills
+        """
+        return self.subscribers_calls([subscriber]).get(subscriber, [])
+
+    def subscribers_calls(self, subscribers):
+        """
+        Returns the archived calls of many subscribers, with the fields of the bills, by subscriber in the given
+        order. The archive file is opened once (a single GET on S3); subscribers without archived calls are left out.
+        """
+        index = self.index
+        entries = {subscriber: index[subscriber] for subscriber in subscribers if subscriber in index}
+
+        if not entries:
+            return {}
+
+        rows = archive.read_many_rows(self.data_file, entries)
+
+        return {
+            subscriber: [CallArchive.bill_call(row) for row in rows[subscriber]]
+            for subscriber in entries if rows[subscriber]
+        }
+
+    def calls(self):
+        """
+        Yields the archived calls of all the subscribers, by subscriber, with the fields of the bills
+        """
+        index = {subscriber: entry for subscriber, entry in self.index.items() if subscriber}
+
+        for row in archive.iter_rows(self.data_file, index):
+            yield CallArchive.bill_call(row)
+
+    @staticmethod
+    def merge(archived, calls, key=lambda call: (call.source or '', call.id)):
+        """
+        Yields the archived calls of a period and its calls still in the database (received or changed after the
+        period was archived), both in (source, id) order, in the same order. A call in both is yielded once, as it
+        is in the database.
+        """
+        last = None
+
+        # Calls of the database first, as merge() yields the equal items of the first iterable first
+        for call in heapq.merge(calls, archived, key=key):
+            if key(call) != last:
+                last = key(call)
+                yield call
+
+    @staticmethod
+    def bill_call(row):
+        """
+        Returns a call from its archived fields, annotated like the calls of the bill queries
+        """
+        call = Call(**{field: row[field] for field in archive.CALL_FIELDS})
+        started_at = timezone.localtime(call.started_at)
+
+        call.start_date = started_at.date()
+        call.start_time = started_at.time()
+        call.call_duration = call.ended_at - call.started_at
+
+        return call
+
+    @staticmethod
+    def archive_period(period, chunk_size=5000):
+        """
+        Moves the calls of a period with their call detail records to an archive file, keeping their ids
+        (ArchivedCall). The calls of a period archived before (e.g. changed while archived) are merged with the
+        archived ones in a new file.
+        Returns the number of calls moved.
+        """
+        previous = CallArchive.of_period(period)
+        previous_index = previous.index if previous else {}
+
+        # Calls changed while they are archived are left for the next time
+        read_at = timezone.now()
+        calls = Call.objects.filter(billing_period=period, updated_at__lte=read_at)
+        index = {}
+        # The ids of the records of the calls written, by call id: only these are deleted
+        written = {}
+
+        with tempfile.TemporaryFile() as file:
+            # Calls without a source, NULL or empty, in one group: NULL sorts last on PostgreSQL, '' first
+            rows = calls.select_related('detail_start', 'detail_end').order_by(Coalesce('source', Value('')), 'id')
+
+            for subscriber, subscriber_calls in groupby(rows.iterator(chunk_size=chunk_size),
+                                                        key=lambda call: call.source or ''):
+                subscriber_calls = list(subscriber_calls)
+                subscriber_rows = [archive.call_row(call) for call in subscriber_calls]
+                written.update((call.id, [detail_id for detail_id in (call.detail_start_id, call.detail_end_id)
+                                          if detail_id is not None]) for call in subscriber_calls)
+
+                if subscriber in previous_index:
+                    # The calls archived again replace their previous copies
+                    call_ids = {row['id'] for row in subscriber_rows}
+                    archived = archive.read_rows(previous.data_file, previous_index[subscriber])
+                    subscriber_rows = sorted(
+                        [row for row in archived if row['id'] not in call_ids] + subscriber_rows,
+                        key=lambda row: row['id']
+                    )
+
+                index[subscriber] = archive.write_member(file, subscriber_rows)
+
+            if not index:
+                return 0
+
+            if previous:
+                # Subscribers without new calls: their members are copied as they are
+                with archive.storage.open(previous.data_file, 'rb') as previous_file:
+                    for subscriber, entry in previous_index.items():
+                        if subscriber not in index:
+                            offset = file.tell()
+                            file.write(archive.read_member(previous_file, entry))
+                            index[subscriber] = [offset, file.tell() - offset, entry[2]]
+
+            file.seek(0)
+            # Never the name of a previous file, whose index can be kept in memory
+            name = f'calls-{period}-{uuid.uuid4().hex[:12]}'
+            data_file = archive.storage.save(f'{name}.ndjson.gz', File(file))
+
+        index_file = archive.save_index(f'{name}.index.json.gz', index)
+
+        with transaction.atomic():
+            moved = 0
+
+            for call_ids in chunked(sorted(written), 500):
+                # Calls changed since they were read (e.g. a record deleted) are kept, with the archived copy
+                # replaced by the next run
+                unchanged = Call.lock_rows(
+                    Call.objects.select_for_update()
+                    .filter(id__in=call_ids, billing_period=period, updated_at__lte=read_at)
+                    .order_by('id').values_list('id', flat=True)
+                )
+                detail_ids = [detail_id for call_id in unchanged for detail_id in written[call_id]]
+
+                moved += delete_rows(Call, unchanged)
+                ArchivedCall.add(period, unchanged)
+                delete_rows(CallDetailQueue, detail_ids, column='call_detail_id')
+                delete_rows(CallDetail, detail_ids)
+
+            CallArchive.objects.update_or_create(period=period, defaults={
+                'data_file': data_file,
+                'index_file': index_file,
+                'call_count': sum(entry[2] for entry in index.values()),
+                'subscriber_count': len([subscriber for subscriber in index if subscriber]),
+            })
+
+            if previous:
+                def delete_previous_files():
+                    archive.storage.delete(previous.data_file)
+                    archive.storage.delete(previous.index_file)
+
+                transaction.on_commit(delete_previous_files)
+
+        # The calls are deleted without signals
+        response_cache.invalidate_all()
+
+        return moved
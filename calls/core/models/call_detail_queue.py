@@ -0,0 +1,19 @@
+from django.db import models
+
+
+class CallDetailQueue(models.Model):
+    """
+    Call detail records saved in async pairing mode (CALL_PAIRING_ASYNC), waiting to be paired with their calls
+    and priced by run_pricing_worker. Records rejected when paired are kept with the error.
+    """
+
+    class Meta:
+        verbose_name = "queued call detail"
+        verbose_name_plural = "queued calls details"
+
+    call_detail = models.OneToOneField("core.CallDetail", on_delete=models.CASCADE, related_name="queue_item")
+    queued_at = models.DateTimeField("queued at", auto_now_add=True)
+    error = models.CharField("pairing error", max_length=255, blank=True)
+
+    def __str__(self):
+        return f'Queued {self.call_detail_id}'
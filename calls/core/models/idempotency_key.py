@@ -0,0 +1,82 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a request sent with an Idempotency-Key header, returned again when the request is retried with
+    the same key, until IDEMPOTENCY_KEY_TTL seconds.
+    """
+
+    class Meta:
+        verbose_name = "idempotency key"
+        verbose_name_plural = "idempotency keys"
+
+    key = models.CharField("key", max_length=255, unique=True)
+    request_hash = models.CharField("request hash", max_length=64)
+    status_code = models.PositiveSmallIntegerField("response status code")
+    response = models.TextField("response body")
+    created_at = models.DateTimeField("created at", auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+    @staticmethod
+    def expiration():
+        return timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+    @staticmethod
+    def hash_request(path, data):
+        """
+        Returns the SHA-256 of the path and the parsed body of a request
+        """
+        content = json.dumps([path, data], sort_keys=True, cls=DjangoJSONEncoder)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    @staticmethod
+    def lookup(key):
+        """
+        Returns the stored response of the key, if it did not expire
+        """
+        stored = IdempotencyKey.objects.filter(key=key).first()
+
+        if stored and stored.created_at < IdempotencyKey.expiration():
+            stored.delete()
+            return None
+
+        return stored
+
+    @staticmethod
+    def store(key, request_hash, status_code, data):
+        """
+        Stores the status code and the data of the response of the key
+        """
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    key=key,
+                    request_hash=request_hash,
+                    status_code=status_code,
+                    response=json.dumps(data, cls=DjangoJSONEncoder),
+                )
+        except IntegrityError:
+            # Stored by a concurrent request with the same key
+            pass
+
+    @staticmethod
+    def purge():
+        """
+        Deletes the expired keys. Returns the number of keys deleted.
+        """
+        deleted, _by_model = IdempotencyKey.objects.filter(created_at__lt=IdempotencyKey.expiration()).delete()
+        return deleted
+
+    @property
+    def data(self):
+        return json.loads(self.response)
@@ -1,10 +1,21 @@
-from decimal import Decimal
-from datetime import time, datetime, timedelta
-import pytz
+import time as clock
 
+from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_save, post_delete
 
-from calls.core.util.helpers import to_timedelta
+from calls.core import response_cache
+from calls.core.pricing import PricingSchedule
+
+
+# Compiled pricing schedule of the current process, see PricingRule.schedule()
+_schedule_cache = {'schedule': None, 'expires': 0}
+
+
+def pricing_rule_changed_receiver(*_args, **_kwargs):
+    PricingRule.clear_schedule()
+    # The cached bills were priced with the previous rules
+    response_cache.invalidate_all()
 
 
 class PricingRule(models.Model):
@@ -23,117 +34,36 @@ class PricingRule(models.Model):
         return self.name
 
     @staticmethod
-    def map_day_time_rules():
-
-        rules = PricingRule.objects.all()
-
-        result = []
-
-        for rule in rules:
-            if rule.start_time > rule.end_time:
-                result.append(
-                    {
-                        'start_time': rule.start_time,
-                        'end_time': time(0, 0, 0),
-                        'id': rule.id,
-                        'standing_charge': rule.standing_charge,
-                        'minute_call_charge': rule.minute_call_charge,
-                    }
-                )
-
-                result.append(
-                    {
-                        'start_time': time(0, 0, 0),
-                        'end_time': rule.end_time,
-                        'id': rule.id,
-                        'standing_charge': rule.standing_charge,
-                        'minute_call_charge': rule.minute_call_charge,
-                    }
-                )
-            else:
-                result.append(
-                    {
-                        'start_time': rule.start_time,
-                        'end_time': rule.end_time,
-                        'id': rule.id,
-                        'standing_charge': rule.standing_charge,
-                        'minute_call_charge': rule.minute_call_charge,
-                    }
-                )
-        return result
-
-    @staticmethod
-    def prices_for_period(case_start, case_end):
-        prices = []
-
-        rules = PricingRule.map_day_time_rules()
-
-        if not rules:
-            return []
-
-        start = case_start
-
-        # Find the rule that mach with start point
-        for idx, rule in enumerate(rules):
-            if (rule['start_time'] <= start.time() < rule['end_time']) or \
-                    (rule['start_time'] <= start.time() and rule['end_time'] == time(0, 0, 0)):
-                break
-
-        while True:
-            slice_start_datetime = start
+    def schedule():
+        """
+        Returns the pricing rules compiled as a PricingSchedule. It is cached by process, cleared when a rule
+        is saved or deleted and expires after PRICING_SCHEDULE_TTL seconds, so the other processes also
+        get the changes.
+        """
+        schedule = _schedule_cache['schedule']
 
-            slice_end_date = slice_start_datetime.date()
-            if rule['end_time'] == time(0, 0, 0):
-                slice_end_date += timedelta(days=1)
+        if schedule is None or _schedule_cache['expires'] < clock.monotonic():
+            schedule = PricingSchedule(PricingRule.objects.all())
+            _schedule_cache['schedule'] = schedule
+            _schedule_cache['expires'] = clock.monotonic() + settings.PRICING_SCHEDULE_TTL
 
-            slice_end_datetime = datetime(
-                slice_end_date.year,
-                slice_end_date.month,
-                slice_end_date.day,
-                rule['end_time'].hour,
-                rule['end_time'].minute,
-                rule['end_time'].second,
-                tzinfo=pytz.UTC
-            )
+        return schedule
 
-            if slice_end_datetime > case_end:
-                slice_end_datetime = case_end
-
-            slice_time_price = {
-                'pricing_rule_id': rule['id'],
-                'start_datetime': slice_start_datetime,
-                'end_datetime': slice_end_datetime,
-                'minutes': (to_timedelta(slice_end_datetime) - to_timedelta(slice_start_datetime)).seconds // 60,
-                'call_charge': (to_timedelta(slice_end_datetime) - to_timedelta(slice_start_datetime)).seconds // 60 * rule['minute_call_charge'],
-                'standing_charge': rule['standing_charge']
-            }
-
-            prices.append(slice_time_price)
-
-            if slice_end_datetime == case_end:
-                break
-
-            start = slice_end_datetime
-
-            if idx == len(rules)-1:
-                idx = 0
-            else:
-                idx += 1
-
-            rule = rules[idx]
-
-        return prices
+    @staticmethod
+    def clear_schedule():
+        _schedule_cache['schedule'] = None
 
     @staticmethod
     def price(start_timestamp, end_timestamp):
-        prices = PricingRule.prices_for_period(start_timestamp, end_timestamp)
+        return PricingRule.schedule().price(start_timestamp, end_timestamp)
+
+    @staticmethod
+    def price_many(starts, ends):
+        """
+        Returns the prices of many calls, given their start and end times in seconds since the epoch
+        """
+        return PricingRule.schedule().price_many(starts, ends)
 
-        call_charge = Decimal('0.00')
-        if prices:
-            for price in prices:
-                call_charge += price['call_charge']
 
-            standing_charge = prices[0]['standing_charge']
-            return call_charge + standing_charge
-        else:
-            return call_charge
+post_save.connect(pricing_rule_changed_receiver, sender=PricingRule)
+post_delete.connect(pricing_rule_changed_receiver, sender=PricingRule)
@@ -0,0 +1,214 @@
+"""
+Monthly range partitioning of the calls table (core_call) by billing period on PostgreSQL 11+, enabled by
+CALL_PARTITIONING before running the migrations.
+
+Each period has its own partition (core_call_pYYYYMM) and the calls without a period (not ended yet) are kept
+in the default partition. The queries of the bills filter the calls by period, so only its partition is read,
+and the partitions of old periods are detached or dropped instead of deleting their calls.
+
+PostgreSQL requires the unique constraints of a partitioned table to include the partition key, so the primary
+key of the calls is replaced by an index and a trigger rejecting a duplicate id with a unique violation.
+"""
+from django.conf import settings
+from django.db import connection
+
+from calls.core.util.helpers import billing_period, current_month_year
+
+
+TABLE = 'core_call'
+DEFAULT_PARTITION = f'{TABLE}_default'
+UNIQUE_ID_TRIGGER = f'{TABLE}_unique_id'
+
+
+def calls_partitioned():
+    """
+    Returns True if the calls table is partitioned, as set by CALL_PARTITIONING on PostgreSQL
+    """
+    return settings.CALL_PARTITIONING and connection.vendor == 'postgresql'
+
+
+def row_moved(error):
+    """
+    Returns True if a database error is the failure to lock or update a call moved to another partition by
+    a concurrent change of its period (e.g. paired with its end record). The statement can be run again.
+    """
+    return getattr(error.__cause__, 'pgcode', None) == '40001' and 'moved to another partition' in str(error)
+
+
+def partition_name(period):
+    return f'{TABLE}_p{period}'
+
+
+def next_period(period):
+    year, month = divmod(period, 100)
+    return period + 1 if month < 12 else (year + 1) * 100 + 1
+
+
+def add_months(period, months):
+    year, month = divmod(period, 100)
+    year, month = divmod(year * 12 + month - 1 + months, 12)
+    return year * 100 + month + 1
+
+
+def current_period():
+    return billing_period(current_month_year())
+
+
+def is_partitioned(cursor):
+    cursor.execute(
+        'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)', [TABLE]
+    )
+    return cursor.fetchone()[0]
+
+
+def partitions(cursor):
+    """
+    Returns the periods of the partitions attached to the calls table
+    """
+    cursor.execute(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE pg_inherits.inhparent = %s::regclass', [TABLE]
+    )
+    prefix = partition_name('')
+    return sorted(int(name[len(prefix):]) for name, in cursor.fetchall() if name != DEFAULT_PARTITION)
+
+
+def create_partition(cursor, period):
+    """
+    Creates the partition of a period. Calls of the period already in the default partition are moved to it.
+    Returns False if it already exists.
+    """
+    name = partition_name(period)
+
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+    if cursor.fetchone()[0]:
+        return False
+
+    cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE billing_period >= %s AND billing_period < %s '
+        f'RETURNING *) INSERT INTO {name} SELECT * FROM moved',
+        [period, next_period(period)]
+    )
+    # The indexes, foreign keys and trigger of the table are created in the partition when attached
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+        [period, next_period(period)]
+    )
+    return True
+
+
+def detach_partition(cursor, period, drop=False):
+    """
+    Detaches the partition of a period from the calls table, leaving its calls in a table of their own,
+    or drops it. Returns False if it is not attached.
+    """
+    if period not in partitions(cursor):
+        return False
+
+    name = partition_name(period)
+    cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+
+    if drop:
+        cursor.execute(f'DROP TABLE {name}')
+
+    return True
+
+
+def table_definitions(cursor, table):
+    """
+    Returns the SQL creating the indexes and the foreign keys of a table, except its primary key
+    """
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+        "WHERE indrelid = %s::regclass AND NOT indisprimary", [table]
+    )
+    indexes = [definition for definition, in cursor.fetchall()]
+
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'", [table]
+    )
+    foreign_keys = [f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}' for name, definition in cursor.fetchall()]
+
+    return indexes, foreign_keys
+
+
+def rebuild_table(cursor, partitioned):
+    """
+    Copies the calls to a new calls table, partitioned or not, with the same indexes and foreign keys
+    """
+    indexes, foreign_keys = table_definitions(cursor, TABLE)
+    previous = f'{TABLE}_previous'
+
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+    sequence = cursor.fetchone()[0]
+    # The sequence of the ids would be dropped with the previous table
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {previous}')
+
+    if partitioned:
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {previous} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            'PARTITION BY RANGE (billing_period)'
+        )
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+
+        cursor.execute(f'SELECT DISTINCT billing_period FROM {previous} WHERE billing_period IS NOT NULL')
+        for period, in cursor.fetchall():
+            cursor.execute(
+                f'CREATE TABLE {partition_name(period)} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                [period, next_period(period)]
+            )
+
+        indexes = [definition for definition in indexes if f'{TABLE}_id_idx' not in definition]
+        indexes.append(f'CREATE INDEX {TABLE}_id_idx ON {TABLE} (id)')
+    else:
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {previous} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        indexes = [definition for definition in indexes if f'{TABLE}_id_idx' not in definition]
+
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {previous}')
+    # The partitions of a partitioned table are dropped with it
+    cursor.execute(f'DROP TABLE {previous}')
+
+    # Created with the names of the previous table, as expected by the next migrations
+    for definition in indexes + foreign_keys:
+        cursor.execute(definition)
+
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id')
+
+
+def partition_calls(cursor):
+    """
+    Converts the calls table into a table partitioned by billing period, with a partition for each period of
+    its calls
+    """
+    rebuild_table(cursor, partitioned=True)
+
+    # A concurrent insert of the same id waits for the lock, then finds the other row as it was committed
+    cursor.execute(f"""
+        CREATE FUNCTION {UNIQUE_ID_TRIGGER}() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock('{TABLE}'::regclass::oid::integer, NEW.id);
+            IF (SELECT count(*) FROM {TABLE} WHERE id = NEW.id) > 1 THEN
+                RAISE unique_violation USING MESSAGE = format('Key (id)=(%s) of {TABLE} already exists.', NEW.id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute(
+        f'CREATE TRIGGER {UNIQUE_ID_TRIGGER} AFTER INSERT ON {TABLE} '
+        f'FOR EACH ROW EXECUTE PROCEDURE {UNIQUE_ID_TRIGGER}()'
+    )
+
+
+def unpartition_calls(cursor):
+    """
+    Converts the partitioned calls table back into a table with all the calls of the attached partitions
+    """
+    rebuild_table(cursor, partitioned=False)
+    cursor.execute(f'DROP FUNCTION {UNIQUE_ID_TRIGGER}()')
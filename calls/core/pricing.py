@@ -0,0 +1,204 @@
+import calendar
+from bisect import bisect_right
+from collections import namedtuple
+from decimal import Decimal
+
+import numpy as np
+
+
+DAY = 24 * 60 * 60
+
+Segment = namedtuple('Segment', ['start', 'end', 'rule_id', 'standing_charge', 'minute_call_charge'])
+
+# The segments as NumPy arrays, with charges in cents, for pricing many calls at once
+SegmentArrays = namedtuple('SegmentArrays', ['starts', 'ends', 'standing_charges', 'minute_call_charges',
+                                             'prefix_charges', 'day_charge'])
+
+
+def seconds_of_day(value):
+    """
+    Return the seconds since midnight of a time.
+    """
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def cents(value):
+    """
+    Return a charge (Decimal with 2 decimal places) in cents.
+    """
+    return int(value * 100)
+
+
+def epoch_seconds(timestamp):
+    """
+    Return the whole seconds since the epoch of a datetime (UTC if naive). Microseconds are dropped.
+    """
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+class PricingSchedule:
+    """
+    Pricing rules compiled for pricing calls without queries.
+
+    The day is split in contiguous segments, sorted by their start in seconds of the day. Rules that pass
+    from one day to another (e.g. 22:00 to 06:00) are split at midnight and the day times without a rule
+    are filled with segments without charges.
+
+    The call charge of each whole segment is summed up front (prefix_charges), so a price is calculated in
+    constant time whatever the call duration: the head of the first day, the whole days in between and
+    the tail of the last day.
+    """
+    __slots__ = ('segments', 'starts', 'prefix_charges', 'day_charge', 'arrays')
+
+    def __init__(self, rules):
+        segments = []
+
+        for rule in rules:
+            start = seconds_of_day(rule.start_time)
+            end = seconds_of_day(rule.end_time)
+            charges = (rule.id, rule.standing_charge, rule.minute_call_charge)
+
+            if start < end:
+                segments.append(Segment(start, end, *charges))
+            else:
+                segments.append(Segment(start, DAY, *charges))
+                if end > 0:
+                    segments.append(Segment(0, end, *charges))
+
+        segments.sort()
+
+        contiguous = []
+        position = 0
+        for segment in segments:
+            if segment.start > position:
+                contiguous.append(Segment(position, segment.start, None, Decimal('0.00'), Decimal('0.00')))
+            if segment.end > position:
+                contiguous.append(segment._replace(start=max(segment.start, position)))
+                position = segment.end
+
+        if contiguous and position < DAY:
+            contiguous.append(Segment(position, DAY, None, Decimal('0.00'), Decimal('0.00')))
+
+        self.segments = tuple(contiguous)
+        self.starts = tuple(segment.start for segment in contiguous)
+
+        prefix_charges = [Decimal('0.00')]
+        for segment in contiguous:
+            prefix_charges.append(
+                prefix_charges[-1] + (segment.end - segment.start) // 60 * segment.minute_call_charge
+            )
+
+        self.prefix_charges = tuple(prefix_charges)
+        self.day_charge = prefix_charges[-1]
+
+        self.arrays = SegmentArrays(
+            starts=np.array(self.starts, dtype=np.int64),
+            ends=np.array([segment.end for segment in contiguous], dtype=np.int64),
+            standing_charges=np.array([cents(segment.standing_charge) for segment in contiguous], dtype=np.int64),
+            minute_call_charges=np.array([cents(segment.minute_call_charge) for segment in contiguous],
+                                         dtype=np.int64),
+            prefix_charges=np.array([cents(charge) for charge in prefix_charges], dtype=np.int64),
+            day_charge=cents(self.day_charge),
+        )
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError("PricingSchedule is immutable")
+        super().__setattr__(name, value)
+
+    def segment_index(self, seconds):
+        """
+        Return the index of the segment of a time, in seconds of the day.
+        """
+        return bisect_right(self.starts, seconds) - 1
+
+    def call_charge(self, start, end):
+        """
+        Return the call charge between two times of the same day, in seconds of the day (end up to DAY).
+        Minutes are truncated in each segment.
+        """
+        if end <= start:
+            return Decimal('0.00')
+
+        first = self.segment_index(start)
+        last = self.segment_index(end - 1)
+        head = self.segments[first]
+
+        if first == last:
+            return (end - start) // 60 * head.minute_call_charge
+
+        tail = self.segments[last]
+
+        return (head.end - start) // 60 * head.minute_call_charge \
+            + self.prefix_charges[last] - self.prefix_charges[first + 1] \
+            + (end - tail.start) // 60 * tail.minute_call_charge
+
+    def price(self, start_timestamp, end_timestamp):
+        """
+        Return the price of a call: the standing charge of the rule in force when the call starts plus the
+        call charge of each rule, by whole minutes in each rule time.
+        """
+        if not self.segments:
+            return Decimal('0.00')
+
+        start_day, start = divmod(epoch_seconds(start_timestamp), DAY)
+        end_day, end = divmod(epoch_seconds(end_timestamp), DAY)
+
+        standing_charge = self.segments[self.segment_index(start)].standing_charge
+
+        if end_day < start_day:
+            return standing_charge
+
+        if start_day == end_day:
+            return self.call_charge(start, end) + standing_charge
+
+        return self.call_charge(start, DAY) \
+            + (end_day - start_day - 1) * self.day_charge \
+            + self.call_charge(0, end) \
+            + standing_charge
+
+    def call_charges(self, starts, ends):
+        """
+        Vectorized call_charge(): return the call charges in cents between arrays of times of the same day.
+        """
+        arrays = self.arrays
+
+        first = np.searchsorted(arrays.starts, starts, side='right') - 1
+        last = np.searchsorted(arrays.starts, np.maximum(ends - 1, 0), side='right') - 1
+
+        single = (ends - starts) // 60 * arrays.minute_call_charges[first]
+        multiple = (arrays.ends[first] - starts) // 60 * arrays.minute_call_charges[first] \
+            + arrays.prefix_charges[last] - arrays.prefix_charges[first + 1] \
+            + (ends - arrays.starts[last]) // 60 * arrays.minute_call_charges[last]
+
+        charges = np.where(first == last, single, multiple)
+
+        return np.where(ends > starts, charges, 0)
+
+    def price_many(self, starts, ends):
+        """
+        Return the prices of many calls, given the sequences of their start and end times in seconds since
+        the epoch. Same results of price(), calculated with NumPy in cents.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        if not self.segments:
+            return [Decimal('0.00')] * len(starts)
+
+        arrays = self.arrays
+
+        start_days, start_times = np.divmod(starts, DAY)
+        end_days, end_times = np.divmod(ends, DAY)
+
+        standing_charges = arrays.standing_charges[np.searchsorted(arrays.starts, start_times, side='right') - 1]
+
+        same_day = self.call_charges(start_times, end_times)
+        many_days = self.call_charges(start_times, np.full_like(start_times, DAY)) \
+            + (end_days - start_days - 1) * arrays.day_charge \
+            + self.call_charges(np.zeros_like(end_times), end_times)
+
+        call_charges = np.where(start_days == end_days, same_day, many_days)
+        call_charges = np.where(end_days < start_days, 0, call_charges)
+
+        return [Decimal(int(price)).scaleb(-2) for price in call_charges + standing_charges]
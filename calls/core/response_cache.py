@@ -0,0 +1,113 @@
+"""
+Cache of the bill and call responses of the API, in the cache RESPONSE_CACHE_ALIAS of CACHES (disabled by default,
+or a backend of the Django cache framework shared by all the processes: Redis, Memcached, database).
+
+Cached responses are never deleted: their keys include the versions of the subscriber's bill of the period or of
+the call, changed by the writes of their calls (calls_changed signal), and a generation of all the responses,
+changed by the writes of the pricing rules. The responses of the previous versions are no longer read and are
+evicted by the backend when it is full (MAX_ENTRIES) or expire after their TIMEOUT.
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+# Version of all the cached responses
+GENERATION_KEY = 'responses:generation'
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def bill_version_key(subscriber, period):
+    return f'responses:bill:{subscriber}:{period}'
+
+
+def call_version_key(call_id):
+    return f'responses:call:{call_id}'
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+def versions(keys):
+    """
+    Returns the current versions of the keys. A missing version (never set or evicted) is set to a new one,
+    so the responses cached with a previous one are not read.
+    """
+    cache = response_cache()
+    values = cache.get_many(keys)
+
+    for key in keys:
+        if key not in values:
+            version = new_version()
+            # Another request can set it first: its version is the one kept
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key) or version
+            values[key] = version
+
+    return values
+
+
+def response_key(version_key, *variant):
+    """
+    Returns the key of a response with the current versions of its object, for a variant of the response
+    (its parameters). It must be taken before the response is read from the database, so a response read
+    while its object is changed is cached with a version already replaced.
+    """
+    values = versions([GENERATION_KEY, version_key])
+    content = json.dumps([values[GENERATION_KEY], values[version_key], *variant])
+    return f'{version_key}:{hashlib.sha1(content.encode()).hexdigest()}'
+
+
+def bill_key(subscriber, period, *variant):
+    return response_key(bill_version_key(subscriber, period), *variant)
+
+
+def call_key(call_id, *variant):
+    return response_key(call_version_key(call_id), *variant)
+
+
+def lookup(key):
+    return response_cache().get(key)
+
+
+def store(key, value):
+    response_cache().set(key, value)
+
+
+def invalidate(keys):
+    """
+    Replaces the versions of the keys. In a transaction they are replaced again when it is committed, as other
+    requests can read and cache the previous data with the new versions until then.
+    """
+    def replace():
+        response_cache().set_many({key: new_version() for key in keys}, timeout=None)
+
+    replace()
+
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(replace)
+
+
+def invalidate_calls(calls):
+    """
+    Invalidates the cached responses of the calls and of the bills with them
+    """
+    keys = {call_version_key(call.id) for call in calls if call.id}
+    keys.update(
+        bill_version_key(call.source, call.billing_period) for call in calls if call.source and call.billing_period
+    )
+
+    if keys:
+        invalidate(keys)
+
+
+def invalidate_all():
+    invalidate([GENERATION_KEY])
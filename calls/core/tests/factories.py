@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from calls.core.models.call import CallDetail
+
+
+def create_call(call_id, start, end=None, source="99988526423", destination="9933468278",
+                duration=timedelta(minutes=20, seconds=40)):
+    """
+    Creates the start and end records of a call, ending at end or, without it, after duration
+    """
+    CallDetail.objects.create(
+        type=CallDetail.START,
+        timestamp=start,
+        source=source,
+        destination=destination,
+        call_id=call_id,
+    )
+    CallDetail.objects.create(
+        type=CallDetail.END,
+        timestamp=end or start + duration,
+        call_id=call_id,
+    )
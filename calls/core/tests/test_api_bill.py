@@ -1,12 +1,21 @@
 from datetime import datetime
+from decimal import Decimal
+from io import StringIO
 import pytz
 
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import override_settings
+
 from rest_framework import status
 from rest_framework.test import APITestCase
 
 from freezegun import freeze_time
 
-from calls.core.models.call import CallDetail
+from calls.core.models.bill import Bill
+from calls.core.models.call import CallDetail, Call
+from calls.core.models.pricing_rule import PricingRule
+from calls.core.tests.factories import create_call
 
 
 class APIBillListTest(APITestCase):
@@ -78,6 +87,12 @@ class APIBillListTest(APITestCase):
         expected_response = {
             "subscriber": "99988526423",
             "period": "09/2018",
+            "summary": {
+                "call_count": 1,
+                "total_seconds": 1240,
+                "total_duration": "0h20m40s",
+                "total_price": "0.54"
+            },
             "calls": [
                 {
                     "destination": "9933468278",
@@ -104,6 +119,12 @@ class APIBillListTest(APITestCase):
         expected_response = {
             "subscriber": "99988526423",
             "period": "09/2018",
+            "summary": {
+                "call_count": 1,
+                "total_seconds": 1240,
+                "total_duration": "0h20m40s",
+                "total_price": "0.54"
+            },
             "calls": [
                 {
                     "destination": "9933468278",
@@ -130,6 +151,12 @@ class APIBillListTest(APITestCase):
         expected_response = {
             "subscriber": "99988526423",
             "period": "08/2018",
+            "summary": {
+                "call_count": 1,
+                "total_seconds": 87640,
+                "total_duration": "24h20m40s",
+                "total_price": "86.94"
+            },
             "calls": [
                 {
                     "destination": "9933468278",
@@ -147,6 +174,42 @@ class APIBillListTest(APITestCase):
         )
 
 
+@freeze_time("2018-10-20")
+class APIBillQueriesTest(APITestCase):
+    """
+    (GET) /api/bill/?subscriber=<source>&period=<MM/YYYY>
+    Should run the same number of queries whatever the number of calls of the bill
+    """
+    fixtures = ['pricingrule.json']
+
+    def create_calls(self, first_call_id, count):
+        for call_id in range(first_call_id, first_call_id + count):
+            CallDetail.objects.create(
+                type=CallDetail.START,
+                timestamp=datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC),
+                source="99988526423",
+                destination="9933468278",
+                call_id=call_id,
+            )
+            CallDetail.objects.create(
+                type=CallDetail.END,
+                timestamp=datetime(2018, 9, 29, 22, 17, 53, tzinfo=pytz.UTC),
+                call_id=call_id,
+            )
+
+    def test_constant_number_of_queries(self):
+        self.create_calls(1, 1)
+        with self.assertNumQueries(5):
+            self.client.get('/api/bill/?subscriber=99988526423&period=09/2018')
+
+        self.create_calls(2, 50)
+        with self.assertNumQueries(5):
+            self.response = self.client.get('/api/bill/?subscriber=99988526423&period=09/2018')
+
+        self.assertEqual(51, len(self.response.data['calls']))
+        self.assertEqual("0h20m40s", self.response.data['calls'][-1]['duration'])
+
+
 class APIBillListParametersValidationTest(APITestCase):
     """
     (GET) /api/bill/?subscriber=<source>&period=<MM/YYYY>
@@ -193,3 +256,226 @@ class APIBillListParametersValidationTest(APITestCase):
 
         expected_message = "Invalid format for the period. Enter the month and year in MM/YYYY format"
         self.assertEqual(expected_message, self.response.data)
+
+
+@freeze_time("2018-11-15")
+class APIBillMaterializedTest(APITestCase):
+    """
+    (GET) /api/bill/?subscriber=<source>&period=<MM/YYYY>
+    Should return the bill materialized when the period was closed
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=80,
+        )
+        CallDetail.objects.create(
+            type=CallDetail.END,
+            timestamp=datetime(2018, 9, 29, 22, 17, 53, tzinfo=pytz.UTC),
+            call_id=80,
+        )
+
+        Bill.close_period(201809)
+
+    def test_materialized_bill(self):
+        # Changed with an update (without signals), so only the materialized bill has the old price
+        Call.objects.filter(id=80).update(price=0)
+
+        response = self.client.get('/api/bill/?subscriber=99988526423&period=09/2018')
+
+        expected_calls = [{
+            "destination": "9933468278",
+            "start_date": "2018-09-29",
+            "start_time": "21:57:13",
+            "duration": "0h20m40s",
+            "price": "0.54"
+        }]
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(expected_calls, response.json()['calls'])
+
+    def test_changed_while_closed(self):
+        # Changed by a concurrent request whose invalidation did not see the bill being built
+        Call.objects.filter(id=80).update(price=0, updated_at=datetime(2018, 11, 15, 0, 0, 1, tzinfo=pytz.UTC))
+
+        response = self.client.get('/api/bill/?subscriber=99988526423&period=09/2018')
+        self.assertEqual("0.00", response.json()['calls'][0]['price'])
+
+        response = self.client.post('/api/bill/batch/', {'subscribers': ["99988526423"], 'period': '09/2018'},
+                                    format='json')
+        self.assertEqual("0.00", response.json()['bills'][0]['calls'][0]['price'])
+
+
+@freeze_time("2018-10-20")
+class APIBillSummaryTest(APITestCase):
+    """
+    (GET) /api/bill/?subscriber=<source>&period=<MM/YYYY>&summary_only=true
+    Should return the totals of the bill, computed by the database
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        # Two calls started in the standard time (rule 1) and one in the reduced time (rule 2)
+        for call_id, hour, minutes in ((1, 12, 10), (2, 21, 20), (3, 23, 5)):
+            CallDetail.objects.create(
+                type=CallDetail.START,
+                timestamp=datetime(2018, 9, 29, hour, 0, 0, tzinfo=pytz.UTC),
+                source="99988526423",
+                destination="9933468278",
+                call_id=call_id,
+            )
+            CallDetail.objects.create(
+                type=CallDetail.END,
+                timestamp=datetime(2018, 9, 29, hour, minutes, 0, tzinfo=pytz.UTC),
+                call_id=call_id,
+            )
+
+        # Warms the compiled pricing rules
+        PricingRule.schedule()
+
+    def tearDown(self):
+        PricingRule.clear_schedule()
+
+    def test_summary_only(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/bill/?subscriber=99988526423&period=09/2018&summary_only=true')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            "subscriber": "99988526423",
+            "period": "09/2018",
+            "summary": {
+                "call_count": 3,
+                "total_seconds": 2100,
+                "total_duration": "0h35m0s",
+                "total_price": "3.78"
+            }
+        })
+
+    def test_summary_of_the_calls(self):
+        response = self.client.get('/api/bill/?subscriber=99988526423&period=09/2018')
+
+        self.assertEqual(3, response.data['summary']['call_count'])
+        self.assertEqual(
+            sum(Decimal(call['price']) for call in response.data['calls']),
+            Decimal(response.data['summary']['total_price'])
+        )
+
+    def test_summary_without_calls(self):
+        response = self.client.get('/api/bill/?subscriber=99988526424&period=09/2018&summary_only=true')
+
+        self.assertEqual({
+            "call_count": 0,
+            "total_seconds": 0,
+            "total_duration": "0h0m0s",
+            "total_price": "0.00"
+        }, response.data['summary'])
+
+    def test_batch_summary_only(self):
+        # The totals and the archive of the period
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/bill/batch/', {
+                'subscribers': ["99988526423", "99988526424"],
+                'period': '09/2018',
+                'summary_only': True,
+            }, format='json')
+
+        self.assertEqual(['summary', 'summary'], [
+            key for bill in response.data['bills'] for key in bill if key not in ('subscriber', 'period')
+        ])
+        self.assertEqual([3, 0], [bill['summary']['call_count'] for bill in response.data['bills']])
+
+
+@freeze_time("2018-10-20")
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'responses'},
+})
+class APIBillConditionalTest(APITestCase):
+    """
+    (GET) /api/bill/?subscriber=<source>&period=<MM/YYYY> with If-None-Match
+    Should return 304 Not Modified while the calls of the bill do not change
+    """
+    fixtures = ['pricingrule.json']
+    url = '/api/bill/?subscriber=99988526423&period=09/2018'
+
+    def setUp(self):
+        create_call(80, datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC))
+        PricingRule.schedule()
+        self.response = self.client.get(self.url)
+
+    def tearDown(self):
+        PricingRule.clear_schedule()
+
+    def test_cache_headers(self):
+        self.assertTrue(self.response['ETag'].startswith('"'))
+        self.assertNotIn('Last-Modified', self.response)
+        self.assertEqual(
+            {'public', 'max-age=60', 's-maxage=0', 'must-revalidate'},
+            set(self.response['Cache-Control'].split(', '))
+        )
+        self.assertEqual({'Accept', 'Authorization', 'Cookie'}, set(self.response['Vary'].split(', ')))
+
+    def test_not_modified(self):
+        # The fingerprint of the bill is cached with its response
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.response['ETag'])
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(b'', response.content)
+        self.assertEqual(self.response['ETag'], response['ETag'])
+
+    def test_not_modified_not_cached(self):
+        caches['responses'].clear()
+
+        # The fingerprint of the calls and the archive of the period
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.response['ETag'])
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_modified_since_not_checked(self):
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE='Sun, 21 Oct 2018 00:00:00 GMT')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_modified_by_new_call(self):
+        with freeze_time("2018-10-21"):
+            create_call(81, datetime(2018, 9, 29, 23, 0, 0, tzinfo=pytz.UTC))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.response['ETag'])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(self.response['ETag'], response['ETag'])
+        self.assertEqual(2, len(response.data['calls']))
+
+    def test_modified_by_removed_call(self):
+        create_call(81, datetime(2018, 9, 29, 23, 0, 0, tzinfo=pytz.UTC))
+        response = self.client.get(self.url)
+
+        with freeze_time("2018-10-21"):
+            CallDetail.objects.get(type=CallDetail.START, call_id=81).delete()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(1, len(response.data['calls']))
+
+    def test_modified_by_repricing(self):
+        with freeze_time("2018-10-21"):
+            call_command('reprice_calls', '--period', '09/2018', stdout=StringIO())
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.response['ETag'])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_other_representations(self):
+        summary = self.client.get(self.url + '&summary_only=true')
+        stream = self.client.get(self.url + '&stream=true')
+
+        self.assertEqual(3, len({self.response['ETag'], summary['ETag'], stream['ETag']}))
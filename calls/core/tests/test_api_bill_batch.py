@@ -0,0 +1,145 @@
+import json
+from datetime import datetime
+from io import StringIO
+import pytz
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from freezegun import freeze_time
+
+from calls.core.tests.factories import create_call
+from calls.core.util.db import SQLITE_MAX_VARIABLES
+
+
+@freeze_time("2018-10-20")
+class APIBillBatchTest(APITestCase):
+    """
+    (POST) /api/bill/batch/
+    Should return the bills of many subscribers, as returned one by one by /api/bill/
+    """
+    fixtures = ['pricingrule.json']
+
+    def create_calls(self, source, first_call_id, count, month=9):
+        for call_id in range(first_call_id, first_call_id + count):
+            create_call(call_id, datetime(2018, month, 20, 21, 57, 13, tzinfo=pytz.UTC), source=source)
+
+    def bill(self, subscriber, period='09/2018'):
+        response = self.client.get(f'/api/bill/?subscriber={subscriber}&period={period}')
+        return json.loads(response.content.decode())
+
+    def test_same_bills(self):
+        self.create_calls("99988526423", 1, 2)
+        self.create_calls("99988526424", 3, 1)
+        self.create_calls("99988526423", 4, 1, month=8)
+        subscribers = ["99988526424", "99988526423", "99988526425"]
+
+        # The totals, the archive of the period, the materialized bills and the calls of the others
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/bill/batch/', {'subscribers': subscribers, 'period': '09/2018'},
+                                        format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {'period': '09/2018', 'bills': [self.bill(subscriber) for subscriber in subscribers]},
+            json.loads(response.content.decode())
+        )
+        self.assertEqual([1, 2, 0], [len(bill['calls']) for bill in response.data['bills']])
+
+    def test_materialized_bills(self):
+        self.create_calls("99988526423", 1, 2)
+        call_command('close_period', '--period', '09/2018', stdout=StringIO())
+        self.create_calls("99988526424", 3, 1)
+        subscribers = ["99988526423", "99988526424"]
+
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/bill/batch/', {'subscribers': subscribers, 'period': '09/2018'},
+                                        format='json')
+
+        self.assertEqual(
+            [self.bill(subscriber) for subscriber in subscribers],
+            json.loads(response.content.decode())['bills']
+        )
+
+    def test_max_subscribers(self):
+        subscribers = [f"9998852{number:04d}" for number in range(settings.BILL_BATCH_MAX_SUBSCRIBERS)]
+        self.create_calls(subscribers[0], 1, 1)
+        self.create_calls(subscribers[-1], 2, 1)
+        call_command('close_period', '--period', '09/2018', stdout=StringIO())
+        self.create_calls(subscribers[500], 3, 1)
+
+        queries = []
+
+        def count_parameters(execute, sql, params, many, context):
+            queries.append(len(params or ()))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_parameters):
+            response = self.client.post('/api/bill/batch/', {'subscribers': subscribers, 'period': '09/2018'},
+                                        format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(all(parameters <= SQLITE_MAX_VARIABLES for parameters in queries), msg=queries)
+        self.assertEqual(
+            [subscribers[0], subscribers[500], subscribers[-1]],
+            [bill['subscriber'] for bill in response.data['bills'] if len(bill['calls']) == 1]
+        )
+
+    def test_last_month_without_repetitions(self):
+        self.create_calls("99988526423", 1, 1)
+
+        response = self.client.post('/api/bill/batch/', {'subscribers': ["99988526423", "99988526423"]},
+                                    format='json')
+
+        self.assertEqual('09/2018', response.data['period'])
+        self.assertEqual(1, len(response.data['bills']))
+        self.assertEqual(1, len(response.data['bills'][0]['calls']))
+
+
+@freeze_time("2018-10-20")
+class APIBillBatchValidationTest(APITestCase):
+    """
+    (POST) /api/bill/batch/
+    Should validate the subscribers and the period
+    """
+
+    def post(self, data):
+        return self.client.post('/api/bill/batch/', data, format='json')
+
+    def test_without_subscribers(self):
+        for data in ({}, {'subscribers': []}, {'subscribers': "99988526423"}, ["99988526423"]):
+            response = self.post(data)
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, msg=data)
+            self.assertEqual("Use the subscribers field to inform a list of subscribers' phone numbers", response.data)
+
+    def test_invalid_subscribers(self):
+        response = self.post({'subscribers': ["99988526423", "9998852642a", 99988526424]})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            "Invalid subscribers: 9998852642a, 99988526424. Length of 10 to 11 characters, only digits",
+            response.data
+        )
+
+    @override_settings(BILL_BATCH_MAX_SUBSCRIBERS=2)
+    def test_too_many_subscribers(self):
+        response = self.post({'subscribers': ["99988526423", "99988526424", "99988526425"]})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual("Inform up to 2 subscribers", response.data)
+
+    def test_invalid_period(self):
+        for period, msg in (
+                ('2018-09', 'Invalid format for the period. Enter the month and year in MM/YYYY format'),
+                (201809, 'Invalid format for the period. Enter the month and year in MM/YYYY format'),
+                ('10/2018', 'You can only get bills which period are already closed'),
+        ):
+            response = self.post({'subscribers': ["99988526423"], 'period': period})
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, msg=period)
+            self.assertEqual(msg, response.data)
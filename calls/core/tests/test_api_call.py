@@ -54,9 +54,25 @@ class APICallListTest(APITestCase):
         self.maxDiff = None
         self.assertJSONEqual(
             str(self.response.content, encoding='utf8'),
-            self.expected
+            {'next': None, 'previous': None, 'results': self.expected}
+        )
+
+    def test_pages(self):
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=71,
         )
 
+        response = self.client.get('/api/call/?page_size=1')
+        self.assertEqual([70], [call['id'] for call in response.data['results']])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([71], [call['id'] for call in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
 
 class APICallRetrieve(APITestCase):
     """
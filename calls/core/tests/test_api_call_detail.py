@@ -1,9 +1,11 @@
 from datetime import datetime
+from unittest import mock
 import pytz
 
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from calls.core.api.viewsets import CallDetailViewSet
 from calls.core.models.call import CallDetail
 
 
@@ -37,7 +39,7 @@ class APICallDetailListTest(APITestCase):
         self.assertEqual(self.response.status_code, status.HTTP_200_OK)
 
     def test_response(self):
-        expected_response = [
+        expected_results = [
             {
                 "url": "http://testserver/api/call-detail/1/",
                 "id": 1,
@@ -61,9 +63,66 @@ class APICallDetailListTest(APITestCase):
         self.maxDiff = None
         self.assertJSONEqual(
             str(self.response.content, encoding='utf8'),
-            expected_response
+            {'next': None, 'previous': None, 'results': expected_results}
         )
 
+    def test_pages_ordered_by_timestamp(self):
+        start = CallDetail.objects.get(type=CallDetail.START, call_id=70)
+        end = CallDetail.objects.get(type=CallDetail.END, call_id=70)
+
+        # Same timestamp of the first record, created later
+        later = CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2018, 7, 31, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=71,
+        )
+
+        ids = []
+        url = '/api/call-detail/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            ids += [record['id'] for record in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual([start.id, later.id, end.id], ids)
+
+    def test_pages_of_many_records_with_same_timestamp(self):
+        # More records with the same timestamp than an offset could skip (e.g. a bulk import)
+        timestamp = datetime(2018, 7, 31, 21, 57, 13, tzinfo=pytz.UTC)
+        CallDetail.objects.bulk_create([
+            CallDetail(type=CallDetail.START, timestamp=timestamp, source="99988526423",
+                       destination="9933468278", call_id=call_id)
+            for call_id in range(100, 1400)
+        ])
+        expected = list(CallDetail.objects.order_by('timestamp', 'id').values_list('id', flat=True))
+
+        ids = []
+        url = '/api/call-detail/?page_size=200'
+        while url:
+            response = self.client.get(url)
+            ids += [record['id'] for record in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(expected, ids)
+
+        # And back from the last page
+        last_page = len(response.data['results'])
+        previous_ids = []
+        url = response.data['previous']
+        while url:
+            response = self.client.get(url)
+            previous_ids = [record['id'] for record in response.data['results']] + previous_ids
+            url = response.data['previous']
+
+        self.assertEqual(expected[:-last_page], previous_ids)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/call-detail/?cursor=cD1ub3QtYS10aW1lJnA9MQ==')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class APIStartCallDetailCreateTest(APITestCase):
     """
@@ -770,6 +829,44 @@ class APICallDetailCreateUniqueTypeCallValidation(APITestCase):
         )
 
 
+class APICallDetailCreateConcurrentUniqueTypeCallValidation(APITestCase):
+    """
+    A record saved by a concurrent request after the lookup of the record sent before should be rejected
+    by the database, with the same message.
+    """
+
+    def test_unique_type_validation_after_lookup(self):
+        save_record = CallDetailViewSet.save_record
+
+        def save_after_concurrent_request(view, serializer):
+            CallDetail.objects.create(
+                type=CallDetail.START,
+                timestamp="2016-02-29T12:00:00Z",
+                source="99988526423",
+                destination="9933468278",
+                call_id=70,
+            )
+            save_record(view, serializer)
+
+        payload = {
+            'type': CallDetail.START,
+            'timestamp': "2016-02-29T10:00:00Z",
+            'source': "99988526423",
+            'destination': "9933468278",
+            'call_id': 70,
+        }
+
+        with mock.patch.object(CallDetailViewSet, 'save_record', save_after_concurrent_request):
+            response = self.client.post('/api/call-detail/', payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data['validation_error'],
+            ["A detail record with this type and call id has already been sent. Delete it before resend it."]
+        )
+        self.assertEqual(1, CallDetail.objects.filter(call_id=70).count())
+
+
 class APICallDetailCallIdValidation(APITestCase):
     """
     Call Details with invalid id should be rejected.
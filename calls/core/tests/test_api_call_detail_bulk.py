@@ -0,0 +1,295 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+import pytz
+
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from calls.core.models.call import CallDetail, Call
+
+
+class APICallDetailBulkCreateTest(APITestCase):
+    """
+    (POST) /api/call-detail/bulk/
+    It should create many call detail records at once and pair them into calls
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+
+        payload = [
+            {
+                'type': CallDetail.START,
+                'timestamp': "2016-02-29T21:57:13Z",
+                'source': "99988526423",
+                'destination': "9933468278",
+                'call_id': 70,
+            },
+            {
+                'type': CallDetail.END,
+                'timestamp': "2016-02-29T22:17:53Z",
+                'call_id': 70,
+            },
+            {
+                'type': CallDetail.END,
+                'timestamp': "2016-02-29T14:00:00Z",
+                'call_id': 71,
+            },
+        ]
+
+        self.response = self.client.post('/api/call-detail/bulk/', payload, format='json')
+
+    def test_post(self):
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+
+    def test_response(self):
+        expected_response = {
+            'created': 3,
+            'errors': [],
+        }
+        self.assertJSONEqual(
+            str(self.response.content, encoding='utf8'),
+            expected_response
+        )
+
+    def test_details_created(self):
+        self.assertEqual(CallDetail.objects.count(), 3)
+
+    def test_calls_created(self):
+        call = Call.objects.get(id=70)
+        self.assertEqual(call.detail_start.type, CallDetail.START)
+        self.assertEqual(call.detail_end.type, CallDetail.END)
+        self.assertEqual(call.duration, "0h20m40s")
+        self.assertEqual(call.price, Decimal('0.54'))
+        self.assertEqual(call.source, "99988526423")
+        self.assertEqual(call.billing_period, 201602)
+
+        call = Call.objects.get(id=71)
+        self.assertIsNone(call.detail_start)
+        self.assertEqual(call.detail_end.type, CallDetail.END)
+        self.assertEqual(call.price, Decimal('0.00'))
+
+
+class APICallDetailBulkUpdateCallTest(APITestCase):
+    """
+    (POST) /api/call-detail/bulk/
+    It should complete the calls which already have one of their records
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=70,
+        )
+
+        payload = [
+            {
+                'type': CallDetail.END,
+                'timestamp': "2016-02-29T22:17:53Z",
+                'call_id': 70,
+            },
+        ]
+
+        self.response = self.client.post('/api/call-detail/bulk/', payload, format='json')
+
+    def test_post(self):
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+
+    def test_call_updated(self):
+        self.assertEqual(Call.objects.count(), 1)
+        call = Call.objects.get(id=70)
+        self.assertEqual(call.detail_end, CallDetail.objects.get(type=CallDetail.END, call_id=70))
+        self.assertEqual(call.price, Decimal('0.54'))
+        self.assertEqual(call.ended_at, datetime(2016, 2, 29, 22, 17, 53, tzinfo=pytz.UTC))
+        self.assertEqual(call.billing_period, 201602)
+
+
+class APICallDetailBulkValidationTest(APITestCase):
+    """
+    (POST) /api/call-detail/bulk/
+    Valid records should be created and the rejected ones reported by their position
+    """
+
+    def setUp(self):
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2016, 2, 29, 12, 0, 0, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=70,
+        )
+
+        payload = [
+            # Valid
+            {
+                'type': CallDetail.START,
+                'timestamp': "2016-02-29T12:00:00Z",
+                'source': "99988526423",
+                'destination': "9933468278",
+                'call_id': 71,
+            },
+            # Invalid source
+            {
+                'type': CallDetail.START,
+                'timestamp': "2016-02-29T12:00:00Z",
+                'source': "A9988526423",
+                'destination': "9933468278",
+                'call_id': 72,
+            },
+            # Already sent
+            {
+                'type': CallDetail.START,
+                'timestamp': "2016-02-29T12:00:00Z",
+                'source': "99988526423",
+                'destination': "9933468278",
+                'call_id': 70,
+            },
+            # Before the start record of the same batch
+            {
+                'type': CallDetail.END,
+                'timestamp': "2016-02-29T11:00:00Z",
+                'call_id': 71,
+            },
+            # Sent twice in the same batch
+            {
+                'type': CallDetail.START,
+                'timestamp': "2016-02-29T12:00:00Z",
+                'source': "99988526423",
+                'destination': "9933468278",
+                'call_id': 71,
+            },
+        ]
+
+        self.response = self.client.post('/api/call-detail/bulk/', payload, format='json')
+
+    def test_post(self):
+        self.assertEqual(self.response.status_code, status.HTTP_207_MULTI_STATUS)
+
+    def test_response(self):
+        expected_response = {
+            'created': 1,
+            'errors': [
+                {
+                    'index': 1,
+                    'errors': {'source': ["Only numbers are allowed."]},
+                },
+                {
+                    'index': 2,
+                    'errors': {'validation_error': ["A detail record with this type and call id has already been "
+                                                    "sent. Delete it before resend it."]},
+                },
+                {
+                    'index': 3,
+                    'errors': {'validation_error': ["The End Call Detail record must be after than the Start Call "
+                                                    "Detail record"]},
+                },
+                {
+                    'index': 4,
+                    'errors': {'validation_error': ["A detail record with this type and call id has already been "
+                                                    "sent. Delete it before resend it."]},
+                },
+            ]
+        }
+        self.maxDiff = None
+        self.assertJSONEqual(
+            str(self.response.content, encoding='utf8'),
+            expected_response
+        )
+
+    def test_only_valid_records_created(self):
+        self.assertEqual(CallDetail.objects.count(), 2)
+        self.assertTrue(CallDetail.objects.filter(type=CallDetail.START, call_id=71).exists())
+
+    def test_post_all_invalid(self):
+        payload = [{'type': CallDetail.END, 'timestamp': "2016-02-29T12:00:00Z", 'call_id': 0}]
+        response = self.client.post('/api/call-detail/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_post_offset_out_of_range(self):
+        payload = [{'type': CallDetail.END, 'timestamp': "2016-02-29T12:00:00+24:00", 'call_id': 71}]
+        response = self.client.post('/api/call-detail/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('timestamp', response.data['errors'][0]['errors'])
+
+    def test_post_not_a_list(self):
+        response = self.client.post('/api/call-detail/bulk/', {'type': CallDetail.END}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual("Send a list of call detail records", response.data)
+
+
+@override_settings(CALL_DETAIL_BULK_CHUNK_SIZE=2)
+class APICallDetailBulkNDJSONTest(APITestCase):
+    """
+    (POST) /api/call-detail/bulk/ (Content-Type: application/x-ndjson)
+    It should save the records of each line in chunks and stream back one result per line
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        lines = [
+            '{"type": "start", "timestamp": "2016-02-29T21:57:13Z", "source": "99988526423", '
+            '"destination": "9933468278", "call_id": 70}',
+            '',
+            '{"type": "end", "timestamp": "2016-02-29T22:17:53Z", "call_id": 70}',
+            '{"type": "end", "timestamp": "2016-02-29T22:17:53Z", "call_id": 70}',
+            '{"type": "end", "timestamp": ',
+            '{"type": "end", "timestamp": "2016-02-29T14:00:00Z", "call_id": 71}',
+        ]
+
+        self.response = self.client.post(
+            '/api/call-detail/bulk/',
+            '\n'.join(lines),
+            content_type='application/x-ndjson'
+        )
+
+    def test_post(self):
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response['Content-Type'], 'application/x-ndjson')
+
+    def test_response(self):
+        content = b''.join(self.response.streaming_content).decode('utf8')
+        results = [json.loads(line) for line in content.splitlines()]
+
+        expected_results = [
+            {'line': 1, 'status': 'created'},
+            {'line': 3, 'status': 'created'},
+            {
+                'line': 4,
+                'status': 'rejected',
+                'errors': {'validation_error': ["A detail record with this type and call id has already been "
+                                                "sent. Delete it before resend it."]},
+            },
+            {'line': 5, 'status': 'rejected', 'errors': {'validation_error': ["Invalid JSON record."]}},
+            {'line': 6, 'status': 'created'},
+        ]
+
+        self.maxDiff = None
+        self.assertEqual(expected_results, results)
+
+    def test_calls_created(self):
+        b''.join(self.response.streaming_content)
+
+        self.assertEqual(CallDetail.objects.count(), 3)
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
+        self.assertIsNone(Call.objects.get(id=71).detail_start)
+
+    def test_chunked_body(self):
+        # Sent without a Content-Length, which the body is not read without
+        response = self.client.generic(
+            'POST',
+            '/api/call-detail/bulk/',
+            '{"type": "end", "timestamp": "2016-02-29T14:00:00Z", "call_id": 72}',
+            content_type='application/x-ndjson',
+            CONTENT_LENGTH='',
+            HTTP_TRANSFER_ENCODING='chunked',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_411_LENGTH_REQUIRED)
+        self.assertFalse(CallDetail.objects.filter(call_id=72).exists())
@@ -0,0 +1,138 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from freezegun import freeze_time
+
+from calls.core.models.call import CallDetail
+from calls.core.models.idempotency_key import IdempotencyKey
+
+
+class APICallDetailIdempotencyKeyTest(APITestCase):
+    """
+    (POST) /api/call-detail/ with an Idempotency-Key header
+    A request retried with the same key should return the first response, without saving the record again.
+    """
+
+    def setUp(self):
+        self.payload = {
+            'type': CallDetail.START,
+            'timestamp': "2016-02-29T12:00:00Z",
+            'source': "99988526423",
+            'destination': "9933468278",
+            'call_id': 70,
+        }
+
+        self.response = self.client.post('/api/call-detail/', self.payload, HTTP_IDEMPOTENCY_KEY='a1')
+
+    def test_retry_returns_first_response(self):
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/call-detail/', self.payload, HTTP_IDEMPOTENCY_KEY='a1')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.data, self.response.data)
+        self.assertEqual(1, CallDetail.objects.count())
+
+    def test_rejected_response_is_stored(self):
+        payload = dict(self.payload, type=CallDetail.END, call_id=-1)
+        first = self.client.post('/api/call-detail/', payload, HTTP_IDEMPOTENCY_KEY='b1')
+        response = self.client.post('/api/call-detail/', payload, HTTP_IDEMPOTENCY_KEY='b1')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, first.data)
+
+    def test_key_of_another_request(self):
+        payload = dict(self.payload, call_id=71)
+        response = self.client.post('/api/call-detail/', payload, HTTP_IDEMPOTENCY_KEY='a1')
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertFalse(CallDetail.objects.filter(call_id=71).exists())
+
+    def test_key_too_long(self):
+        payload = dict(self.payload, call_id=71)
+        response = self.client.post('/api/call-detail/', payload, HTTP_IDEMPOTENCY_KEY='a' * 256)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_retry(self):
+        records = [
+            dict(self.payload, call_id=71),
+            {'type': CallDetail.END, 'timestamp': "2016-02-29T14:00:00Z", 'call_id': 71},
+        ]
+        first = self.client.post('/api/call-detail/bulk/', records, format='json', HTTP_IDEMPOTENCY_KEY='c1')
+        response = self.client.post('/api/call-detail/bulk/', records, format='json', HTTP_IDEMPOTENCY_KEY='c1')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, first.data)
+        self.assertEqual(2, CallDetail.objects.filter(call_id=71).count())
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=60)
+    def test_expired_key(self):
+        stored_at = IdempotencyKey.objects.get().created_at
+
+        with freeze_time(stored_at + timedelta(seconds=61)):
+            response = self.client.post('/api/call-detail/', self.payload, HTTP_IDEMPOTENCY_KEY='a1')
+
+        # Answered again, by the natural key of the record, and stored again
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(1, CallDetail.objects.count())
+        self.assertGreater(IdempotencyKey.objects.get().created_at, stored_at)
+
+
+class APICallDetailNaturalKeyTest(APITestCase):
+    """
+    (POST) /api/call-detail/ without an Idempotency-Key header
+    A record sent again with the same type, call id and fields should not be saved again.
+    """
+
+    def setUp(self):
+        self.payload = {
+            'type': CallDetail.END,
+            'timestamp': "2016-02-29T14:00:00Z",
+            'call_id': 70,
+        }
+
+        self.response = self.client.post('/api/call-detail/', self.payload)
+
+    def test_same_record(self):
+        response = self.client.post('/api/call-detail/', self.payload)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.data, self.response.data)
+        self.assertEqual(1, CallDetail.objects.count())
+
+    def test_other_record_with_same_type_and_call_id(self):
+        response = self.client.post('/api/call-detail/', dict(self.payload, timestamp="2016-02-29T15:00:00Z"))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data['validation_error'],
+            ["A detail record with this type and call id has already been sent. Delete it before resend it."]
+        )
+
+
+class PurgeIdempotencyKeysCommandTest(APITestCase):
+    """
+    manage.py purge_idempotency_keys
+    Should delete the keys older than IDEMPOTENCY_KEY_TTL
+    """
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=60)
+    def test_purge(self):
+        with freeze_time("2016-03-15 12:00:00"):
+            IdempotencyKey.store('old', 'hash', 201, {})
+
+        with freeze_time("2016-03-15 12:01:30"):
+            IdempotencyKey.store('new', 'hash', 201, {})
+
+            out = StringIO()
+            call_command('purge_idempotency_keys', stdout=out)
+
+        self.assertIn('1 expired idempotency keys deleted', out.getvalue())
+        self.assertEqual(['new'], list(IdempotencyKey.objects.values_list('key', flat=True)))
@@ -0,0 +1,130 @@
+import io
+from collections import OrderedDict
+from datetime import date, datetime, time
+from decimal import Decimal
+from unittest import mock
+import pytz
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.test import APITestCase
+
+from calls.core.api.parsers import ORJSONParser
+from calls.core.api.renderers import ORJSONRenderer
+from calls.core.api.viewsets import CallViewSet, CallDetailViewSet
+from calls.core.models.call import CallDetail
+
+
+class ORJSONRendererTest(SimpleTestCase):
+    """
+    ORJSONRenderer should render the same JSON of JSONRenderer
+    """
+
+    def test_same_output(self):
+        data = OrderedDict([
+            ('price', Decimal('1.26')),
+            ('prices', [Decimal('0.36'), None, 0.5, 12]),
+            ('started_at', datetime(2018, 2, 28, 21, 57, 13, 123456, tzinfo=pytz.UTC)),
+            ('start_date', date(2018, 2, 28)),
+            ('start_time', time(21, 57, 13, 123456)),
+            ('destination', 'Número  '),
+            ('calls', [OrderedDict([('id', 1), ('duration', '0h20m40s')])]),
+            (1, True),
+        ])
+
+        self.assertEqual(JSONRenderer().render(data), ORJSONRenderer().render(data))
+
+    def test_indent(self):
+        data = {'calls': [1, 2]}
+
+        self.assertEqual(
+            JSONRenderer().render(data, 'application/json; indent=4'),
+            ORJSONRenderer().render(data, 'application/json; indent=4'),
+        )
+
+    def test_none(self):
+        self.assertEqual(b'', ORJSONRenderer().render(None))
+
+
+class ORJSONParserTest(SimpleTestCase):
+    """
+    ORJSONParser should parse the same data of JSONParser
+    """
+
+    def test_same_data(self):
+        body = '[{"type": "start", "call_id": 70, "price": 1.26, "source": "Número"}, null]'.encode()
+
+        self.assertEqual(JSONParser().parse(io.BytesIO(body)), ORJSONParser().parse(io.BytesIO(body)))
+
+    def test_invalid_json(self):
+        for body in (b'{"type": "start"', b'[NaN]', b''):
+            with self.assertRaises(ParseError, msg=body):
+                ORJSONParser().parse(io.BytesIO(body))
+
+    def test_other_encoding(self):
+        body = '{"source": "Número"}'.encode('latin-1')
+
+        self.assertEqual({'source': 'Número'}, ORJSONParser().parse(io.BytesIO(body), None, {'encoding': 'latin-1'}))
+
+
+@mock.patch.object(CallDetailViewSet, 'parser_classes', [ORJSONParser])
+@mock.patch.object(CallDetailViewSet, 'renderer_classes', [ORJSONRenderer, BrowsableAPIRenderer])
+@mock.patch.object(CallViewSet, 'renderer_classes', [ORJSONRenderer, BrowsableAPIRenderer])
+class APIFastJSONTest(APITestCase):
+    """
+    Viewsets with the orjson renderer and parser should answer as with the stock ones
+    """
+    fixtures = ['pricingrule.json']
+
+    def test_create_and_list(self):
+        records = [
+            {'type': 'start', 'timestamp': '2016-02-29T12:00:00Z', 'call_id': 70,
+             'source': '99988526423', 'destination': '9933468278'},
+            {'type': 'end', 'timestamp': '2016-02-29T14:00:00Z', 'call_id': 70},
+        ]
+        response = self.client.post('/api/call-detail/bulk/', records, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(2, CallDetail.objects.count())
+
+        start = CallDetail.objects.get(type=CallDetail.START, call_id=70)
+        end = CallDetail.objects.get(type=CallDetail.END, call_id=70)
+
+        response = self.client.get('/api/call/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertJSONEqual(str(response.content, encoding='utf8'), {
+            'next': None,
+            'previous': None,
+            'results': [{
+                'url': 'http://testserver/api/call/70/',
+                'id': 70,
+                'detail_start': f'http://testserver/api/call-detail/{start.id}/',
+                'detail_end': f'http://testserver/api/call-detail/{end.id}/',
+                'duration': '2h0m0s',
+                'price': '11.16',
+            }],
+        })
+
+    def test_invalid_json(self):
+        response = self.client.post('/api/call-detail/bulk/', '[{"type": ', content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('JSON parse error', response.data['detail'])
+
+
+class BenchmarkJSONCommandTest(TestCase):
+    """
+    manage.py benchmark_json
+    Should report the times of the stock and orjson renderers and parser
+    """
+
+    def test_benchmark(self):
+        out = io.StringIO()
+        call_command('benchmark_json', '--calls', '10', '--repeat', '1', stdout=out)
+
+        self.assertEqual(3, out.getvalue().count('orjson'))
@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta
+import pytz
+
+from django.core.cache import caches
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from calls.core.models.call import CallDetail
+from calls.core.models.pricing_rule import PricingRule
+from calls.core.tests.factories import create_call
+
+
+# The responses are not cached by default
+RESPONSE_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'responses'},
+}
+
+
+@override_settings(CACHES=RESPONSE_CACHES)
+class APIBillResponseCacheTest(APITestCase):
+    """
+    (GET) /api/bill/?subscriber=<source>&period=<MM/YYYY>
+    Should be read from the cache until the calls of the bill or the pricing rules change
+    """
+    fixtures = ['pricingrule.json']
+    url = '/api/bill/?subscriber=99988526423&period=09/2018'
+
+    def setUp(self):
+        caches['responses'].clear()
+        create_call(80, datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC))
+        create_call(90, datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC), source="99988526424")
+        PricingRule.schedule()
+        self.response = self.client.get(self.url)
+
+    def tearDown(self):
+        PricingRule.clear_schedule()
+
+    def test_cached(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.data, response.data)
+        self.assertEqual(self.response['ETag'], response['ETag'])
+
+    def test_cached_by_parameters(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url + '&summary_only=true')
+
+        self.assertNotIn('calls', response.data)
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url + '&summary_only=true')
+
+    def test_stream_not_cached(self):
+        with self.assertNumQueries(5):
+            b''.join(self.client.get(self.url + '&stream=true').streaming_content)
+
+    def test_invalidated_by_new_call(self):
+        create_call(81, datetime(2018, 9, 29, 23, 0, 0, tzinfo=pytz.UTC))
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(2, len(response.data['calls']))
+
+    def test_invalidated_by_changed_call_detail(self):
+        detail = CallDetail.objects.get(call_id=80, type=CallDetail.START)
+        detail.destination = '9933468279'
+        detail.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual('9933468279', response.data['calls'][0]['destination'])
+
+    def test_invalidated_by_deleted_call_detail(self):
+        CallDetail.objects.get(call_id=80, type=CallDetail.END).delete()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual([], response.data['calls'])
+
+    def test_invalidated_by_pricing_rule(self):
+        rule = PricingRule.objects.get(id=1)
+        rule.name = 'Standard'
+        rule.save()
+
+        with self.assertNumQueries(5):
+            self.client.get(self.url)
+
+    def test_other_bills_not_invalidated(self):
+        self.client.get('/api/bill/?subscriber=99988526424&period=09/2018')
+        create_call(81, datetime(2018, 9, 29, 23, 0, 0, tzinfo=pytz.UTC))
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/bill/?subscriber=99988526424&period=09/2018')
+
+    @override_settings(RESPONSE_CACHE_ALIAS='default')
+    def test_other_backend(self):
+        caches['default'].clear()
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+
+@override_settings(CACHES=RESPONSE_CACHES)
+class APICallResponseCacheTest(APITestCase):
+    """
+    (GET) /api/call/<call_id>/
+    Should be read from the cache until the call changes
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        caches['responses'].clear()
+        create_call(70, datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC))
+        self.response = self.client.get('/api/call/70/')
+
+    def test_cached(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/call/70/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.data, response.data)
+
+    def test_cached_by_host(self):
+        response = self.client.get('/api/call/70/', HTTP_HOST='localhost')
+
+        self.assertEqual('http://localhost/api/call/70/', response.data['url'])
+
+    def test_invalidated_by_changed_call_detail(self):
+        detail = CallDetail.objects.get(call_id=70, type=CallDetail.END)
+        detail.timestamp += timedelta(minutes=10)
+        detail.save()
+
+        response = self.client.get('/api/call/70/')
+
+        self.assertEqual('0h30m40s', response.data['duration'])
+
+    def test_not_found_not_cached(self):
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get('/api/call/71/').status_code)
+
+        create_call(71, datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC))
+
+        self.assertEqual(status.HTTP_200_OK, self.client.get('/api/call/71/').status_code)
+
+
+class APIResponseCacheDisabledTest(APITestCase):
+    """
+    (GET) /api/call/<call_id>/
+    Should be read from the database when no response cache is set
+    """
+    fixtures = ['pricingrule.json']
+
+    def test_not_cached(self):
+        create_call(70, datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC))
+        self.client.get('/api/call/70/')
+
+        # The call and its records
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/call/70/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
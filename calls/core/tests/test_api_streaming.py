@@ -0,0 +1,114 @@
+import json
+from io import StringIO
+from datetime import datetime, timedelta
+from unittest import mock
+import pytz
+
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.test import APITestCase
+
+from freezegun import freeze_time
+
+from calls.core.api.renderers import ORJSONRenderer
+from calls.core.api.viewsets import BillViewSet
+from calls.core.tests.factories import create_call
+
+
+def create_calls(first_call_id, count):
+    for call_id in range(first_call_id, first_call_id + count):
+        create_call(call_id, datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC) + timedelta(minutes=call_id))
+
+
+def streamed_json(response):
+    return json.loads(b''.join(response.streaming_content).decode())
+
+
+@override_settings(API_STREAM_CHUNK_SIZE=2)
+class APIStreamingListTest(APITestCase):
+    """
+    (GET) /api/call-detail/?stream=true and /api/call/?stream=true
+    Should stream all the records as a JSON array, in the order of the pages
+    """
+    fixtures = ['pricingrule.json']
+
+    def test_call_details(self):
+        create_calls(1, 3)
+        page = self.client.get('/api/call-detail/?page_size=10')
+
+        response = self.client.get('/api/call-detail/?stream=true')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual('application/json', response['Content-Type'])
+        self.assertEqual(json.loads(json.dumps(page.data['results'])), streamed_json(response))
+
+    def test_calls(self):
+        create_calls(1, 5)
+        page = self.client.get('/api/call/?page_size=10')
+
+        response = self.client.get('/api/call/?stream=1')
+
+        self.assertEqual(5, len(page.data['results']))
+        self.assertEqual(json.loads(json.dumps(page.data['results'])), streamed_json(response))
+
+    def test_empty(self):
+        response = self.client.get('/api/call/?stream=true')
+
+        self.assertEqual([], streamed_json(response))
+
+    def test_paginated_without_stream(self):
+        response = self.client.get('/api/call/?stream=false')
+
+        self.assertFalse(response.streaming)
+        self.assertIn('results', response.data)
+
+
+@freeze_time("2018-10-20")
+@override_settings(API_STREAM_CHUNK_SIZE=2)
+class APIStreamingBillTest(APITestCase):
+    """
+    (GET) /api/bill/?subscriber=<source>&period=<MM/YYYY>&stream=true
+    Should stream the same bill, reading its calls by chunks
+    """
+    fixtures = ['pricingrule.json']
+    url = '/api/bill/?subscriber=99988526423&period=09/2018'
+
+    def test_live_bill(self):
+        create_calls(1, 5)
+        bill = self.client.get(self.url)
+
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url + '&stream=true')
+            content = streamed_json(response)
+
+        self.assertEqual(5, len(content['calls']))
+        self.assertEqual(json.loads(bill.content.decode()), content)
+
+    def test_materialized_bill(self):
+        create_calls(1, 5)
+        call_command('close_period', '--period', '09/2018', stdout=StringIO())
+        bill = self.client.get(self.url)
+
+        response = self.client.get(self.url + '&stream=true')
+
+        self.assertEqual(json.loads(bill.content.decode()), streamed_json(response))
+
+    def test_empty_bill(self):
+        response = self.client.get(self.url + '&stream=true')
+
+        content = streamed_json(response)
+
+        self.assertEqual([], content['calls'])
+        self.assertEqual(0, content['summary']['call_count'])
+
+    @mock.patch.object(BillViewSet, 'renderer_classes', [ORJSONRenderer, BrowsableAPIRenderer])
+    def test_fast_json(self):
+        create_calls(1, 3)
+        bill = self.client.get(self.url)
+
+        response = self.client.get(self.url + '&stream=true')
+
+        self.assertEqual(json.loads(bill.content.decode()), streamed_json(response))
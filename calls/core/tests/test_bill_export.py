@@ -0,0 +1,157 @@
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from unittest import mock, skipUnless
+import pytz
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from freezegun import freeze_time
+
+from calls.core.export import pyarrow_installed
+from calls.core.tests.factories import create_call
+
+
+EXPECTED_ROWS = [
+    ['subscriber', 'period', 'row_type', 'destination', 'start_date', 'start_time', 'duration', 'price'],
+    ['99988526423', '02/2016', 'call', '9933468278', '2016-02-28', '21:57:13', '0h20m40s', '0.54'],
+    ['99988526423', '02/2016', 'call', '9933468278', '2016-02-29', '21:57:13', '0h20m40s', '0.54'],
+    ['99988526423', '02/2016', 'total', '', '', '', '0h41m20s', '1.08'],
+    ['99988526424', '02/2016', 'call', '9933468278', '2016-02-28', '21:57:13', '0h20m40s', '0.54'],
+    ['99988526424', '02/2016', 'total', '', '', '', '0h20m40s', '0.54'],
+]
+
+
+def create_calls():
+    for call_id, source, day in ((70, "99988526423", 28), (71, "99988526424", 28), (72, "99988526423", 29)):
+        create_call(call_id, datetime(2016, 2, day, 21, 57, 13, tzinfo=pytz.UTC), source=source)
+
+    # Other period
+    create_call(73, datetime(2016, 3, 1, 21, 57, 13, tzinfo=pytz.UTC))
+
+
+@freeze_time("2016-04-15")
+class ExportBillsCommandTest(APITestCase):
+    """
+    manage.py export_bills <file> --period MM/YYYY
+    Should write the bills of all the subscribers of the period, with their totals
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        create_calls()
+        self.path = os.path.join(tempfile.mkdtemp(), 'bills.csv')
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def export(self, *args):
+        call_command('export_bills', self.path, *args, stdout=io.StringIO())
+
+    def test_csv(self):
+        # The archive of the period and its calls
+        with self.assertNumQueries(2):
+            self.export('--period', '02/2016', '--chunk-size', '2')
+
+        with open(self.path, newline='') as file:
+            self.assertEqual(EXPECTED_ROWS, list(csv.reader(file)))
+
+    def test_empty_period(self):
+        self.export('--period', '01/2016')
+
+        with open(self.path, newline='') as file:
+            self.assertEqual(EXPECTED_ROWS[:1], list(csv.reader(file)))
+
+    def test_open_period(self):
+        with self.assertRaises(CommandError):
+            self.export('--period', '04/2016')
+
+    @mock.patch('calls.core.management.commands.export_bills.pyarrow_installed', return_value=False)
+    def test_parquet_without_pyarrow(self, _pyarrow_installed):
+        with self.assertRaises(CommandError):
+            self.export('--period', '02/2016', '--format', 'parquet')
+
+    @skipUnless(pyarrow_installed(), 'pyarrow is not installed')
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        self.path = self.path.replace('.csv', '.parquet')
+        self.export('--period', '02/2016', '--chunk-size', '2')
+
+        table = pyarrow.parquet.read_table(self.path)
+
+        # A row group by chunk of rows
+        self.assertEqual(3, pyarrow.parquet.ParquetFile(self.path).num_row_groups)
+        self.assertEqual(
+            [date(2016, 2, 28), date(2016, 2, 29), None, date(2016, 2, 28), None],
+            table.column('start_date').to_pylist()
+        )
+        self.assertEqual(time(21, 57, 13), table.column('start_time').to_pylist()[0])
+        self.assertEqual(
+            [Decimal('0.54'), Decimal('0.54'), Decimal('1.08'), Decimal('0.54'), Decimal('0.54')],
+            table.column('price').to_pylist()
+        )
+
+    @skipUnless(pyarrow_installed(), 'pyarrow is not installed')
+    def test_arrow(self):
+        import pyarrow.ipc
+
+        self.path = self.path.replace('.csv', '.arrow')
+        self.export('--period', '02/2016', '--chunk-size', '2')
+
+        with pyarrow.ipc.open_file(self.path) as reader:
+            table = reader.read_all()
+
+        self.assertEqual(
+            [row[2] for row in EXPECTED_ROWS[1:]],
+            table.column('row_type').to_pylist()
+        )
+
+
+@freeze_time("2016-04-15")
+class APIBillExportTest(APITestCase):
+    """
+    (GET) /api/bill/export/?period=<MM/YYYY>&output=<csv|parquet|arrow>
+    Should stream the bills of all the subscribers of the period
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        create_calls()
+
+    def test_csv(self):
+        response = self.client.get('/api/bill/export/?period=02/2016')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual('text/csv', response['Content-Type'])
+        self.assertEqual('attachment; filename="bills-2016-02.csv"', response['Content-Disposition'])
+
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(EXPECTED_ROWS, list(csv.reader(io.StringIO(content))))
+
+    def test_invalid_output(self):
+        response = self.client.get('/api/bill/export/?period=02/2016&output=xlsx')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_open_period(self):
+        response = self.client.get('/api/bill/export/?period=04/2016')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual("You can only get bills which period are already closed", response.data)
+
+    @skipUnless(pyarrow_installed(), 'pyarrow is not installed')
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        response = self.client.get('/api/bill/export/?period=02/2016&output=parquet')
+        table = pyarrow.parquet.read_table(io.BytesIO(b''.join(response.streaming_content)))
+
+        self.assertEqual([row[0] for row in EXPECTED_ROWS[1:]], table.column('subscriber').to_pylist())
@@ -0,0 +1,32 @@
+from django.test import SimpleTestCase, override_settings
+
+from calls.core.checks import response_cache_check
+
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'responses'},
+}
+
+
+class ResponseCacheCheckTest(SimpleTestCase):
+    """
+    The system checks should reject a response cache local to each process
+    """
+
+    def test_disabled(self):
+        self.assertEqual([], response_cache_check(None))
+
+    @override_settings(CACHES=dict(LOCMEM_CACHES, responses={
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'responses',
+    }))
+    def test_shared(self):
+        self.assertEqual([], response_cache_check(None))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_local_memory(self):
+        self.assertEqual(['core.E001'], [message.id for message in response_cache_check(None)])
+
+    @override_settings(CACHES=LOCMEM_CACHES, DEBUG=True)
+    def test_local_memory_debug(self):
+        self.assertEqual(['core.W001'], [message.id for message in response_cache_check(None)])
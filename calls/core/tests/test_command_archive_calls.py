@@ -0,0 +1,270 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest.mock import patch
+import pytz
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from freezegun import freeze_time
+
+from calls.core import archive
+from calls.core.archive import load_index
+from calls.core.models.archived_call import ArchivedCall
+from calls.core.models.call import CallDetail, Call
+from calls.core.models.call_archive import CallArchive
+from calls.core.models.pricing_rule import PricingRule
+from calls.core.tests.factories import create_call
+
+
+@freeze_time("2018-11-15")
+class ArchiveCallsCommandTest(APITestCase):
+    """
+    manage.py archive_calls --before MM/YYYY
+    Should move the calls of the periods to archive files, where their bills are read from
+    """
+    fixtures = ['pricingrule.json']
+    url = '/api/bill/?subscriber=99988526423&period=09/2018'
+
+    def setUp(self):
+        self.archive_root = tempfile.mkdtemp()
+        self.settings = override_settings(CALL_ARCHIVE_STORAGE={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': self.archive_root},
+        })
+        self.settings.enable()
+
+        caches['responses'].clear()
+        load_index.cache_clear()
+        PricingRule.schedule()
+
+        create_call(70, datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC), source="99988526423")
+        create_call(71, datetime(2018, 9, 30, 5, 57, 13, 250000, tzinfo=pytz.UTC), source="99988526423")
+        create_call(72, datetime(2018, 9, 30, 12, 0, 0, tzinfo=pytz.UTC), source="99988526424")
+        create_call(80, datetime(2018, 10, 2, 12, 0, 0, tzinfo=pytz.UTC), source="99988526423")
+
+    def tearDown(self):
+        PricingRule.clear_schedule()
+        self.settings.disable()
+        shutil.rmtree(self.archive_root)
+
+    def archive(self, before='10/2018'):
+        call_command('archive_calls', '--before', before, stdout=io.StringIO())
+        caches['responses'].clear()
+
+    def create_late_calls(self):
+        """
+        Calls of both subscribers left in the database when the period is archived, as if received after it
+        """
+        create_call(69, datetime(2018, 9, 1, 8, 0, 0, tzinfo=pytz.UTC), source="99988526423")
+        create_call(73, datetime(2018, 9, 30, 13, 0, 0, tzinfo=pytz.UTC), source="99988526423")
+        create_call(74, datetime(2018, 9, 30, 14, 0, 0, tzinfo=pytz.UTC), source="99988526424")
+        Call.objects.filter(id__in=[69, 73, 74]).update(updated_at=datetime(2018, 11, 16, tzinfo=pytz.UTC))
+
+    def archive_split(self):
+        self.archive()
+        self.assertEqual([69, 73, 74, 80], sorted(Call.objects.values_list('id', flat=True)))
+
+    def test_calls_moved(self):
+        self.archive()
+
+        self.assertEqual([80], list(Call.objects.values_list('id', flat=True)))
+        self.assertEqual({80}, set(CallDetail.objects.values_list('call_id', flat=True)))
+
+        call_archive = CallArchive.objects.get(period=201809)
+        self.assertEqual((3, 2), (call_archive.call_count, call_archive.subscriber_count))
+
+    def test_only_calls_written_deleted(self):
+        save_index = archive.save_index
+
+        def save_index_while_changed(name, index):
+            # Received and changed while the calls are written
+            create_call(75, datetime(2018, 9, 30, 14, 0, 0, tzinfo=pytz.UTC), source="99988526423")
+            Call.objects.filter(id=72).update(updated_at=datetime(2018, 11, 15, 0, 0, 1, tzinfo=pytz.UTC))
+            return save_index(name, index)
+
+        with patch('calls.core.archive.save_index', save_index_while_changed):
+            self.archive()
+
+        self.assertEqual([72, 75, 80], sorted(Call.objects.values_list('id', flat=True)))
+        self.assertEqual({72, 75, 80}, set(CallDetail.objects.values_list('call_id', flat=True)))
+        self.assertEqual(4, CallDetail.objects.filter(call_id__in=[72, 75]).count())
+
+        # Call 72 is both archived and in the database: billed once
+        response = self.client.get('/api/bill/?subscriber=99988526424&period=09/2018')
+        self.assertEqual(1, len(response.data['calls']))
+
+    def test_private_storage(self):
+        self.archive()
+
+        call_archive = CallArchive.objects.get(period=201809)
+        for name in (call_archive.data_file, call_archive.index_file):
+            self.assertTrue(os.path.isfile(os.path.join(self.archive_root, name)))
+
+    def test_same_bill(self):
+        expected = json.loads(self.client.get(self.url).content.decode())
+
+        self.archive()
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+
+        self.assertEqual(expected, json.loads(response.content.decode()))
+
+    def test_same_summary(self):
+        expected = self.client.get(self.url + '&summary_only=true').data
+
+        self.archive()
+
+        self.assertEqual(expected, self.client.get(self.url + '&summary_only=true').data)
+
+    def test_same_batch(self):
+        data = {'subscribers': ["99988526424", "99988526423", "99988526425"], 'period': '09/2018'}
+        expected = json.loads(self.client.post('/api/bill/batch/', data, format='json').content.decode())
+
+        self.archive()
+
+        response = self.client.post('/api/bill/batch/', data, format='json')
+
+        self.assertEqual(expected, json.loads(response.content.decode()))
+
+    def test_batch_reads_archive_once(self):
+        data = {'subscribers': ["99988526424", "99988526423", "99988526425"], 'period': '09/2018'}
+        self.archive()
+        load_index(CallArchive.objects.get(period=201809).index_file)
+
+        with patch.object(archive.storage, 'open', wraps=archive.storage.open) as storage_open:
+            response = self.client.post('/api/bill/batch/', data, format='json')
+
+        self.assertEqual(1, storage_open.call_count)
+        self.assertEqual([1, 2, 0], [len(bill['calls']) for bill in response.data['bills']])
+
+    def test_same_export(self):
+        expected = b''.join(self.client.get('/api/bill/export/?period=09/2018').streaming_content)
+
+        self.archive()
+
+        response = self.client.get('/api/bill/export/?period=09/2018')
+        content = b''.join(response.streaming_content)
+
+        self.assertEqual(expected, content)
+        self.assertEqual(6, len(list(csv.reader(io.StringIO(content.decode())))))
+
+    def test_same_bill_split(self):
+        self.create_late_calls()
+        expected = json.loads(self.client.get(self.url).content.decode())
+
+        self.archive_split()
+        response = self.client.get(self.url)
+
+        self.assertEqual(expected, json.loads(response.content.decode()))
+        self.assertEqual(4, len(response.data['calls']))
+
+    def test_same_summary_split(self):
+        self.create_late_calls()
+        expected = self.client.get(self.url + '&summary_only=true').data
+
+        self.archive_split()
+
+        self.assertEqual(expected, self.client.get(self.url + '&summary_only=true').data)
+
+    def test_same_batch_split(self):
+        self.create_late_calls()
+        data = {'subscribers': ["99988526424", "99988526423", "99988526425"], 'period': '09/2018'}
+        expected = json.loads(self.client.post('/api/bill/batch/', data, format='json').content.decode())
+        call_command('close_period', '--period', '09/2018', stdout=io.StringIO())
+
+        self.archive_split()
+        response = self.client.post('/api/bill/batch/', data, format='json')
+
+        self.assertEqual(expected, json.loads(response.content.decode()))
+        self.assertEqual([2, 4, 0], [len(bill['calls']) for bill in response.data['bills']])
+
+    def test_same_export_split(self):
+        self.create_late_calls()
+        expected = b''.join(self.client.get('/api/bill/export/?period=09/2018').streaming_content)
+
+        self.archive_split()
+        content = b''.join(self.client.get('/api/bill/export/?period=09/2018').streaming_content)
+
+        self.assertEqual(expected, content)
+        self.assertEqual(9, len(list(csv.reader(io.StringIO(content.decode())))))
+
+    def test_late_calls_merged(self):
+        self.archive()
+        create_call(73, datetime(2018, 9, 30, 13, 0, 0, tzinfo=pytz.UTC), source="99988526423")
+        create_call(74, datetime(2018, 9, 30, 13, 0, 0, tzinfo=pytz.UTC), source="99988526425")
+
+        self.archive()
+
+        call_archive = CallArchive.objects.get(period=201809)
+        self.assertEqual((5, 3), (call_archive.call_count, call_archive.subscriber_count))
+        self.assertEqual([70, 71, 73], [call.id for call in call_archive.subscriber_calls("99988526423")])
+        self.assertEqual(3, len(self.client.get(self.url).data['calls']))
+
+    def test_archived_call_ids_kept(self):
+        self.archive()
+
+        self.assertEqual(
+            [(70, 201809), (71, 201809), (72, 201809)], list(ArchivedCall.objects.values_list('call_id', 'period'))
+        )
+
+    def test_archived_call_not_created_again(self):
+        self.archive()
+
+        # The records of an archived call sent again, one by one and in bulk
+        response = self.client.post('/api/call-detail/', {
+            "type": "end",
+            "timestamp": "2018-09-29T22:17:53Z",
+            "call_id": 70,
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post('/api/call-detail/bulk/', [
+            {"type": "start", "timestamp": "2018-09-29T21:57:13Z", "call_id": 70,
+             "source": "99988526423", "destination": "9933468278"},
+            {"type": "end", "timestamp": "2018-09-29T22:17:53Z", "call_id": 70},
+        ], format='json')
+        self.assertEqual(0, response.data['created'])
+
+        with override_settings(CALL_PAIRING_ASYNC=True):
+            response = self.client.post('/api/call-detail/', {
+                "type": "end",
+                "timestamp": "2018-09-29T22:17:53Z",
+                "call_id": 70,
+            })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertFalse(Call.objects.filter(id=70).exists())
+        self.assertFalse(CallDetail.objects.filter(call_id=70).exists())
+        self.assertEqual(2, len(self.client.get(self.url).data['calls']))
+
+    def test_calls_without_source_archived_together(self):
+        create_call(75, datetime(2018, 9, 30, 14, 0, 0, tzinfo=pytz.UTC), source="99988526425")
+        create_call(76, datetime(2018, 9, 30, 15, 0, 0, tzinfo=pytz.UTC), source="99988526425")
+        Call.objects.filter(id=75).update(source=None)
+        Call.objects.filter(id=76).update(source='')
+
+        self.archive()
+
+        call_archive = CallArchive.objects.get(period=201809)
+        self.assertEqual((5, 2), (call_archive.call_count, call_archive.subscriber_count))
+        self.assertEqual([75, 76], [call.id for call in call_archive.subscriber_calls('')])
+
+    def test_current_period_not_archived(self):
+        with self.assertRaisesMessage(CommandError, 'already over'):
+            call_command('archive_calls', '--before', '12/2018', stdout=io.StringIO())
+
+    def test_invalid_period(self):
+        with self.assertRaisesMessage(CommandError, 'MM/YYYY'):
+            call_command('archive_calls', '--before', '2018-10', stdout=io.StringIO())
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+import pytz
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from freezegun import freeze_time
+
+from calls.core.models.bill import Bill, BillLine
+from calls.core.models.call import CallDetail
+
+
+@freeze_time("2016-03-15")
+class ClosePeriodCommandTest(TestCase):
+    """
+    manage.py close_period --period MM/YYYY
+    Should materialize the bills of the subscribers with calls in the period
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        for call_id, source, day in ((70, "99988526423", 29), (71, "99988526423", 28), (72, "99988526424", 28)):
+            CallDetail.objects.create(
+                type=CallDetail.START,
+                timestamp=datetime(2016, 2, day, 21, 57, 13, tzinfo=pytz.UTC),
+                source=source,
+                destination="9933468278",
+                call_id=call_id,
+            )
+            CallDetail.objects.create(
+                type=CallDetail.END,
+                timestamp=datetime(2016, 2, day, 22, 17, 53, tzinfo=pytz.UTC),
+                call_id=call_id,
+            )
+
+        # Other period
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2016, 1, 1, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=73,
+        )
+        CallDetail.objects.create(
+            type=CallDetail.END,
+            timestamp=datetime(2016, 1, 1, 22, 17, 53, tzinfo=pytz.UTC),
+            call_id=73,
+        )
+
+        self.close_period()
+
+    def close_period(self, *args):
+        call_command('close_period', '--chunk-size', '1', *args, stdout=StringIO())
+
+    def test_bills_built(self):
+        self.assertEqual(
+            {("99988526423", 201602), ("99988526424", 201602)},
+            set(Bill.objects.values_list('subscriber', 'period'))
+        )
+
+    def test_bill_lines(self):
+        lines = BillLine.objects.filter(bill__subscriber="99988526423").order_by('id')
+
+        self.assertEqual([70, 71], [line.call_id for line in lines])
+        self.assertEqual("9933468278", lines[0].destination)
+        self.assertEqual(datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC), lines[0].started_at)
+        self.assertEqual(timedelta(minutes=20, seconds=40), lines[0].duration)
+        self.assertEqual(Decimal('0.54'), lines[0].price)
+
+    def test_only_missing_bills_built(self):
+        Bill.objects.filter(subscriber="99988526424").delete()
+        closed_at = Bill.objects.get(subscriber="99988526423").closed_at
+
+        self.close_period('--period', '02/2016')
+
+        self.assertEqual(closed_at, Bill.objects.get(subscriber="99988526423").closed_at)
+        self.assertEqual(1, BillLine.objects.filter(bill__subscriber="99988526424").count())
+
+    def test_recompute(self):
+        self.close_period('--period', '02/2016', '--recompute')
+
+        self.assertEqual(2, Bill.objects.count())
+        self.assertEqual(3, BillLine.objects.count())
+
+    def test_invalidated_by_late_record(self):
+        CallDetail.objects.get(type=CallDetail.END, call_id=70).delete()
+
+        self.assertFalse(Bill.objects.filter(subscriber="99988526423").exists())
+        self.assertTrue(Bill.objects.filter(subscriber="99988526424").exists())
+
+        CallDetail.objects.create(
+            type=CallDetail.END,
+            timestamp=datetime(2016, 2, 29, 22, 27, 53, tzinfo=pytz.UTC),
+            call_id=70,
+        )
+        self.close_period()
+
+        self.assertEqual(timedelta(minutes=30, seconds=40), BillLine.objects.get(call_id=70).duration)
+
+    def test_invalidated_by_repricing(self):
+        call_command('reprice_calls', '--period', '02/2016', stdout=StringIO())
+
+        self.assertFalse(Bill.objects.exists())
+
+    def test_open_period(self):
+        with self.assertRaises(CommandError):
+            self.close_period('--period', '03/2016')
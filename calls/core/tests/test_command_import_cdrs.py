@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from calls.core.api.serializers import CallDetailBulkSerializer
+from calls.core.models.call import CallDetail, Call
+
+
+CSV_RECORDS = """type,timestamp,call_id,source,destination
+start,2016-02-29T21:57:13Z,70,99988526423,9933468278
+end,2016-02-29T22:17:53Z,70,,
+end,2016-02-29T22:17:53Z,70,,
+start,2016-02-29T12:00:00Z,71,99988526423,9933468278
+"""
+
+NDJSON_RECORDS = """{"type": "start", "timestamp": "2016-02-29T21:57:13Z", "source": "99988526423", "destination": "9933468278", "call_id": 70}
+{"type": "end", "timestamp": "2016-02-29T22:17:53Z", "call_id": 70}
+
+{"type": "end", "timestamp":
+"""
+
+
+class ImportCDRsCommandTest(TestCase):
+    """
+    manage.py import_cdrs <file>
+    Should import the call detail records of CSV and NDJSON files and pair them into calls
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stdout = StringIO()
+        self.stderr = StringIO()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def import_cdrs(self, *args):
+        call_command('import_cdrs', *args, stdout=self.stdout, stderr=self.stderr)
+
+    def test_import_csv(self):
+        self.import_cdrs(self.write('records.csv', CSV_RECORDS), '--chunk-size', '2')
+
+        self.assertEqual(CallDetail.objects.count(), 3)
+        self.assertIsNone(CallDetail.objects.get(type=CallDetail.END, call_id=70).source)
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
+        self.assertIsNone(Call.objects.get(id=71).detail_end)
+
+        self.assertIn('Record 3 rejected', self.stderr.getvalue())
+        self.assertIn('3 records imported, 1 rejected', self.stdout.getvalue())
+
+    def test_import_ndjson(self):
+        self.import_cdrs(self.write('records.ndjson', NDJSON_RECORDS))
+
+        self.assertEqual(CallDetail.objects.count(), 2)
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
+        self.assertIn('Record 3 rejected', self.stderr.getvalue())
+
+    def test_resume_from_checkpoint(self):
+        path = self.write('records.csv', CSV_RECORDS)
+        self.write('records.csv.checkpoint', '3')
+
+        self.import_cdrs(path, '--resume')
+
+        self.assertEqual(CallDetail.objects.count(), 1)
+        self.assertTrue(CallDetail.objects.filter(call_id=71).exists())
+        self.assertFalse(os.path.exists(path + '.checkpoint'), msg="The checkpoint should be removed at the end")
+
+    def test_checkpoint_saved_by_chunk(self):
+        """
+        After a crash, the checkpoint should have the records of the chunks already imported
+        """
+        path = self.write('records.csv', CSV_RECORDS)
+        save_records = CallDetailBulkSerializer.save_records
+        calls = []
+
+        def crash_on_second_chunk(records, insert=None):
+            calls.append(records)
+            if len(calls) == 2:
+                raise RuntimeError("Crash")
+            return save_records(records, insert)
+
+        with mock.patch.object(CallDetailBulkSerializer, 'save_records', side_effect=crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                self.import_cdrs(path, '--chunk-size', '2')
+
+        with open(path + '.checkpoint') as checkpoint:
+            self.assertEqual('2', checkpoint.read())
+
+        self.import_cdrs(path, '--chunk-size', '2', '--resume')
+        self.assertEqual(CallDetail.objects.count(), 3)
@@ -0,0 +1,225 @@
+from datetime import datetime
+from io import StringIO
+from threading import Event, Thread
+from time import sleep
+from unittest import skipUnless
+import pytz
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, IntegrityError, OperationalError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APITestCase
+
+from calls.core.models.call import CallDetail, Call
+from calls.core.partitions import add_months, create_partition, next_period, partition_calls, partitions, \
+    unpartition_calls
+from calls.core.tests.factories import create_call
+
+
+class PartitionPeriodsTest(TestCase):
+
+    def test_next_period(self):
+        self.assertEqual(201810, next_period(201809))
+        self.assertEqual(201901, next_period(201812))
+
+    def test_add_months(self):
+        self.assertEqual(202002, add_months(201811, 15))
+        self.assertEqual(201712, add_months(201801, -1))
+        self.assertEqual(201801, add_months(201801, 0))
+
+
+@skipUnless(connection.vendor != 'postgresql', 'the calls table can be partitioned')
+class PartitionCallsUnsupportedTest(TestCase):
+    """
+    manage.py partition_calls
+    Should fail when the calls table can not be partitioned
+    """
+
+    def test_not_enabled(self):
+        with self.assertRaisesMessage(CommandError, 'only partitioned on PostgreSQL'):
+            call_command('partition_calls', stdout=StringIO())
+
+    @override_settings(CALL_PARTITIONING=True)
+    def test_not_postgresql(self):
+        with self.assertRaisesMessage(CommandError, 'only partitioned on PostgreSQL'):
+            call_command('partition_calls', stdout=StringIO())
+
+
+class APIBillPartitionPruningTest(APITestCase):
+    """
+    (GET) /api/bill/?subscriber=<source>&period=<MM/YYYY>
+    Should filter the calls by their period, so only its partition is read
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        caches['responses'].clear()
+        create_call(80, datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC),
+                    datetime(2018, 9, 29, 22, 17, 53, tzinfo=pytz.UTC))
+
+    def test_calls_filtered_by_period(self):
+        for params in ('', '&summary_only=true', '&stream=true'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/bill/?subscriber=99988526423&period=09/2018' + params)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+
+            calls_queries = [query['sql'] for query in queries.captured_queries if '"core_call"' in query['sql']]
+
+            self.assertTrue(calls_queries)
+            for sql in calls_queries:
+                # Also in the subqueries of the calls, with an alias of the table
+                self.assertRegex(sql, r'("core_call"|U\d+)\."billing_period" = 201809')
+
+
+@override_settings(CALL_PARTITIONING=True)
+@skipUnless(connection.vendor == 'postgresql', 'the calls table is only partitioned on PostgreSQL')
+class PartitionCallsCommandTest(TransactionTestCase):
+    """
+    manage.py partition_calls [--ahead N] [--detach-before MM/YYYY] [--drop]
+    Should create the partitions of the next periods and detach the old ones
+    """
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            partition_calls(cursor)
+
+        # No partition of 09/2018 yet: the call is in the default partition
+        create_call(70, datetime(2018, 8, 31, 23, 0, 0, tzinfo=pytz.UTC),
+                    datetime(2018, 9, 1, 0, 20, 0, tzinfo=pytz.UTC))
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            unpartition_calls(cursor)
+
+    def test_partitions_created(self):
+        call_command('partition_calls', '--ahead', '2', stdout=StringIO())
+
+        with connection.cursor() as cursor:
+            self.assertEqual(3, len(partitions(cursor)))
+
+    def test_calls_moved_from_default_partition(self):
+        with connection.cursor() as cursor:
+            self.assertTrue(create_partition(cursor, 201809))
+
+            cursor.execute('SELECT count(*) FROM core_call_p201809')
+            self.assertEqual(1, cursor.fetchone()[0])
+
+        self.assertEqual(1, Call.objects.filter(billing_period=201809).count())
+
+    def test_duplicate_id(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Call.objects.bulk_create([Call(id=70)])
+
+    def test_detach(self):
+        with connection.cursor() as cursor:
+            create_partition(cursor, 201809)
+
+        call_command('partition_calls', '--detach-before', '10/2018', '--drop', stdout=StringIO())
+
+        self.assertFalse(Call.objects.filter(id=70).exists())
+
+
+@override_settings(CALL_PARTITIONING=True)
+@skipUnless(connection.vendor == 'postgresql', 'the calls table is only partitioned on PostgreSQL')
+class PartitionedPairingTest(TransactionTestCase):
+    """
+    Pairing the records of calls of a partitioned calls table
+    Should read the calls by their partition key when it is known, and lock the calls moved to another
+    partition by a concurrent pairing
+    """
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            partition_calls(cursor)
+            create_partition(cursor, 201809)
+
+        # Not ended yet: the call is in the default partition
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=71,
+        )
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            unpartition_calls(cursor)
+
+    def end_call(self, moved):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('UPDATE core_call SET billing_period = 201809 WHERE id = 71')
+            moved.set()
+            sleep(0.5)
+
+        connections.close_all()
+
+    def test_end_record_paired_by_period(self):
+        with CaptureQueriesContext(connection) as queries:
+            CallDetail.objects.create(
+                type=CallDetail.END,
+                timestamp=datetime(2018, 9, 29, 22, 17, 53, tzinfo=pytz.UTC),
+                call_id=71,
+            )
+
+        calls_queries = [query['sql'] for query in queries.captured_queries
+                         if query['sql'].startswith('SELECT "core_call"')]
+
+        self.assertTrue(calls_queries)
+        for sql in calls_queries:
+            self.assertIn('"core_call"."billing_period" IS NULL OR "core_call"."billing_period" IN (201809)', sql)
+
+        self.assertEqual(201809, Call.objects.get(id=71).billing_period)
+
+    def test_end_record_deleted(self):
+        create_call(72, datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC),
+                    datetime(2018, 9, 29, 22, 17, 53, tzinfo=pytz.UTC))
+
+        CallDetail.objects.get(call_id=72, type=CallDetail.END).delete()
+
+        call = Call.objects.get(id=72)
+        self.assertIsNone(call.billing_period)
+        self.assertIsNone(call.detail_end)
+
+    def test_lock_moved_call(self):
+        moved = Event()
+        thread = Thread(target=self.end_call, args=(moved,))
+        thread.start()
+        moved.wait()
+
+        # Waits for the row, then fails to lock it, moved to the partition of 09/2018: locked there
+        with transaction.atomic():
+            calls = Call.lock_rows(Call.objects.select_for_update().filter(id=71))
+
+        thread.join()
+        self.assertEqual([201809], [call.billing_period for call in calls])
+
+    def test_pair_moved_call(self):
+        moved = Event()
+        thread = Thread(target=self.end_call, args=(moved,))
+        thread.start()
+        moved.wait()
+
+        with transaction.atomic():
+            calls = Call.lock_calls([71])
+
+        thread.join()
+        self.assertEqual(201809, calls[71].billing_period)
+
+    @override_settings(CALL_PAIRING_ATTEMPTS=1)
+    def test_lock_moved_call_attempts(self):
+        moved = Event()
+        thread = Thread(target=self.end_call, args=(moved,))
+        thread.start()
+        moved.wait()
+
+        with self.assertRaisesMessage(OperationalError, 'moved to another partition'), transaction.atomic():
+            Call.lock_rows(Call.objects.select_for_update().filter(id=71))
+
+        thread.join()
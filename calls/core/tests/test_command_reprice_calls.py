@@ -0,0 +1,135 @@
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+from threading import Thread
+from time import sleep
+from unittest import skipUnless
+from unittest.mock import patch
+import pytz
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase
+
+from calls.core.models.call import CallDetail, Call
+from calls.core.models.pricing_rule import PricingRule
+
+
+class RepriceCallsCommandTest(TestCase):
+    """
+    manage.py reprice_calls --period MM/YYYY
+    Should recalculate the price of the calls that ended in the period with the current pricing rules
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        for call_id, day in ((70, 29), (71, 28)):
+            CallDetail.objects.create(
+                type=CallDetail.START,
+                timestamp=datetime(2016, 2, day, 21, 57, 13, tzinfo=pytz.UTC),
+                source="99988526423",
+                destination="9933468278",
+                call_id=call_id,
+            )
+            CallDetail.objects.create(
+                type=CallDetail.END,
+                timestamp=datetime(2016, 2, day, 22, 17, 53, tzinfo=pytz.UTC),
+                call_id=call_id,
+            )
+
+        # Just the start record
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=72,
+        )
+
+        # Other period
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2016, 3, 1, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=73,
+        )
+        CallDetail.objects.create(
+            type=CallDetail.END,
+            timestamp=datetime(2016, 3, 1, 22, 17, 53, tzinfo=pytz.UTC),
+            call_id=73,
+        )
+
+        rule = PricingRule.objects.get(id=2)
+        rule.minute_call_charge = Decimal('0.01')
+        rule.save()
+
+        call_command('reprice_calls', '--period', '02/2016', '--chunk-size', '1', stdout=StringIO())
+
+    def tearDown(self):
+        # Rolling back the test changes does not send signals
+        PricingRule.clear_schedule()
+
+    def test_calls_repriced(self):
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.71'))
+        self.assertEqual(Call.objects.get(id=71).price, Decimal('0.71'))
+
+    def test_incomplete_call(self):
+        self.assertEqual(Call.objects.get(id=72).price, Decimal('0.00'))
+
+    def test_other_period_not_repriced(self):
+        self.assertEqual(Call.objects.get(id=73).price, Decimal('0.54'))
+
+    def test_invalid_period(self):
+        with self.assertRaises(CommandError):
+            call_command('reprice_calls', '--period', 'xx', stdout=StringIO())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite does not lock rows')
+class RepriceCallsConcurrencyTest(TransactionTestCase):
+    """
+    manage.py reprice_calls --period MM/YYYY
+    Should not overwrite the price of a call paired by a concurrent request while it is repriced
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=70,
+        )
+        CallDetail.objects.create(
+            type=CallDetail.END,
+            timestamp=datetime(2016, 2, 29, 22, 17, 53, tzinfo=pytz.UTC),
+            call_id=70,
+        )
+
+    def tearDown(self):
+        PricingRule.clear_schedule()
+
+    def pair_call(self):
+        # As the API pairing a changed record of the call: waits for the call, then prices it
+        with transaction.atomic():
+            Call.lock_calls([70])
+            Call.objects.filter(id=70).update(price=Decimal('9.99'))
+
+        connections.close_all()
+
+    def test_concurrent_pairing_not_overwritten(self):
+        price_many = PricingRule.price_many
+        thread = Thread(target=self.pair_call)
+
+        def price_many_while_paired(starts, ends):
+            thread.start()
+            sleep(0.5)
+            return price_many(starts, ends)
+
+        with patch.object(PricingRule, 'price_many', price_many_while_paired):
+            call_command('reprice_calls', '--period', '02/2016', stdout=StringIO())
+
+        thread.join()
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('9.99'))
@@ -0,0 +1,257 @@
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+import pytz
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from calls.core.models.bill import Bill
+from calls.core.models.call import CallDetail, Call
+from calls.core.models.call_detail_queue import CallDetailQueue
+from calls.core.util.reorder import ReorderBuffer
+
+
+START = {
+    'type': CallDetail.START,
+    'timestamp': "2016-02-29T21:57:13Z",
+    'source': "99988526423",
+    'destination': "9933468278",
+    'call_id': 70,
+}
+
+END = {
+    'type': CallDetail.END,
+    'timestamp': "2016-02-29T22:17:53Z",
+    'call_id': 70,
+}
+
+
+@override_settings(CALL_PAIRING_ASYNC=True)
+class RunPricingWorkerCommandTest(APITestCase):
+    """
+    In async pairing mode the API should only save and queue the call detail records.
+    manage.py run_pricing_worker should pair them with their calls and price them.
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        self.stdout = StringIO()
+        self.stderr = StringIO()
+
+    def run_worker(self, *args):
+        call_command('run_pricing_worker', '--once', '--batch-size', '1', *args,
+                     stdout=self.stdout, stderr=self.stderr)
+
+    def test_post_queued(self):
+        response = self.client.post('/api/call-detail/', START)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(CallDetailQueue.objects.count(), 1)
+        self.assertFalse(Call.objects.exists())
+
+    def test_calls_paired_by_worker(self):
+        self.client.post('/api/call-detail/', END)
+        self.client.post('/api/call-detail/', START)
+
+        self.run_worker()
+
+        call = Call.objects.get(id=70)
+        self.assertEqual(call.detail_start, CallDetail.objects.get(type=CallDetail.START))
+        self.assertEqual(call.detail_end, CallDetail.objects.get(type=CallDetail.END))
+        self.assertEqual(call.price, Decimal('0.54'))
+        self.assertFalse(CallDetailQueue.objects.exists())
+        self.assertIn('2 records paired, 0 rejected', self.stdout.getvalue())
+
+    def test_bulk_queued(self):
+        response = self.client.post('/api/call-detail/bulk/', [START, END], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(CallDetailQueue.objects.count(), 2)
+
+        self.run_worker()
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
+
+    def test_validated_against_queued_records(self):
+        self.client.post('/api/call-detail/', START)
+
+        response = self.client.post('/api/call-detail/', dict(END, timestamp="2016-02-29T20:00:00Z"))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post('/api/call-detail/bulk/', [START], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rejected_when_paired(self):
+        self.client.post('/api/call-detail/', START)
+
+        # Queued without validation, as if by a concurrent request
+        end = CallDetail(type=CallDetail.END, timestamp=datetime(2016, 2, 29, 20, 0, 0, tzinfo=pytz.UTC), call_id=70)
+        CallDetail.bulk_insert([end])
+        CallDetailQueue.objects.create(call_detail=end)
+
+        self.run_worker()
+
+        self.assertIsNone(Call.objects.get(id=70).detail_end)
+        self.assertTrue(CallDetailQueue.objects.get(call_detail=end).error)
+        self.assertIn(f'Record {end.id} rejected', self.stderr.getvalue())
+
+    def test_queued_record_deleted(self):
+        self.client.post('/api/call-detail/', START)
+        CallDetail.objects.get(call_id=70).delete()
+
+        self.assertFalse(CallDetailQueue.objects.exists())
+
+    def test_call_written_once_with_reorder_window(self):
+        self.client.post('/api/call-detail/', END)
+        self.client.post('/api/call-detail/', dict(START, call_id=71))
+        self.client.post('/api/call-detail/', START)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.run_worker('--reorder-window', '3600', '--shard', '0/1')
+
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "core_call"')])
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
+        self.assertTrue(Call.objects.filter(id=71).exists(), msg="Records without pair should be flushed")
+        self.assertFalse(CallDetailQueue.objects.exists())
+
+    def test_end_record_after_idle_poll_with_reorder_window(self):
+        self.client.post('/api/call-detail/', START)
+        sleeps = []
+
+        def sleep(_seconds):
+            sleeps.append(_seconds)
+            if len(sleeps) == 1:
+                # Received while the worker waits for records, before the window is over
+                self.client.post('/api/call-detail/', END)
+            else:
+                raise KeyboardInterrupt
+
+        with patch('calls.core.management.commands.run_pricing_worker.time.sleep', sleep), \
+                CaptureQueriesContext(connection) as queries:
+            call_command('run_pricing_worker', '--batch-size', '1', '--reorder-window', '3600', '--shard', '0/1',
+                         '--sleep', '0', stdout=self.stdout, stderr=self.stderr)
+
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "core_call"')])
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
+        self.assertFalse(CallDetailQueue.objects.exists())
+
+    def test_waiting_records_written_when_stopped(self):
+        self.client.post('/api/call-detail/', START)
+
+        with patch('calls.core.management.commands.run_pricing_worker.time.sleep', side_effect=KeyboardInterrupt):
+            call_command('run_pricing_worker', '--reorder-window', '3600', '--shard', '0/1',
+                         stdout=self.stdout, stderr=self.stderr)
+
+        self.assertTrue(Call.objects.filter(id=70).exists())
+        self.assertIn('Stopped: 1 records paired', self.stdout.getvalue())
+
+    def test_lower_id_committed_later_with_reorder_window(self):
+        self.client.post('/api/call-detail/', START)
+        CallDetailQueue.objects.update(id=20)
+        add = ReorderBuffer.add
+
+        def add_while_committed(buffer, record):
+            if not CallDetail.objects.filter(type=CallDetail.END).exists():
+                # Queued by a concurrent request with a lower id, committed after the start record was read
+                end = CallDetail(type=CallDetail.END, timestamp=datetime(2016, 2, 29, 22, 17, 53, tzinfo=pytz.UTC),
+                                 call_id=70)
+                CallDetail.bulk_insert([end])
+                CallDetailQueue.objects.create(id=10, call_detail=end)
+            return add(buffer, record)
+
+        with patch.object(ReorderBuffer, 'add', add_while_committed):
+            self.run_worker('--reorder-window', '3600', '--shard', '0/1')
+
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
+        self.assertFalse(CallDetailQueue.objects.exists())
+
+    def test_changed_source_invalidates_closed_bill(self):
+        self.client.post('/api/call-detail/', START)
+        self.client.post('/api/call-detail/', END)
+        self.run_worker()
+        Bill.close_period(201602)
+
+        start = CallDetail.objects.get(type=CallDetail.START)
+        self.client.put(f'/api/call-detail/{start.id}/', dict(START, source="99988526424"))
+        self.run_worker()
+
+        self.assertEqual("99988526424", Call.objects.get(id=70).source)
+        self.assertFalse(Bill.objects.filter(subscriber="99988526423").exists())
+
+    def test_lower_id_committed_later_while_buffer_not_empty(self):
+        self.client.post('/api/call-detail/', START)
+        self.client.post('/api/call-detail/', dict(START, call_id=71))
+        self.client.post('/api/call-detail/', dict(START, call_id=72))
+        for queue_id, call_detail_id in enumerate(CallDetail.objects.order_by('id').values_list('id', flat=True), 20):
+            CallDetailQueue.objects.filter(call_detail_id=call_detail_id).update(id=queue_id)
+        add = ReorderBuffer.add
+
+        def add_while_committed(buffer, record):
+            if record.call_id == 71:
+                # Queued by a concurrent request with a lower id, committed after the start record was read
+                end = CallDetail(type=CallDetail.END, timestamp=datetime(2016, 2, 29, 22, 17, 53, tzinfo=pytz.UTC),
+                                 call_id=70)
+                CallDetail.bulk_insert([end])
+                CallDetailQueue.objects.create(id=10, call_detail=end)
+            return add(buffer, record)
+
+        with patch.object(ReorderBuffer, 'add', add_while_committed), \
+                CaptureQueriesContext(connection) as queries:
+            self.run_worker('--reorder-window', '3600', '--shard', '0/1', '--rescan-interval', '0')
+
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "core_call"')],
+                         msg="The end record should be read before the buffer is flushed")
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
+        self.assertFalse(CallDetailQueue.objects.exists())
+
+    def test_record_deleted_in_buffer(self):
+        self.client.post('/api/call-detail/', START)
+        self.client.post('/api/call-detail/', dict(START, call_id=71))
+        add = ReorderBuffer.add
+
+        def add_while_deleted(buffer, record):
+            if record.call_id == 71:
+                CallDetail.objects.get(call_id=70).delete()
+            return add(buffer, record)
+
+        with patch.object(ReorderBuffer, 'add', add_while_deleted):
+            self.run_worker('--reorder-window', '3600', '--shard', '0/1')
+
+        self.assertEqual([71], list(Call.objects.values_list('id', flat=True)))
+        self.assertFalse(CallDetailQueue.objects.exists())
+
+    def test_record_changed_in_buffer(self):
+        self.client.post('/api/call-detail/', START)
+        self.client.post('/api/call-detail/', dict(START, call_id=71))
+        add = ReorderBuffer.add
+
+        def add_while_changed(buffer, record):
+            if record.call_id == 71:
+                start = CallDetail.objects.get(call_id=70)
+                self.client.put(f'/api/call-detail/{start.id}/', dict(START, timestamp="2016-02-29T12:00:00Z"))
+            return add(buffer, record)
+
+        with patch.object(ReorderBuffer, 'add', add_while_changed):
+            self.run_worker('--reorder-window', '3600', '--shard', '0/1')
+
+        self.assertEqual(datetime(2016, 2, 29, 12, 0, 0, tzinfo=pytz.UTC), Call.objects.get(id=70).started_at)
+        self.assertFalse(CallDetailQueue.objects.exists())
+
+    def test_reorder_window_without_shard(self):
+        with self.assertRaisesMessage(CommandError, 'requires a shard'):
+            self.run_worker('--reorder-window', '3600')
+
+    def test_shard(self):
+        self.client.post('/api/call-detail/', START)
+        self.client.post('/api/call-detail/', dict(START, call_id=71))
+
+        self.run_worker('--shard', '1/2')
+
+        self.assertEqual([71], list(Call.objects.values_list('id', flat=True)))
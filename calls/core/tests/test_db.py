@@ -0,0 +1,55 @@
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock, skipUnless
+import pytz
+
+from django.db import connection
+from django.test import TestCase
+
+from calls.core.models.call import Call
+from calls.core.util.db import SQLITE_MAX_VARIABLES, bulk_update, supports_upsert
+
+
+class BulkUpdateTest(TestCase):
+    """
+    bulk_update() should update many instances by batches within the SQLite limit of query parameters
+    """
+
+    def test_batches_of_all_fields(self):
+        Call.objects.bulk_create([Call(id=call_id) for call_id in range(1, 121)])
+        calls = list(Call.objects.order_by('id'))
+
+        for call in calls:
+            call.source = "99988526423"
+            call.destination = "9933468278"
+            call.started_at = datetime(2018, 9, 29, 21, 57, 13, tzinfo=pytz.UTC)
+            call.ended_at = datetime(2018, 9, 29, 22, 17, 53, tzinfo=pytz.UTC)
+            call.billing_period = 201809
+            call.price = Decimal(call.id) / 100
+
+        queries = []
+
+        def count_parameters(execute, sql, params, many, context):
+            queries.append(len(params or ()))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_parameters):
+            bulk_update(calls, ['detail_start', 'detail_end', 'price', 'source', 'destination', 'started_at',
+                                'ended_at', 'billing_period'])
+
+        self.assertGreater(len(queries), 1)
+        self.assertTrue(all(parameters <= SQLITE_MAX_VARIABLES for parameters in queries), msg=queries)
+        self.assertEqual(120, Call.objects.filter(source="99988526423", billing_period=201809).count())
+        self.assertEqual(Decimal('1.20'), Call.objects.get(id=120).price)
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite versions")
+class SupportsUpsertTest(TestCase):
+    """
+    supports_upsert() should need SQLite 3.35, the first version with RETURNING
+    """
+
+    def test_sqlite_versions(self):
+        for version, expected in (((3, 24, 0), False), ((3, 34, 1), False), ((3, 35, 0), True)):
+            with mock.patch.object(connection.Database, 'sqlite_version_info', version):
+                self.assertEqual(expected, supports_upsert())
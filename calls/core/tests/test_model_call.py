@@ -1,10 +1,14 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, time
+from unittest import mock
 import pytz
 from dateutil.parser import parse
 
 from decimal import Decimal
 
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
 
 from model_mommy import mommy
 
@@ -93,6 +97,20 @@ class CallModelAutomaticCreationAndDeletionTest(TestCase):
         self.assertFalse(CallDetail.objects.exists(), msg="Call Details record should be deleted")
         self.assertFalse(Call.objects.exists(), msg="The Call record should be deleted")
 
+    def test_details_copied(self):
+        call = Call.objects.get(id=70)
+        self.assertEqual(call.source, "99988526423")
+        self.assertEqual(call.destination, "9933468278")
+        self.assertEqual(call.started_at, self.start_detail.timestamp)
+        self.assertEqual(call.ended_at, self.end_detail.timestamp)
+        self.assertEqual(call.billing_period, 201602)
+
+    def test_delete_just_end_call_detail_should_clean_period(self):
+        self.end_detail.delete()
+        call = Call.objects.get(id=70)
+        self.assertIsNone(call.ended_at, msg="End time should be none")
+        self.assertIsNone(call.billing_period, msg="The call should not belong to a period")
+
 
 class CallDurationCalculationTest(TestCase):
     def test_duration_after_receiving_start_and_end_records(self):
@@ -571,3 +589,68 @@ class SampleCasesCalculationTest(TestCase):
 
         expected_price = Decimal('91.84')
         self.assertEqual(expected_price, call.price, msg="Call price different than expected")
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CallConcurrentPairingTest(TransactionTestCase):
+    """
+    The start and end records of the same calls saved at the same time by many workers should be paired
+    into complete, priced calls.
+    """
+    fixtures = ['pricingrule.json']
+    calls = 50
+    workers = 8
+
+    def tearDown(self):
+        PricingRule.clear_schedule()
+
+    def records(self):
+        records = []
+
+        for call_id in range(1, self.calls + 1):
+            records.append(dict(type=CallDetail.START, timestamp=datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC),
+                                source="99988526423", destination="9933468278", call_id=call_id))
+            records.append(dict(type=CallDetail.END, timestamp=datetime(2016, 2, 29, 22, 17, 53, tzinfo=pytz.UTC),
+                                call_id=call_id))
+
+        random.shuffle(records)
+        return records
+
+    def run_concurrently(self, save, tasks):
+        def run(task):
+            try:
+                save(task)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(run, tasks))
+
+    def assert_calls_paired(self):
+        self.assertEqual(CallDetail.objects.count(), self.calls * 2)
+        self.assertEqual(Call.objects.count(), self.calls)
+
+        for call in Call.objects.select_related('detail_start', 'detail_end'):
+            self.assertEqual(call.detail_start.call_id, call.id)
+            self.assertEqual(call.detail_end.call_id, call.id)
+            self.assertEqual(call.billing_period, 201602)
+            self.assertEqual(call.price, Decimal('0.54'))
+
+    def test_save(self):
+        self.run_concurrently(lambda record: CallDetail.objects.create(**record), self.records())
+        self.assert_calls_paired()
+
+    def test_bulk_save(self):
+        records = self.records()
+        batches = [records[position:position + 5] for position in range(0, len(records), 5)]
+
+        self.run_concurrently(
+            lambda batch: CallDetail.bulk_save([CallDetail(**record) for record in batch]), batches
+        )
+        self.assert_calls_paired()
+
+    def test_save_without_upsert(self):
+        with mock.patch('calls.core.models.call.supports_upsert', return_value=False):
+            self.run_concurrently(lambda record: CallDetail.objects.create(**record), self.records())
+
+        self.assert_calls_paired()
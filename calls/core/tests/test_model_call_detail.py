@@ -1,11 +1,16 @@
 from datetime import datetime
+from decimal import Decimal
+from unittest import mock
 import pytz
 
 from django.test import TestCase
 from django.db.utils import IntegrityError
 from django.core.validators import ValidationError
 
-from calls.core.models.call import CallDetail
+from freezegun import freeze_time
+
+from calls.core.models.call import CallDetail, Call
+from calls.core.models.pricing_rule import PricingRule
 
 
 class CallDetailModelTest(TestCase):
@@ -113,3 +118,119 @@ class CallDetailModelCallIdValidationTest(TestCase):
 
             )
 
+
+
+class CallDetailModelCallUpsertTest(TestCase):
+    """
+    Saving a call detail record should create/update its call with an upsert, without reading the other record
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=70,
+        )
+
+    def tearDown(self):
+        # Rolling back the test changes does not send signals
+        PricingRule.clear_schedule()
+
+    def test_call_created(self):
+        call = Call.objects.get(id=70)
+        self.assertEqual(call.detail_start, CallDetail.objects.get(call_id=70))
+        self.assertIsNone(call.detail_end)
+        self.assertEqual(call.source, "99988526423")
+        self.assertEqual(call.price, Decimal('0.00'))
+
+    @freeze_time("2016-02-29 23:00:00")
+    def test_call_updated(self):
+        PricingRule.schedule()
+
+        # Reading the call, saving the record, saving the call and the savepoint of the test transaction
+        with self.assertNumQueries(5):
+            end = CallDetail.objects.create(
+                type=CallDetail.END,
+                timestamp=datetime(2016, 2, 29, 22, 17, 53, tzinfo=pytz.UTC),
+                call_id=70,
+            )
+
+        call = Call.objects.get(id=70)
+        self.assertEqual(call.detail_end, end)
+        self.assertEqual(call.billing_period, 201602)
+        self.assertEqual(call.price, Decimal('0.54'))
+
+    def test_call_updated_without_upsert(self):
+        with mock.patch('calls.core.models.call.supports_upsert', return_value=False):
+            CallDetail.objects.create(
+                type=CallDetail.END,
+                timestamp=datetime(2016, 2, 29, 22, 17, 53, tzinfo=pytz.UTC),
+                call_id=70,
+            )
+
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
+
+
+class CallDetailModelConcurrentPairingTest(TestCase):
+    """
+    The other record of a call may be paired by a concurrent request between the read of the call and the
+    upsert: the call should be priced and validated with both records.
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        CallDetail.objects.create(
+            type=CallDetail.START,
+            timestamp=datetime(2016, 2, 29, 21, 57, 13, tzinfo=pytz.UTC),
+            source="99988526423",
+            destination="9933468278",
+            call_id=70,
+        )
+
+    def tearDown(self):
+        # Rolling back the test changes does not send signals
+        PricingRule.clear_schedule()
+
+    def create_end_without_call(self, timestamp):
+        # save() reads the call as it was before the start record was paired
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            return CallDetail.objects.create(type=CallDetail.END, timestamp=timestamp, call_id=70)
+
+    def test_priced_with_both_records(self):
+        end = self.create_end_without_call(datetime(2016, 2, 29, 22, 17, 53, tzinfo=pytz.UTC))
+
+        call = Call.objects.get(id=70)
+        self.assertEqual(call.detail_start, CallDetail.objects.get(type=CallDetail.START))
+        self.assertEqual(call.detail_end, end)
+        self.assertEqual(call.price, Decimal('0.54'))
+
+    def test_order_validation(self):
+        with self.assertRaises(ValidationError):
+            self.create_end_without_call(datetime(2016, 2, 29, 21, 0, 0, tzinfo=pytz.UTC))
+
+        self.assertFalse(CallDetail.objects.filter(type=CallDetail.END).exists())
+        self.assertIsNone(Call.objects.get(id=70).detail_end)
+
+    def test_bulk_save_retried_after_conflict(self):
+        update_details = Call.update_details
+        attempts = []
+
+        def conflict_on_first_attempt(call_details, calls=None):
+            attempts.append(call_details)
+            if len(attempts) == 1:
+                raise IntegrityError("Call created by a concurrent request")
+            return update_details(call_details, calls)
+
+        end = CallDetail(type=CallDetail.END, timestamp=datetime(2016, 2, 29, 22, 17, 53, tzinfo=pytz.UTC),
+                         call_id=70)
+
+        with mock.patch.object(Call, 'update_details', side_effect=conflict_on_first_attempt):
+            saved, errors = CallDetail.bulk_save([end])
+
+        self.assertEqual(2, len(attempts))
+        self.assertEqual(([end], {}), (saved, errors))
+        self.assertEqual(1, CallDetail.objects.filter(type=CallDetail.END).count())
+        self.assertEqual(Call.objects.get(id=70).price, Decimal('0.54'))
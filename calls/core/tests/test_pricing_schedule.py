@@ -0,0 +1,277 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import pytz
+
+from django.test import TestCase
+
+from calls.core.models.pricing_rule import PricingRule
+from calls.core.pricing import PricingSchedule, Segment, DAY, epoch_seconds
+from calls.core.util.helpers import to_timedelta
+
+
+def map_day_time_rules():
+    """
+    Reference implementation of the pricing replaced by PricingSchedule: returns the pricing rules, breaking the
+    ones passing midnight in one for each day
+    """
+    rules = PricingRule.objects.all()
+
+    result = []
+
+    for rule in rules:
+        if rule.start_time > rule.end_time:
+            result.append(
+                {
+                    'start_time': rule.start_time,
+                    'end_time': time(0, 0, 0),
+                    'id': rule.id,
+                    'standing_charge': rule.standing_charge,
+                    'minute_call_charge': rule.minute_call_charge,
+                }
+            )
+
+            result.append(
+                {
+                    'start_time': time(0, 0, 0),
+                    'end_time': rule.end_time,
+                    'id': rule.id,
+                    'standing_charge': rule.standing_charge,
+                    'minute_call_charge': rule.minute_call_charge,
+                }
+            )
+        else:
+            result.append(
+                {
+                    'start_time': rule.start_time,
+                    'end_time': rule.end_time,
+                    'id': rule.id,
+                    'standing_charge': rule.standing_charge,
+                    'minute_call_charge': rule.minute_call_charge,
+                }
+            )
+    return result
+
+
+def prices_for_period(case_start, case_end):
+    """
+    Reference implementation of the pricing replaced by PricingSchedule: returns the time slices of a call by
+    pricing rule, with their charges
+    """
+    prices = []
+
+    rules = map_day_time_rules()
+
+    if not rules:
+        return []
+
+    start = case_start
+
+    # Find the rule that mach with start point
+    for idx, rule in enumerate(rules):
+        if (rule['start_time'] <= start.time() < rule['end_time']) or \
+                (rule['start_time'] <= start.time() and rule['end_time'] == time(0, 0, 0)):
+            break
+
+    while True:
+        slice_start_datetime = start
+
+        slice_end_date = slice_start_datetime.date()
+        if rule['end_time'] == time(0, 0, 0):
+            slice_end_date += timedelta(days=1)
+
+        slice_end_datetime = datetime(
+            slice_end_date.year,
+            slice_end_date.month,
+            slice_end_date.day,
+            rule['end_time'].hour,
+            rule['end_time'].minute,
+            rule['end_time'].second,
+            tzinfo=pytz.UTC
+        )
+
+        if slice_end_datetime > case_end:
+            slice_end_datetime = case_end
+
+        slice_time_price = {
+            'pricing_rule_id': rule['id'],
+            'start_datetime': slice_start_datetime,
+            'end_datetime': slice_end_datetime,
+            'minutes': (to_timedelta(slice_end_datetime) - to_timedelta(slice_start_datetime)).seconds // 60,
+            'call_charge': (to_timedelta(slice_end_datetime) - to_timedelta(slice_start_datetime)).seconds // 60 * rule['minute_call_charge'],
+            'standing_charge': rule['standing_charge']
+        }
+
+        prices.append(slice_time_price)
+
+        if slice_end_datetime == case_end:
+            break
+
+        start = slice_end_datetime
+
+        if idx == len(rules)-1:
+            idx = 0
+        else:
+            idx += 1
+
+        rule = rules[idx]
+
+    return prices
+
+
+def slices_price(start, end):
+    """
+    Price of a call by the time slices of the reference prices_for_period()
+    """
+    prices = prices_for_period(start, end)
+    return sum(price['call_charge'] for price in prices) + prices[0]['standing_charge']
+
+
+class PricingScheduleCompileTest(TestCase):
+    """
+    The rules should be compiled as contiguous segments of the day, sorted by their start.
+    """
+    def test_rule_passing_midnight(self):
+        rules = [
+            PricingRule(id=1, start_time=time(6, 0, 0), end_time=time(22, 0, 0),
+                        standing_charge=Decimal('0.36'), minute_call_charge=Decimal('0.09')),
+            PricingRule(id=2, start_time=time(22, 0, 0), end_time=time(6, 0, 0),
+                        standing_charge=Decimal('0.36'), minute_call_charge=Decimal('0.00')),
+        ]
+
+        expected_segments = (
+            Segment(0, 6 * 3600, 2, Decimal('0.36'), Decimal('0.00')),
+            Segment(6 * 3600, 22 * 3600, 1, Decimal('0.36'), Decimal('0.09')),
+            Segment(22 * 3600, DAY, 2, Decimal('0.36'), Decimal('0.00')),
+        )
+
+        self.assertEqual(expected_segments, PricingSchedule(rules).segments)
+
+    def test_day_times_without_rule(self):
+        rules = [
+            PricingRule(id=1, start_time=time(6, 0, 0), end_time=time(22, 0, 0),
+                        standing_charge=Decimal('0.36'), minute_call_charge=Decimal('0.09')),
+        ]
+
+        expected_segments = (
+            Segment(0, 6 * 3600, None, Decimal('0.00'), Decimal('0.00')),
+            Segment(6 * 3600, 22 * 3600, 1, Decimal('0.36'), Decimal('0.09')),
+            Segment(22 * 3600, DAY, None, Decimal('0.00'), Decimal('0.00')),
+        )
+
+        self.assertEqual(expected_segments, PricingSchedule(rules).segments)
+
+    def test_immutable(self):
+        schedule = PricingSchedule([])
+        with self.assertRaises(AttributeError):
+            schedule.segments = ()
+
+
+class PricingSchedulePriceTest(TestCase):
+    """
+    PricingRule.price() should give the same results of the time slices of the reference prices_for_period()
+    """
+    fixtures = ['pricingrule.json']
+
+    def tearDown(self):
+        # Rolling back the test changes does not send signals
+        PricingRule.clear_schedule()
+
+    def test_same_price_of_time_slices(self):
+        PricingRule.objects.filter(id=2).update(minute_call_charge=Decimal('0.01'))
+        PricingRule.clear_schedule()
+
+        start = datetime(2017, 12, 12, 21, 57, 13, 500, tzinfo=pytz.UTC)
+        durations = [
+            timedelta(0),
+            timedelta(seconds=59),
+            timedelta(minutes=2, seconds=47),
+            timedelta(minutes=20, seconds=40),
+            timedelta(hours=8, minutes=2, seconds=47),
+            timedelta(days=1, hours=0, minutes=13, seconds=43),
+            timedelta(days=3, hours=7, seconds=1),
+        ]
+
+        for offset in range(0, DAY, 3607):
+            for duration in durations:
+                call_start = start + timedelta(seconds=offset)
+                call_end = call_start + duration
+                self.assertEqual(
+                    slices_price(call_start, call_end),
+                    PricingRule.price(call_start, call_end),
+                    msg=f'{call_start} to {call_end}'
+                )
+
+    def test_same_price_of_time_slices_long_calls(self):
+        start = datetime(2017, 12, 12, 21, 57, 13, tzinfo=pytz.UTC)
+
+        for days in (7, 31, 92):
+            end = start + timedelta(days=days, hours=5, minutes=3, seconds=20)
+            self.assertEqual(slices_price(start, end), PricingRule.price(start, end))
+
+    def test_long_call_without_queries(self):
+        start = datetime(2017, 12, 12, 6, 0, 0, tzinfo=pytz.UTC)
+        PricingRule.price(start, start)
+
+        with self.assertNumQueries(0):
+            price = PricingRule.price(start, start + timedelta(days=36500, seconds=1))
+
+        self.assertEqual(Decimal('0.36') + Decimal('86.40') * 36500, price)
+
+    def test_without_rules(self):
+        PricingRule.objects.all().delete()
+
+        start = datetime(2017, 12, 12, 21, 57, 13, tzinfo=pytz.UTC)
+        self.assertEqual(Decimal('0.00'), PricingRule.price(start, start + timedelta(hours=1)))
+        self.assertEqual([Decimal('0.00')], PricingRule.price_many([epoch_seconds(start)], [epoch_seconds(start)]))
+
+    def test_price_many_same_price(self):
+        PricingRule.objects.filter(id=2).update(minute_call_charge=Decimal('0.01'))
+        PricingRule.clear_schedule()
+
+        start = datetime(2017, 12, 12, 21, 57, 13, tzinfo=pytz.UTC)
+        durations = [timedelta(seconds=seconds) for seconds in (0, 59, 167, 1240, 28967, 87223, 284401, 8035200)]
+
+        periods = [
+            (start + timedelta(seconds=offset), start + timedelta(seconds=offset) + duration)
+            for offset in range(0, DAY, 1201)
+            for duration in durations
+        ]
+
+        prices = PricingRule.price_many(
+            [epoch_seconds(call_start) for call_start, _call_end in periods],
+            [epoch_seconds(call_end) for _call_start, call_end in periods],
+        )
+
+        self.assertEqual([PricingRule.price(call_start, call_end) for call_start, call_end in periods], prices)
+
+
+class PricingScheduleCacheTest(TestCase):
+    """
+    The compiled schedule should be cached, and cleared when a rule is saved or deleted.
+    """
+    fixtures = ['pricingrule.json']
+
+    def setUp(self):
+        self.start = datetime(2017, 12, 12, 12, 0, 0, tzinfo=pytz.UTC)
+        self.end = datetime(2017, 12, 12, 12, 10, 0, tzinfo=pytz.UTC)
+        PricingRule.price(self.start, self.end)
+
+    def tearDown(self):
+        # Rolling back the test changes does not send signals
+        PricingRule.clear_schedule()
+
+    def test_price_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(Decimal('1.26'), PricingRule.price(self.start, self.end))
+
+    def test_cleared_on_save(self):
+        rule = PricingRule.objects.get(id=1)
+        rule.minute_call_charge = Decimal('0.10')
+        rule.save()
+
+        self.assertEqual(Decimal('1.36'), PricingRule.price(self.start, self.end))
+
+    def test_cleared_on_delete(self):
+        PricingRule.objects.get(id=1).delete()
+
+        self.assertEqual(Decimal('0.00'), PricingRule.price(self.start, self.end))
@@ -0,0 +1,61 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.test import SimpleTestCase
+
+from calls.core.util.reorder import ReorderBuffer
+
+
+Record = namedtuple('Record', ['call_id', 'type', 'timestamp'])
+
+
+def record(call_id, type_, minute):
+    return Record(call_id, type_, datetime(2016, 2, 29, 12, minute))
+
+
+class ReorderBufferTest(SimpleTestCase):
+    """
+    The first record of each call should wait for the other one, until the watermark or the buffer is full.
+    """
+
+    def setUp(self):
+        self.buffer = ReorderBuffer(timedelta(minutes=10), max_size=3)
+
+    def test_paired(self):
+        end = record(70, 'end', 5)
+        start = record(70, 'start', 1)
+
+        self.assertEqual([], self.buffer.add(end))
+        self.assertEqual([[end, start]], self.buffer.add(start))
+        self.assertEqual(0, len(self.buffer))
+
+    def test_emitted_alone_after_watermark(self):
+        start = record(70, 'start', 1)
+        self.buffer.add(start)
+
+        self.assertEqual([], self.buffer.add(record(71, 'start', 11)))
+        self.assertEqual([[start]], self.buffer.add(record(72, 'start', 12)))
+
+    def test_least_recently_received_emitted_when_full(self):
+        records = [record(call_id, 'start', 1) for call_id in (70, 71, 72, 73)]
+
+        emitted = [group for item in records for group in self.buffer.add(item)]
+
+        self.assertEqual([[records[0]]], emitted)
+        self.assertEqual(3, len(self.buffer))
+
+    def test_duplicate(self):
+        first = record(70, 'start', 1)
+        duplicate = record(70, 'start', 2)
+
+        self.buffer.add(first)
+
+        self.assertEqual([[first]], self.buffer.add(duplicate))
+        self.assertEqual([[duplicate]], self.buffer.flush())
+
+    def test_flush(self):
+        start = record(70, 'start', 1)
+        self.buffer.add(start)
+
+        self.assertEqual([[start]], self.buffer.flush())
+        self.assertEqual(0, len(self.buffer))
@@ -0,0 +1,120 @@
+from datetime import datetime
+from io import StringIO
+from unittest import mock
+import pytz
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from calls.core.api.serializers import CallDetailBulkSerializer
+from calls.core.models.call import CallDetail
+
+
+FIELDS = ('type', 'timestamp', 'call_id', 'source', 'destination')
+
+START = {'type': 'start', 'timestamp': '2016-02-29T12:00:00Z', 'call_id': 70,
+         'source': '99988526423', 'destination': '9933468278'}
+END = {'type': 'end', 'timestamp': '2016-02-29T14:00:00Z', 'call_id': 70}
+
+
+class CallDetailBulkSerializerParseTest(TestCase):
+    """
+    CallDetailBulkSerializer.parse() should give the same call details and errors of the serializer.
+    """
+
+    records = [
+        START,
+        END,
+        dict(START, call_id='71'),
+        dict(START, call_id=0),
+        dict(START, timestamp='2016-02-29T12:00:00.25-03:00'),
+        dict(START, timestamp='2016-02-29 12:00:00'),
+        dict(START, timestamp='2016-02-29T12:00:00.1234567Z'),
+        dict(START, timestamp='2016-02-30T12:00:00Z'),
+        dict(START, timestamp='2016-02-29T12:00Z'),
+        dict(START, timestamp='2016-02-29T12:00:00+23:59'),
+        dict(START, timestamp='2016-02-29T12:00:00+24:00'),
+        dict(START, timestamp='2016-02-29T12:00:00-99:00'),
+        dict(START, timestamp=''),
+        dict(START, timestamp=None),
+        dict(START, source='999885264'),
+        dict(START, source='999885264231'),
+        dict(START, source='9998852642a'),
+        dict(START, source=' 99988526423 '),
+        dict(START, source=99988526423),
+        dict(START, source=''),
+        dict(START, source=None),
+        dict(START, destination='99988526423'),
+        dict(START, url='http://testserver/api/call-detail/1/', id=3),
+        dict(END, source=''),
+        dict(END, source=None, destination=None),
+        dict(END, source='99988526423'),
+        dict(END, destination='9933468278'),
+        dict(END, call_id=-1),
+        dict(END, call_id=2147483648),
+        dict(END, call_id='7.0'),
+        dict(END, call_id=True),
+        dict(END, call_id=70.0),
+        dict(END, type='START'),
+        {key: value for key, value in START.items() if key != 'source'},
+        {key: value for key, value in START.items() if key != 'destination'},
+        {key: value for key, value in END.items() if key != 'timestamp'},
+        {},
+        [],
+        'start',
+    ]
+
+    def assert_same(self, record):
+        call_detail, errors = CallDetailBulkSerializer.parse(record)
+
+        serializer = CallDetailBulkSerializer(data=record)
+        if serializer.is_valid():
+            expected = CallDetail(**serializer.validated_data)
+            self.assertIsNone(errors, msg=record)
+            self.assertEqual(
+                [getattr(expected, name) for name in FIELDS],
+                [getattr(call_detail, name) for name in FIELDS],
+                msg=record,
+            )
+        else:
+            self.assertIsNone(call_detail, msg=record)
+            self.assertEqual(serializer.errors, errors, msg=record)
+
+    def test_same_results_of_serializer(self):
+        for record in self.records:
+            self.assert_same(record)
+
+    @override_settings(TIME_ZONE='America/Sao_Paulo')
+    def test_same_results_of_serializer_other_time_zone(self):
+        for record in self.records:
+            self.assert_same(record)
+
+    def test_well_formed_record_without_serializer(self):
+        with mock.patch.object(CallDetailBulkSerializer, 'is_valid') as is_valid:
+            call_detail, errors = CallDetailBulkSerializer.parse(dict(START, call_id='71'))
+
+        is_valid.assert_not_called()
+        self.assertIsNone(errors)
+        self.assertEqual(71, call_detail.call_id)
+        self.assertEqual(datetime(2016, 2, 29, 12, 0, 0, tzinfo=pytz.UTC), call_detail.timestamp)
+
+    def test_record_not_changed(self):
+        record = dict(START, call_id='71')
+        CallDetailBulkSerializer.parse(record)
+
+        self.assertEqual(dict(START, call_id='71'), record)
+
+
+class BenchmarkIngestCommandTest(TestCase):
+    """
+    manage.py benchmark_ingest
+    Should report the records/s of the serializers and of the fast path
+    """
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_ingest', '--records', '10', stdout=out)
+
+        self.assertIn('CallDetailBulkSerializer.parse', out.getvalue())
+        self.assertEqual(3, out.getvalue().count('records/s'))
+        self.assertFalse(CallDetail.objects.exists())
@@ -0,0 +1,131 @@
+from itertools import islice
+
+from django.db import connection
+from django.db.models import Case, When, Value
+from django.db.models.functions import Cast
+
+
+# Maximum number of parameters of a query on SQLite before 3.32
+SQLITE_MAX_VARIABLES = 999
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable in lists with at most size items.
+    """
+    iterator = iter(iterable)
+
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_update(objs, fields, batch_size=None):
+    """
+    Update the given fields of many model instances with one UPDATE ... CASE WHEN statement per batch.
+    By default, the batch size keeps the number of query parameters under the SQLite limit (999 before 3.32):
+    two for each field of an instance (its id and the value) and its id in the WHERE clause.
+    The auto_now fields of the model are also updated, as by save().
+    """
+    objs = list(objs)
+
+    if not objs:
+        return
+
+    model = type(objs[0])
+    fields = [model._meta.get_field(name) for name in fields]
+
+    for field in auto_now_fields(model):
+        if field not in fields:
+            fields.append(field)
+        for obj in objs:
+            field.pre_save(obj, add=False)
+
+    if batch_size is None:
+        batch_size = max(1, SQLITE_MAX_VARIABLES // (2 * len(fields) + 1))
+
+    for batch in chunked(objs, batch_size):
+        updates = {}
+        for field in fields:
+            whens = [
+                When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field))
+                for obj in batch
+            ]
+            case = Case(*whens, output_field=field)
+            # PostgreSQL types the CASE from the parameters of its values, sent as text
+            updates[field.attname] = Cast(case, output_field=field) if connection.vendor == 'postgresql' else case
+
+        model.objects.filter(pk__in=[obj.pk for obj in batch]).update(**updates)
+
+
+def delete_rows(model, values, column='id', batch_size=500):
+    """
+    Delete the rows of a model with the given values of a column (by default, the ids) with plain DELETE
+    statements, without loading them, sending signals or cascading. The batch size keeps the number of query
+    parameters under the SQLite limit. Return the number of rows deleted.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(column)
+    deleted = 0
+
+    with connection.cursor() as cursor:
+        for batch in chunked(values, batch_size):
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(batch))})', batch)
+            deleted += cursor.rowcount
+
+    return deleted
+
+
+def auto_now_fields(model):
+    """
+    Return the fields of a model set to the current time on every save (auto_now)
+    """
+    return [field for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+
+
+def supports_upsert():
+    """
+    Return True if the database supports INSERT ... ON CONFLICT DO UPDATE ... RETURNING (PostgreSQL,
+    SQLite 3.35+). SQLite has ON CONFLICT DO UPDATE since 3.24, but RETURNING only since 3.35, and the call
+    upsert reads the ids of the records of the call back from it.
+    """
+    return connection.vendor == 'postgresql' \
+        or (connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35, 0))
+
+
+def upsert(obj, update_fields, returning=()):
+    """
+    Insert a model instance with all its fields or, if its primary key exists, update just the given fields
+    and the auto_now fields, in one INSERT ... ON CONFLICT DO UPDATE statement.
+    Return the values of the returning fields in the row as inserted or updated, as given by the database.
+    """
+    meta = obj._meta
+    quote = connection.ops.quote_name
+
+    for field in auto_now_fields(type(obj)):
+        field.pre_save(obj, add=False)
+        if field.name not in update_fields:
+            update_fields = [*update_fields, field.name]
+
+    fields = meta.concrete_fields
+    columns = ', '.join(quote(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    updates = ', '.join(
+        f'{quote(field.column)} = EXCLUDED.{quote(field.column)}'
+        for field in (meta.get_field(name) for name in update_fields)
+    )
+
+    sql = f'INSERT INTO {quote(meta.db_table)} ({columns}) VALUES ({placeholders}) ' \
+          f'ON CONFLICT ({quote(meta.pk.column)}) DO UPDATE SET {updates}'
+    params = [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+
+    if returning:
+        sql += ' RETURNING ' + ', '.join(quote(meta.get_field(name).column) for name in returning)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+        if returning:
+            return cursor.fetchone()
@@ -7,7 +7,13 @@ def time_between(timestamp_start, timestamp_end):
     """
     Return delta time between two timestamps as a dict with hours, minutes and seconds.
     """
-    delta = timestamp_end - timestamp_start
+    return format_duration(timestamp_end - timestamp_start)
+
+
+def format_duration(delta):
+    """
+    Return a timedelta as a string with hours, minutes and seconds (e.g. 24h20m40s).
+    """
     hours, remainder = divmod(delta.seconds, 3600)
     minutes, seconds = divmod(remainder, 60)
     hours += delta.days * 24
@@ -44,6 +50,13 @@ def last_month_year():
     return datetime(last_month.year, last_month.month, 1)
 
 
+def billing_period(date):
+    """
+    Return the period of a date or datetime as an integer in YYYYMM format.
+    """
+    return date.year * 100 + date.month
+
+
 def valid_phone_number(phone_number):
     """
     Return True if telephone has a valid format.
@@ -52,3 +65,10 @@ def valid_phone_number(phone_number):
     pattern = re.compile(r'^\d{10,11}$')
 
     return pattern.match(phone_number)
+
+
+def is_true(value):
+    """
+    Return True if a query parameter or a field is set to true (true or 1).
+    """
+    return str(value).lower() in ('true', '1')
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+
+class ReorderBuffer:
+    """
+    Holds the first record received of each call until the other one arrives, so both are paired in one write.
+
+    Records are emitted in groups: the start and end records of a call together, or a record alone when its
+    call is not completed in time. A record waits until the watermark (the latest timestamp received minus
+    the window) passes its timestamp. At most max_size records wait: the least recently received are emitted
+    first when it is full.
+    """
+
+    def __init__(self, window, max_size):
+        self.window = window
+        self.max_size = max_size
+        self.pending = OrderedDict()
+        self.watermark = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, record):
+        waiting = self.pending.get(record.call_id)
+        return waiting is not None and waiting.id == record.id
+
+    def add(self, record):
+        """
+        Adds a record (with id, call_id, type and timestamp). Returns the groups of records emitted.
+        """
+        emitted = []
+        waiting = self.pending.pop(record.call_id, None)
+
+        if waiting is not None and waiting.type != record.type:
+            emitted.append([waiting, record])
+        else:
+            if waiting is not None:
+                # A duplicate: the first one is emitted, so the second one is rejected when paired
+                emitted.append([waiting])
+            self.pending[record.call_id] = record
+
+        latest = record.timestamp - self.window
+        if self.watermark is None or latest > self.watermark:
+            self.watermark = latest
+
+        # Oldest received first: the records of the switches arrive roughly in timestamp order
+        while self.pending:
+            oldest = next(iter(self.pending.values()))
+            if oldest.timestamp >= self.watermark and len(self.pending) <= self.max_size:
+                break
+            emitted.append([self.pending.popitem(last=False)[1]])
+
+        return emitted
+
+    def flush(self):
+        """
+        Emits all the waiting records
+        """
+        emitted = [[record] for record in self.pending.values()]
+        self.pending.clear()
+        return emitted
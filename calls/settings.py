@@ -199,19 +199,121 @@ LIMIT_STORAGE_SIZE = 1073741824
 
 # DRF
 
+# Render and parse the JSON of the API with orjson (calls.core.api.renderers.ORJSONRenderer and
+# calls.core.api.parsers.ORJSONParser) instead of the json module. Viewsets can also set them in their
+# renderer_classes and parser_classes.
+API_FAST_JSON = config('API_FAST_JSON', default=False, cast=bool)
+
 REST_FRAMEWORK = {
     'NON_FIELD_ERRORS_KEY': 'validation_error',
     'EXCEPTION_HANDLER': 'calls.core.util.drf.exception_handler',
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'calls.core.api.renderers.ORJSONRenderer' if API_FAST_JSON else 'rest_framework.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
+    'DEFAULT_PARSER_CLASSES': (
+        'calls.core.api.parsers.ORJSONParser' if API_FAST_JSON else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.DjangoFilterBackend',)
 }
 
+# Call detail records saved per chunk by the bulk ingestion of NDJSON bodies
+CALL_DETAIL_BULK_CHUNK_SIZE = config('CALL_DETAIL_BULK_CHUNK_SIZE', default=1000, cast=int)
+
+# Pair and price the call detail records in run_pricing_worker processes instead of in the requests,
+# which only validate and queue them (202 Accepted)
+CALL_PAIRING_ASYNC = config('CALL_PAIRING_ASYNC', default=False, cast=bool)
+CALL_PAIRING_WORKER_BATCH_SIZE = config('CALL_PAIRING_WORKER_BATCH_SIZE', default=1000, cast=int)
+
+# Seconds of call detail timestamps a record waits in the memory of the worker for the other record of its call,
+# so the call is written once, and the maximum records waiting. 0: records are paired as soon as read.
+CALL_PAIRING_REORDER_WINDOW = config('CALL_PAIRING_REORDER_WINDOW', default=0, cast=int)
+CALL_PAIRING_REORDER_BUFFER_SIZE = config('CALL_PAIRING_REORDER_BUFFER_SIZE', default=100000, cast=int)
+# Seconds between the reads of the queue from the start with a reorder window, for the records with lower ids
+# committed after the ones read
+CALL_PAIRING_RESCAN_INTERVAL = config('CALL_PAIRING_RESCAN_INTERVAL', default=10, cast=float)
+
+# Seconds the responses of the requests with an Idempotency-Key header are kept, to be returned to retries
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60, cast=int)
+
+# Attempts to save a batch of call detail records when concurrent requests save records of the same calls
+CALL_PAIRING_ATTEMPTS = config('CALL_PAIRING_ATTEMPTS', default=3, cast=int)
+
+# Seconds a process keeps its compiled pricing rules. Changes made by other processes are seen after it.
+PRICING_SCHEDULE_TTL = config('PRICING_SCHEDULE_TTL', default=60, cast=int)
+
+# Partition the calls table by billing period on PostgreSQL 11+ (calls.core.partitions). Set it before running
+# the migrations. The partition_calls command creates the partitions of the next CALL_PARTITIONS_AHEAD periods.
+CALL_PARTITIONING = config('CALL_PARTITIONING', default=False, cast=bool)
+CALL_PARTITIONS_AHEAD = config('CALL_PARTITIONS_AHEAD', default=3, cast=int)
+
+# Private storage where archive_calls writes the calls of archived periods, never the public media storage: a
+# directory of the server (relative to BASE_DIR), or a prefix of the S3 bucket with USE_S3, with private objects
+# and signed URLs
+CALL_ARCHIVE_LOCATION = config('CALL_ARCHIVE_LOCATION', default='archive')
+
+if USE_S3:
+    CALL_ARCHIVE_STORAGE = {
+        'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage',
+        'OPTIONS': {
+            'location': CALL_ARCHIVE_LOCATION,
+            'default_acl': 'private',
+            'querystring_auth': True,
+            # URLs of the custom domain are not signed
+            'custom_domain': None,
+        },
+    }
+else:
+    CALL_ARCHIVE_STORAGE = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': os.path.join(BASE_DIR, CALL_ARCHIVE_LOCATION),
+            'file_permissions_mode': 0o600,
+            'directory_permissions_mode': 0o700,
+        },
+    }
+
+# Records per page of the call and call detail lists. Clients can ask up to API_MAX_PAGE_SIZE with ?page_size=
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=100, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=1000, cast=int)
+
+# Objects read from the database and rendered per chunk by the streamed lists and bills (?stream=true)
+API_STREAM_CHUNK_SIZE = config('API_STREAM_CHUNK_SIZE', default=1000, cast=int)
+
+# Maximum subscribers of a request for the bills of many subscribers (/api/bill/batch/)
+BILL_BATCH_MAX_SUBSCRIBERS = config('BILL_BATCH_MAX_SUBSCRIBERS', default=1000, cast=int)
+
+# Seconds clients can use a bill of a closed period before revalidating it with its ETag. Shared caches (reverse
+# proxies, CDNs) revalidate it on every request.
+BILL_CACHE_MAX_AGE = config('BILL_CACHE_MAX_AGE', default=60, cast=int)
+
+# Cache of the bill (/api/bill/) and call (/api/call/<id>/) responses, invalidated by the changes of their calls
+# and of the pricing rules (calls.core.response_cache). The invalidations must reach all the processes serving the
+# API, from all the processes writing the calls and the rules (web workers, run_pricing_worker, the management
+# commands), so the backend must be shared by them, e.g. a Redis backend or
+# django.core.cache.backends.db.DatabaseCache (a process-local backend fails the system checks, calls.core.checks).
+# Disabled by default (django.core.cache.backends.dummy.DummyCache).
+RESPONSE_CACHE_ALIAS = 'responses'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RESPONSE_CACHE_ALIAS: {
+        'BACKEND': config('RESPONSE_CACHE_BACKEND', default='django.core.cache.backends.dummy.DummyCache'),
+        'LOCATION': config('RESPONSE_CACHE_LOCATION', default='responses'),
+        'TIMEOUT': config('RESPONSE_CACHE_TIMEOUT', default=600, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('RESPONSE_CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+}
+
 # Simple JWT
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),